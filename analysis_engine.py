@@ -0,0 +1,405 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from text_normalizer import count_tokens, normalize_text
+
+ANALYSIS_TEMPLATE = """
+        You are an advanced AI model designed to analyze the compatibility between a CV and a job description and provide suggestions to assist human HR professionals in making shortlisting decisions.
+
+        CV:
+        {resume}
+
+        Job Description:
+        {job_description}
+
+        Analyze the CV against the job description and provide output in the following JSON format:
+
+        {{
+            "candidate_name": "Extracted name of the candidate from the CV",
+            "contact_information": "Extracted email and phone number",
+            "matching_skills": "List of skills matching the job description",
+            "missing_skills": "List of important skills missing from the CV",
+            "work_experience": "Total years of relevant experience and key responsibilities that align with the job description",
+            "education": "Highest degree attained and key certifications",
+            "soft_skills": "List of relevant soft skills extracted or inferred from the CV (e.g., communication, leadership, teamwork)",
+            "training_experience": "Information on any training, mentoring, or knowledge-sharing roles the candidate has undertaken",
+            "adaptability": "Assessment of the candidate's potential to quickly learn missing skills based on certifications, past experiences, and technical background",
+            "scoring_details": {{
+                "technical_skills": "Score out of 40, based on the percentage of required technical skills present. For skills that are missing but are easy to learn, apply a reduced penalty.",
+                "work_experience": "Score out of 25, reflecting the relevance and depth of the candidate's experience.",
+                "education_certifications": "Score out of 15, based on academic qualifications and industry certifications.",
+                "soft_skills_training": "Score out of 10, based on evidence of communication, teamwork, and training or mentoring abilities.",
+                "adaptability": "Score out of 10, based on the candidate's potential to acquire missing skills efficiently."
+            }},
+            "score": "Total numerical compatibility score (0-100), computed as the sum of the above categories, with adjustments to reflect that some missing skills are considered trainable. Apply a penalty only if a MUST-HAVE skill is missing and not easily learnable.",
+            "recommendation": {{
+                "pros": "Highlight reasons why the candidate is a strong match for the role, including technical strengths, relevant experience, certifications, and soft skills.",
+                "cons": "Detail any gaps or concerns, noting if any missing skills are critical versus those that can be quickly learned.",
+                "final_suggestion": "Provide a balanced recommendation for HR on whether to shortlist the candidate, along with suggestions for potential areas of on-the-job training or development. Emphasize that the final decision is advisory and meant to assist in the human evaluation process."
+            }}
+        }}
+
+        Additional Instructions:
+
+        1. Technical Skills Evaluation (40%):
+           - Identify all required technical skills from the job description.
+           - Award proportionate points based on the number of skills present. For any missing MUST-HAVE skill, assess if it is easy to learn (e.g., Python scripting if the candidate demonstrates strong Bash experience). If easily trainable, apply a reduced penalty; otherwise, apply a standard penalty.
+
+        2. Work Experience (25%):
+           - Evaluate the total years of relevant experience and the direct applicability of key responsibilities to the job description.
+           - Award higher scores when experience is directly aligned with the role's duties.
+
+        3. Education and Certifications (15%):
+           - Consider the highest degree and relevant certifications. Award full points when all critical certifications are present; otherwise, score proportionately.
+
+        4. Soft Skills and Training Experience (10%):
+           - Extract or infer soft skills such as communication, leadership, teamwork, and any training/mentoring experience.
+           - If soft skills are absent, reduce the score accordingly, but note their presence in the recommendation.
+
+        5. Adaptability (10%):
+           - Assess the candidate's ability to quickly learn missing skills based on their technical background and certifications.
+           - Emphasize that candidates with strong foundational expertise might overcome gaps in certain non-critical skills.
+
+        6. Scoring Flexibility:
+           - Compute the total score out of 100 using the weights provided.
+           - Ensure that missing skills are penalized appropriately but allow for the possibility that some gaps are easily trainable.
+           - The final score is advisory and intended to support HR professionals rather than to automatically shortlist or reject candidates.
+
+        7. Recommendation Output:
+           - Provide a balanced summary with clear pros and cons.
+           - Include suggestions on how trainable gaps can be addressed during onboarding or through further development.
+
+        Be thorough in your analysis, ensuring the evaluation mirrors a human HR professional's rigour while recognizing that some missing skills do not necessarily disqualify a candidate. Your output should assist HR in making an informed, balanced decision.
+        """
+
+
+# Same prompt for a JD already compiled by jd_requirements: the skills are listed, so the
+# model scores against them instead of re-deriving them from the full JD text
+COMPILED_JD_TEMPLATE = ANALYSIS_TEMPLATE.replace(
+    "- Identify all required technical skills from the job description.",
+    "- Treat must_have_skills in the job requirements as required and nice_to_have_skills as optional.",
+).replace("the job description", "the job requirements").replace(
+    "Job Description:\n        {job_description}",
+    "Job Requirements (compiled from the job description):\n        {job_description}",
+)
+
+
+def build_analysis_prompt(resume_text, jd_text, template=ANALYSIS_TEMPLATE):
+    """Render the scoring prompt for a resume/JD pair"""
+    # Same f-string semantics as PromptTemplate.format, without importing LangChain
+    # so the engine also runs against the stub backend
+    return template.format(resume=resume_text, job_description=jd_text)
+
+
+def calculate_matching_score(resume_text, jd_text, llm):
+    """Run the scoring prompt once on the given LLM and return the raw response"""
+    return llm.invoke(build_analysis_prompt(resume_text, jd_text))
+
+
+def parse_analysis_content(content):
+    """Extract the JSON object from an LLM response; raises ValueError if there is none"""
+    start_idx = content.find('{')
+    end_idx = content.rfind('}') + 1
+    if start_idx == -1 or end_idx <= start_idx:
+        raise ValueError("Could not extract JSON from response")
+    return json.loads(content[start_idx:end_idx])
+
+
+def format_analysis_output(analysis_result):
+    """Format the analysis result for JSON output and extract the score"""
+    try:
+        result = parse_analysis_content(analysis_result.content)
+
+        # Extract the score
+        score = result.get("score", "N/A")
+
+        # Return the JSON string and the score
+        return json.dumps(result, indent=4), score
+    except Exception as e:
+        return f"Error formatting output: {str(e)}\nRaw output: {analysis_result}", "N/A"
+
+
+# ---------------------------------------------------------------------------
+# LLM backends
+# ---------------------------------------------------------------------------
+
+def create_openai_llm(api_key, model="gpt-4o", **kwargs):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, openai_api_key=api_key, model=model, **kwargs)
+
+
+def create_groq_llm(api_key, model="llama-3.1-70b-versatile", **kwargs):
+    from langchain_groq import ChatGroq
+    return ChatGroq(temperature=0, groq_api_key=api_key, model_name=model, **kwargs)
+
+
+class StubMessage:
+    """Minimal stand-in for a LangChain AIMessage"""
+
+    def __init__(self, content, response_metadata=None):
+        self.content = content
+        self.response_metadata = response_metadata or {}
+
+    def __str__(self):
+        return self.content
+
+
+class StubLLM:
+    """
+    Offline LLM for tests and benchmarks. Returns a canned response (or the result
+    of `respond(prompt)`) after an optional fixed delay.
+    """
+
+    def __init__(self, response=None, respond=None, delay=0.0, model="stub"):
+        self.response = response if response is not None else json.dumps({"score": 0})
+        self.respond = respond
+        self.delay = delay
+        self.model_name = model
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _content(self, prompt):
+        with self._lock:
+            self.calls += 1
+        return self.respond(prompt) if self.respond else self.response
+
+    def invoke(self, prompt, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return StubMessage(self._content(prompt))
+
+    async def ainvoke(self, prompt, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return StubMessage(self._content(prompt))
+
+    async def astream(self, prompt, **kwargs):
+        """Yield the response word by word; the first word arrives after a fifth of `delay`"""
+        words = self._content(prompt).split(" ")
+        if self.delay:
+            await asyncio.sleep(self.delay / 5)
+        for i, word in enumerate(words):
+            if i and self.delay:
+                await asyncio.sleep(self.delay * 4 / 5 / max(len(words) - 1, 1))
+            yield StubMessage(word if i == 0 else " " + word)
+
+
+def create_stub_llm(api_key=None, **kwargs):
+    # STUB_LLM_DELAY_MS gives the stub backend a realistic call latency for load tests
+    kwargs.setdefault("delay", float(os.environ.get("STUB_LLM_DELAY_MS", "0")) / 1000)
+    return StubLLM(**kwargs)
+
+
+BACKENDS = {
+    "openai": create_openai_llm,
+    "groq": create_groq_llm,
+    "stub": create_stub_llm,
+}
+
+
+def create_llm(backend="openai", api_key=None, **kwargs):
+    """Build a chat model for one of the registered BACKENDS"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{backend}'. Available: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](api_key=api_key, **kwargs)
+
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache; any object with get/set can replace it"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class AnalysisEngine:
+    """
+    Single entry point for resume/JD scoring, shared by the Flask API, the CLI
+    scripts and the Streamlit app.
+
+    `cache` is any object with get(key)/set(key, value); results are keyed on the
+    model name and the rendered prompt. `hooks` are callables invoked as
+    hook(event, **info) for the events "prompt_built", "cache_hit", "llm_start",
+    "llm_end", "llm_error" and "parsed", which is how instrumentation attaches
+    without touching callers.
+
+    With `normalize` set, resume and JD text go through text_normalizer before
+    prompting, and "prompt_built" reports the tokens that saved.
+    """
+
+    def __init__(self, llm, cache=None, hooks=None, max_workers=4, normalize=True):
+        self.llm = llm
+        self.cache = cache
+        self.hooks = list(hooks or [])
+        self.max_workers = max_workers
+        self.normalize = normalize
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _emit(self, event, **info):
+        for hook in self.hooks:
+            hook(event, **info)
+
+    def cache_key(self, prompt):
+        return hashlib.sha256(f"{model_name(self.llm)}\n{prompt}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def cached(self, key):
+        """Cached value for `key` (see cache_key), or None; reports a "cache_hit" to the hooks"""
+        if self.cache is None:
+            return None
+        result = self.cache.get(key)
+        if result is not None:
+            self._emit("cache_hit", key=key)
+        return result
+
+    def remember(self, key, value):
+        """Cache `value` under `key`, for callers that parse their own responses"""
+        if self.cache is not None:
+            self.cache.set(key, value)
+
+    def _store(self, key, result):
+        if "error" not in result["analysis_json"]:
+            self.remember(key, result)
+
+    @staticmethod
+    def format_result(response):
+        """Turn a raw LLM response into {"analysis_json": dict, "matching_score": score}"""
+        try:
+            analysis_json = parse_analysis_content(response.content)
+        except Exception as e:
+            return {"analysis_json": {"error": f"Error formatting output: {str(e)}"}, "matching_score": "N/A"}
+        return {"analysis_json": analysis_json, "matching_score": analysis_json.get("score", "N/A")}
+
+    def build_prompt(self, resume_text, jd_text, template=ANALYSIS_TEMPLATE):
+        started = time.perf_counter()
+        tokens_saved = 0
+        if self.normalize:
+            raw_tokens = count_tokens(resume_text) + count_tokens(jd_text)
+            resume_text = normalize_text(resume_text)
+            jd_text = normalize_text(jd_text)
+            tokens_saved = raw_tokens - count_tokens(resume_text) - count_tokens(jd_text)
+        prompt = build_analysis_prompt(resume_text, jd_text, template)
+        self._emit("prompt_built", duration=time.perf_counter() - started, tokens_saved=tokens_saved)
+        return prompt
+
+    def parse(self, response, key=None):
+        started = time.perf_counter()
+        result = self.format_result(response)
+        self._emit("parsed", key=key, duration=time.perf_counter() - started)
+        return result
+
+    def invoke(self, prompt, key=None):
+        """Call the LLM once with hooks around it and return the raw response"""
+        key = key or self.cache_key(prompt)
+        self._emit("llm_start", key=key, prompt=prompt, model=model_name(self.llm))
+        started = time.perf_counter()
+        try:
+            response = self.llm.invoke(prompt)
+        except Exception as e:
+            self._emit("llm_error", key=key, error=e, duration=time.perf_counter() - started, model=model_name(self.llm))
+            raise
+        self._emit("llm_end", key=key, response=response, duration=time.perf_counter() - started, model=model_name(self.llm))
+        return response
+
+    async def ainvoke(self, prompt, key=None):
+        """Async variant of invoke; uses the model's ainvoke when it has one"""
+        key = key or self.cache_key(prompt)
+        self._emit("llm_start", key=key, prompt=prompt, model=model_name(self.llm))
+        started = time.perf_counter()
+        try:
+            if hasattr(self.llm, "ainvoke"):
+                response = await self.llm.ainvoke(prompt)
+            else:
+                # The executor thread runs in the caller's context, so cost and scheduling labels follow the call
+                context = contextvars.copy_context()
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: context.run(self.llm.invoke, prompt))
+        except Exception as e:
+            self._emit("llm_error", key=key, error=e, duration=time.perf_counter() - started, model=model_name(self.llm))
+            raise
+        self._emit("llm_end", key=key, response=response, duration=time.perf_counter() - started, model=model_name(self.llm))
+        return response
+
+    def analyze(self, resume_text, jd_text, template=ANALYSIS_TEMPLATE):
+        """Score one resume against one JD (or, with COMPILED_JD_TEMPLATE, against compiled JD requirements)"""
+        prompt = self.build_prompt(resume_text, jd_text, template)
+        key = self.cache_key(prompt)
+        cached = self.cached(key)
+        if cached is not None:
+            return cached
+        result = self.parse(self.invoke(prompt, key), key)
+        self._store(key, result)
+        return result
+
+    async def aanalyze(self, resume_text, jd_text, template=ANALYSIS_TEMPLATE):
+        """Async variant of analyze"""
+        prompt = self.build_prompt(resume_text, jd_text, template)
+        key = self.cache_key(prompt)
+        cached = self.cached(key)
+        if cached is not None:
+            return cached
+        result = self.parse(await self.ainvoke(prompt, key), key)
+        self._store(key, result)
+        return result
+
+    def analyze_batch(self, pairs, max_workers=None):
+        """
+        Score many (resume_text, jd_text) pairs concurrently. Results come back in
+        input order; a failed pair yields {"analysis_json": {"error": ...}} instead
+        of aborting the batch.
+        """
+        def run(pair):
+            try:
+                return self.analyze(*pair)
+            except Exception as e:
+                return {"analysis_json": {"error": str(e)}, "matching_score": "N/A"}
+
+        # Each pair runs in a copy of the caller's context, so context-scoped labels follow the calls
+        pairs = list(pairs)
+        contexts = [contextvars.copy_context() for _ in pairs]
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            return list(executor.map(lambda context, pair: context.run(run, pair), contexts, pairs))
+
+    async def aanalyze_batch(self, pairs, concurrency=None):
+        """Async batch scoring with at most `concurrency` calls in flight"""
+        semaphore = asyncio.Semaphore(concurrency or self.max_workers)
+
+        async def run(pair):
+            async with semaphore:
+                try:
+                    return await self.aanalyze(*pair)
+                except Exception as e:
+                    return {"analysis_json": {"error": str(e)}, "matching_score": "N/A"}
+
+        return await asyncio.gather(*(run(pair) for pair in pairs))
@@ -1,28 +1,236 @@
-from flask import Flask, request, jsonify
-from main import calculate_matching_score, format_analysis_output
-from pdf_processor import extract_text_from_pdf
-from text_splitter import split_text
-from dotenv import load_dotenv
-import os
-from pdf_processor import extract_text_from_pdf
+from flask import Flask, Request, request, jsonify, Response, g
+from analysis_engine import AnalysisEngine, MemoryCache, ANALYSIS_TEMPLATE, COMPILED_JD_TEMPLATE
+from resilient_llm import create_resilient_llm
+from jd_requirements import JDCompiler, render_requirements
+from pdf_processor import extract_text_from_pdf, PDFLimitError
 from text_splitter import split_text
 from document_search import generate_embeddings
-from conversation_chain import ConversationChain
-import os
 from dotenv import load_dotenv
-from pinecone import Pinecone
-from langchain_ollama import OllamaEmbeddings  # Correct embedding model
-from langchain_openai import ChatOpenAI  # Updated import path
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_pinecone import PineconeVectorStore
-import json
+import os
 from flask_cors import CORS
 import tempfile
+from resume_dedup import NearDuplicateIndex, content_hash
+from candidate_profiles import CandidateProfileStore, compact_profile
+from shared_embeddings import EmbeddingMatrix
+from comparative_scoring import ListwiseScorer, RankingError
+from traffic_replay import RequestRecorder
+from cost_ledger import ROLLUPS, attribute, get_ledger, reset_attribution, set_attribution
+from llm_scheduler import BATCH, INTERACTIVE, FairScheduler, QueueFullError, reset_schedule, set_schedule
+import math
+import time
+import metrics
+import profiler
+import uuid
+
+# Upload limits
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_KB", "1024")) * 1024  # kept in RAM below this size
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "10")) * 1024 * 1024  # per file
+MAX_PDF_PAGES = int(os.environ.get("MAX_PDF_PAGES", "50"))
+MAX_EXTRACT_CHARS = int(os.environ.get("MAX_EXTRACT_CHARS", "100000"))  # stop reading pages after this much text
+RANK_MAX_RESUMES = int(os.environ.get("RANK_MAX_RESUMES", "50"))  # resumes per /rank request
+RANK_MAX_UPLOAD_BYTES = int(os.environ.get("RANK_MAX_UPLOAD_MB", "100")) * 1024 * 1024  # whole /rank request body
+MULTIPART_OVERHEAD = 64 * 1024
+# Largest request body per endpoint; larger ones are rejected with 413 before they are read
+BODY_LIMITS = {
+    "/analyze": 2 * MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,  # one resume and one JD
+    "/rank": RANK_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+}
+
+# "openai" in production; "stub" runs the API offline for load tests and benchmarks
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+
+class SpooledRequest(Request):
+    """Stream multipart file parts into SpooledTemporaryFiles that spill to disk past UPLOAD_SPOOL_BYTES"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
+# Upper bound for bodies without a Content-Length; limit_request_body applies each endpoint's own limit
+app.config["MAX_CONTENT_LENGTH"] = max(BODY_LIMITS.values())
 CORS(app)  # Enable CORS for all routes
 
+# Near-duplicate index of analyzed resumes; one payload per (resume, JD content hash) holds the analysis,
+# reused only for the identical resume
+resume_index = NearDuplicateIndex(path=os.environ.get("DEDUP_INDEX_PATH", "resume_dedup.db"))
+
+# Structured candidate profiles keyed by resume content hash; chunks are embedded only when PROFILE_EMBEDDINGS is set.
+# Compact profiles drop resume text past an excerpt and rely on the ATS extractor's fields, so they
+# stay off unless a trained extractor (ats_model.json) is deployed
+COMPACT_PROFILE_PROMPTS = os.environ.get("COMPACT_PROFILE_PROMPTS", "0").lower() in ("1", "true", "yes")
+PROFILE_EMBEDDINGS = os.environ.get("PROFILE_EMBEDDINGS", "").lower() in ("1", "true", "yes")
+candidate_profiles = CandidateProfileStore(
+    chunker=split_text,
+    embed=generate_embeddings if PROFILE_EMBEDDINGS else None,
+    # Chunk embeddings also go to a memory-mapped matrix that all gunicorn workers share
+    embeddings=EmbeddingMatrix() if PROFILE_EMBEDDINGS else None
+)
+
+# Shared LLM capacity: interactive requests go first, recruiters share it by weight, and
+# requests beyond the admission limits (sized from the worker's threads) get 429 with Retry-After
+llm_scheduler = FairScheduler()
+
+# One analysis engine (and warm LLM client) per API key, reused across requests
+engines = {}
+
+def get_engine(openai_api_key):
+    if openai_api_key not in engines:
+        # Timeouts from observed latency, hedged retries, fallback model and a circuit breaker per provider;
+        # every attempt's tokens and cost go to the ledger, and each attempt (hedges and fallback
+        # included) holds its own scheduler slot, so the provider sees at most the scheduler's capacity
+        llm = create_resilient_llm(LLM_BACKEND, api_key=openai_api_key, ledger=get_ledger(), scheduler=llm_scheduler)
+        engines[openai_api_key] = AnalysisEngine(llm, cache=MemoryCache(), hooks=[metrics.engine_hook])
+    return engines[openai_api_key]
+
+# JDs are compiled once into cached requirements and candidates are scored against those
+COMPILE_JD = os.environ.get("COMPILE_JD", "1").lower() in ("1", "true", "yes")
+jd_compilers = {}
+
+def get_jd_compiler(openai_api_key):
+    if openai_api_key not in jd_compilers:
+        jd_compilers[openai_api_key] = JDCompiler(llm=get_engine(openai_api_key).llm)
+    return jd_compilers[openai_api_key]
+
+# Anonymized request log (upload hashes and sizes, no content) for replay with traffic_replay.py
+request_recorder = RequestRecorder() if os.environ.get("RECORD_REQUESTS", "").lower() in ("1", "true", "yes") else None
+
+def warm_up():
+    """
+    Build the shared, read-only state for the configured API key (LLM clients, analysis
+    engine, JD compiler) up front. gunicorn.conf.py calls this in the master before
+    forking, so workers share it copy-on-write instead of each building its own.
+    """
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if openai_api_key or LLM_BACKEND == "stub":
+        get_engine(openai_api_key)
+        if COMPILE_JD:
+            get_jd_compiler(openai_api_key)
+
+# Send the per-stage breakdown in an X-Timing header on every response, not only when asked
+ALWAYS_SEND_TIMING = os.environ.get("TIMING_HEADER", "").lower() in ("1", "true", "yes")
+
+@app.before_request
+def start_request_trace():
+    metrics.start_trace(request.path)
+    g.request_id = (request.headers.get("X-Request-ID") or uuid.uuid4().hex)[:128]
+    # LLM calls made for this request are attributed to it in the cost ledger
+    g.cost_attribution = set_attribution(operation=request.path.strip("/") or None, request_id=g.request_id)
+    g.schedule = set_schedule(*request_schedule())
+    # Sampled requests (PROFILE_SAMPLE_RATE) get a stack profile, and with PROFILE_ON_DEMAND so do
+    # requests with an X-Profile header (carrying PROFILE_SECRET when one is set)
+    g.profiler = profiler.start_profile(force=profiler.on_demand(request.headers.get("X-Profile")))
+    if g.profiler is not None:
+        g.profile_id = profiler.profile_id(g.request_id)
+
+@app.before_request
+def limit_request_body():
+    """Reject a body above its endpoint's BODY_LIMITS entry from its Content-Length, before reading it"""
+    limit = BODY_LIMITS.get(request.path)
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify({"error": body_limit_message()}), 413
+
+@app.after_request
+def finish_request_trace(response):
+    trace = metrics.end_trace()
+    if trace is not None:
+        duration = time.perf_counter() - trace.started
+        metrics.REQUEST_SECONDS.observe(
+            duration,
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code
+        )
+        if ALWAYS_SEND_TIMING or request.headers.get("X-Timing"):
+            response.headers["X-Timing"] = trace.timing_header()
+        if request_recorder is not None:
+            request_recorder.record(request, response.status_code, duration, trace.spans)
+    response.headers["X-Request-ID"] = g.request_id
+    if g.get("profiler") is not None:
+        response.headers["X-Profile-ID"] = g.profile_id
+    return response
+
+@app.teardown_request
+def write_request_profile(exc):
+    token = g.pop("cost_attribution", None)
+    if token is not None:
+        reset_attribution(token)
+    token = g.pop("schedule", None)
+    if token is not None:
+        reset_schedule(token)
+    admission = g.pop("admission", None)
+    if admission is not None:
+        llm_scheduler.finish(*admission)
+    sampler = g.pop("profiler", None)
+    if sampler is not None:
+        profiler.finish_profile(g.profile_id, sampler)
+
+def request_schedule():
+    """
+    (tenant, priority) for the LLM scheduler: the recruiter from X-Recruiter-ID, else the
+    client address; /rank and "X-Priority: batch" requests are batch, the rest interactive
+    """
+    tenant = request.headers.get("X-Recruiter-ID") or request.remote_addr or "anonymous"
+    batch = request.path == "/rank" or request.headers.get("X-Priority", "").lower() == BATCH
+    return tenant, BATCH if batch else INTERACTIVE
+
+def admit_request():
+    """
+    None if the LLM queues have room for this request, which is then counted in until the
+    request ends, else a 429 response with Retry-After
+    """
+    schedule = request_schedule()
+    try:
+        llm_scheduler.admit(*schedule)
+        g.admission = schedule
+    except QueueFullError as e:
+        response = jsonify({"error": str(e), "retry_after": round(e.retry_after, 1)})
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return response, 429
+    return None
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/costs', methods=['GET'])
+def llm_costs():
+    """LLM calls, tokens and cost from the ledger, grouped by ?by=model|jd|api_key|operation|outcome, over ?hours="""
+    by = request.args.get("by", "model")
+    if by not in ROLLUPS:
+        return jsonify({"error": f"'by' must be one of {', '.join(ROLLUPS)}"}), 400
+    try:
+        hours = float(request.args["hours"]) if "hours" in request.args else None
+    except ValueError:
+        return jsonify({"error": "'hours' must be a number"}), 400
+    since = time.time() - hours * 3600 if hours else None
+    return jsonify({"by": by, "hours": hours, "rollup": get_ledger().rollup(by, since)})
+
+def check_upload(upload):
+    """Return (error message, status code) if an uploaded file is too large or not a PDF, else None"""
+    stream = upload.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > MAX_UPLOAD_BYTES:
+        return f"{upload.filename or upload.name} is {size // 1024} KB; the limit is {MAX_UPLOAD_BYTES // 1024} KB", 413
+    if stream.read(5) != b"%PDF-":
+        stream.seek(0)
+        return f"{upload.filename or upload.name} is not a PDF file", 415
+    stream.seek(0)
+    return None
+
+def body_limit_message():
+    if request.path == "/rank":
+        return (f"Upload too large; a ranking request may be at most {RANK_MAX_UPLOAD_BYTES // (1024 * 1024)} MB "
+                f"in total, with each file at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    return f"Upload too large; each file may be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": body_limit_message()}), 413
+
 # Health check endpoint
 @app.route('/', methods=['GET'])
 def health_check():
@@ -35,58 +243,161 @@ def analyze():
         load_dotenv()
         openai_api_key = os.getenv("OPENAI_API_KEY")
         
-        if not openai_api_key:
+        if not openai_api_key and LLM_BACKEND != "stub":
             return jsonify({"error": "OpenAI API key not found in environment variables"}), 500
 
-        # Get files from request
-        if 'resume' not in request.files or 'job_description' not in request.files:
+        # Turn the request away before reading uploads when the LLM queues are full
+        rejection = admit_request()
+        if rejection:
+            return rejection
+
+        # Get files from request; parts are streamed into spooled temporary files
+        with metrics.span("receive_upload"):
+            files = request.files
+        if 'resume' not in files or 'job_description' not in files:
             return jsonify({"error": "Both resume and job description files are required"}), 400
             
-        resume_file = request.files['resume']
-        jd_file = request.files['job_description']
-        
-        # Save files temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as resume_temp:
-            resume_file.save(resume_temp.name)
-            resume_path = resume_temp.name
-            
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as jd_temp:
-            jd_file.save(jd_temp.name)
-            jd_path = jd_temp.name
+        resume_file = files['resume']
+        jd_file = files['job_description']
 
-        # Extract and process text
-        text_resume = extract_text_from_pdf(resume_path)
-        text_jd = extract_text_from_pdf(jd_path)
-        
-        # Clean up temporary files
-        os.unlink(resume_path)
-        os.unlink(jd_path)
-
-        # Initialize the LLM
-        llm = ChatOpenAI(
-            temperature=0,
-            openai_api_key=openai_api_key,
-            model="gpt-4o"
-        )
+        # Reject oversized or non-PDF uploads before parsing them
+        with metrics.span("check_upload"):
+            for upload in (resume_file, jd_file):
+                rejection = check_upload(upload)
+                if rejection:
+                    return jsonify({"error": rejection[0]}), rejection[1]
+
+        # Extract and process text straight from the spooled uploads
+        with metrics.span("extract_text"):
+            try:
+                text_resume = extract_text_from_pdf(resume_file.stream, max_pages=MAX_PDF_PAGES, max_chars=MAX_EXTRACT_CHARS)
+                text_jd = extract_text_from_pdf(jd_file.stream, max_pages=MAX_PDF_PAGES, max_chars=MAX_EXTRACT_CHARS)
+            except PDFLimitError as e:
+                return jsonify({"error": str(e)}), 413
+
+        # Don't spend an LLM call on documents we could not read
+        if not text_resume.strip() or not text_jd.strip():
+            return jsonify({"error": "No text could be extracted from the resume or job description"}), 422
+
+        # Reuse an earlier analysis only for the identical resume: a near-duplicate can differ in exactly
+        # the name and contact details the analysis reports
+        with metrics.span("dedup_lookup"):
+            jd_key = content_hash(text_jd)
+            set_attribution(jd=jd_key)
+            resume_id = content_hash(text_resume)
+            previous = resume_index.get_payload(resume_id, key=jd_key)
+        if previous:
+            return jsonify({"analysis": previous, "duplicate_of": resume_id, "similarity": 1.0})
+        with metrics.span("dedup_lookup"):
+            signature = resume_index.signature(text_resume)
+            duplicate = resume_index.find_duplicate(signature=signature)
+
+        # Parse each resume once; every later JD is scored against the stored compact profile
+        with metrics.span("candidate_profile"):
+            profile, _ = candidate_profiles.get_or_create(text_resume)
+        resume_for_prompt = compact_profile(profile) if COMPACT_PROFILE_PROMPTS else text_resume
+
+        jd_for_prompt, template = text_jd, ANALYSIS_TEMPLATE
+        if COMPILE_JD:
+            try:
+                with metrics.span("compile_jd"), attribute(operation="compile_jd"):
+                    requirements, _ = get_jd_compiler(openai_api_key).compile(text_jd)
+                jd_for_prompt, template = render_requirements(requirements), COMPILED_JD_TEMPLATE
+            except ValueError:
+                # No skills could be extracted from the JD: score against the full text instead
+                metrics.JD_COMPILE_FAILURES.inc(endpoint="analyze")
 
         # Perform analysis
-        analysis_result = calculate_matching_score(text_resume, text_jd, llm)
-        json_result, score = format_analysis_output(analysis_result)
-        
+        formatted_result = get_engine(openai_api_key).analyze(resume_for_prompt, jd_for_prompt, template)
+
+        if "error" not in formatted_result["analysis_json"]:
+            with metrics.span("dedup_store"):
+                resume_index.add(resume_id, signature=signature, payload=formatted_result, key=jd_key)
+
+        response = {"analysis": formatted_result, "candidate_id": profile["resume_hash"]}
+        if duplicate and duplicate[0] != resume_id:
+            # Flagged for the recruiter (e.g. a resubmission), but scored on its own
+            response["near_duplicate_of"], response["similarity"] = duplicate
+        return jsonify(response)
+
+    except Exception as e:
+        import traceback
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        }), 500
+
+@app.route('/rank', methods=['POST'])
+def rank():
+    """Rank several resumes (repeated 'resumes' parts) against one JD with list-wise LLM calls"""
+    try:
+        load_dotenv()
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+
+        if not openai_api_key and LLM_BACKEND != "stub":
+            return jsonify({"error": "OpenAI API key not found in environment variables"}), 500
+
+        # Turn the request away before reading uploads when the LLM queues are full
+        rejection = admit_request()
+        if rejection:
+            return rejection
+
+        with metrics.span("receive_upload"):
+            resume_files = request.files.getlist('resumes')
+            jd_file = request.files.get('job_description')
+        if not resume_files or jd_file is None:
+            return jsonify({"error": "At least one resume and a job description file are required"}), 400
+        if len(resume_files) > RANK_MAX_RESUMES:
+            return jsonify({"error": f"{len(resume_files)} resumes sent; at most {RANK_MAX_RESUMES} can be ranked "
+                                     f"per request"}), 400
+
+        with metrics.span("check_upload"):
+            for upload in resume_files + [jd_file]:
+                rejection = check_upload(upload)
+                if rejection:
+                    return jsonify({"error": rejection[0]}), rejection[1]
+
+        with metrics.span("extract_text"):
+            try:
+                text_jd = extract_text_from_pdf(jd_file.stream, max_pages=MAX_PDF_PAGES, max_chars=MAX_EXTRACT_CHARS)
+                resume_texts = [
+                    extract_text_from_pdf(upload.stream, max_pages=MAX_PDF_PAGES, max_chars=MAX_EXTRACT_CHARS)
+                    for upload in resume_files
+                ]
+            except PDFLimitError as e:
+                return jsonify({"error": str(e)}), 413
+        if not text_jd.strip():
+            return jsonify({"error": "No text could be extracted from the job description"}), 422
+
+        candidates, filenames, unreadable = [], {}, []
+        with metrics.span("candidate_profile"):
+            for upload, text in zip(resume_files, resume_texts):
+                if not text.strip():
+                    unreadable.append(upload.filename)
+                    continue
+                profile, _ = candidate_profiles.get_or_create(text)
+                if profile["resume_hash"] not in filenames:
+                    candidates.append((profile["resume_hash"],
+                                       compact_profile(profile) if COMPACT_PROFILE_PROMPTS else profile["text"]))
+                filenames.setdefault(profile["resume_hash"], upload.filename)
+
+        set_attribution(jd=content_hash(text_jd))
+        jd_for_prompt = text_jd
+        if COMPILE_JD:
+            try:
+                with metrics.span("compile_jd"), attribute(operation="compile_jd"):
+                    requirements, _ = get_jd_compiler(openai_api_key).compile(text_jd)
+                jd_for_prompt = render_requirements(requirements)
+            except ValueError:
+                metrics.JD_COMPILE_FAILURES.inc(endpoint="rank")
+
         try:
-            # Parse the JSON string back to a dictionary
-            formatted_result = {
-                "analysis_json": json.loads(json_result),
-                "matching_score": score
-            }
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return the raw result
-            formatted_result = {
-                "analysis_json": json_result,
-                "matching_score": score
-            }
-
-        return jsonify({"analysis": formatted_result})
+            rankings = ListwiseScorer(get_engine(openai_api_key)).rank(jd_for_prompt, candidates)
+        except RankingError as e:
+            return jsonify({"error": str(e), "unreadable": unreadable}), 502
+        for result in rankings:
+            result["filename"] = filenames[result["candidate_id"]]
+        return jsonify({"rankings": rankings, "unreadable": unreadable})
 
     except Exception as e:
         import traceback
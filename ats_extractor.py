@@ -0,0 +1,575 @@
+import argparse
+import json
+import math
+import os
+import re
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import date
+
+from resume_store import (ATS_FIELDS, MISSING_VALUES, PROMPT_PREFIX, is_llm_labeled, iter_labeled_entries,
+                          parse_experience_years, split_skills)
+from text_normalizer import normalize_text
+
+ATS_MODEL_PATH = os.getenv("ATS_MODEL_PATH", "ats_model.json")
+# Resumes whose weakest calibrated field confidence (expected agreement with an LLM label) is below this go to the LLM
+ATS_MIN_CONFIDENCE = float(os.getenv("ATS_MIN_CONFIDENCE", "0.5"))
+# Raw confidence bins per field for calibration
+CALIBRATION_BINS = 10
+
+# PDF extraction often breaks an address across a space or line ("name @gm\nail.com")
+EMAIL_PATTERN = re.compile(
+    r"([A-Za-z0-9._%+-]+)\s?@\s?([A-Za-z0-9-]+(?:\s?[A-Za-z0-9-]+)?)\s?\.\s?([A-Za-z]{2,}(?:\.[A-Za-z]{2,})?)"
+)
+WEBMAIL_DOMAINS = {"gmail", "rediffmail", "hotmail", "outlook", "ymail", "icloud", "protonmail"}
+PHONE_PATTERN = re.compile(r"(?<![\d/])(?:\+?\d{1,3}[\s.-]?)?(?:\(?\d{2,5}\)?[\s.-]?){1,3}\d{3,5}(?![\d/])")
+NAME_LABEL_PATTERN = re.compile(r"\bname\s*[:\-]+\s*([A-Za-z][A-Za-z.' ]{2,40})", re.IGNORECASE)
+NAME_TOKEN = re.compile(r"^[A-Za-z][A-Za-z.'-]*$")
+HONORIFICS = {"mr", "mrs", "ms", "miss", "dr"}
+
+EXPLICIT_EXPERIENCE_PATTERN = re.compile(
+    r"(\d{1,2}(?:\.\d)?)\s*\+?\s*(?:years?|yrs?)(?:\s*(?:and\s*)?(\d{1,2})\s*months?)?"
+    r"\s*(?:of\s+)?(?:[A-Za-z-]+\s+){0,3}?experience",
+    re.IGNORECASE,
+)
+# Naukri-style profile header line: "6 Years 6 Months"
+EXPERIENCE_LINE_PATTERN = re.compile(r"^(\d{1,2})\s*\+?\s*years?\s*(?:(\d{1,2})\s*months?)?$", re.IGNORECASE | re.MULTILINE)
+_DATE = r"(?:[A-Za-z]{3,9}\.?,?\s*'?\d{2,4}|\d{1,2}[/.]\d{2,4}|\d{4})"
+DATE_RANGE_PATTERN = re.compile(
+    rf"({_DATE})\s*(?:-|–|—|to|till|until)\s*({_DATE}|present|current|now|till date|today|date)",
+    re.IGNORECASE,
+)
+MONTHS = {name: number for number, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+OPEN_ENDED = {"present", "current", "now", "till date", "today", "date"}
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#./&'-]*[a-z0-9+#]|[a-z0-9+#]")
+STOPWORDS = {"a", "an", "and", "at", "by", "for", "from", "in", "of", "on", "the", "to", "with", "-", "&"}
+MAX_NGRAM = 4
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def ngrams(tokens, max_n=MAX_NGRAM):
+    """Yield (position, "joined n-gram") for every n-gram up to max_n tokens"""
+    for i in range(len(tokens)):
+        for n in range(1, max_n + 1):
+            if i + n > len(tokens):
+                break
+            yield i, " ".join(tokens[i:i + n])
+
+
+def is_missing(value):
+    return not value or value.strip().lower() in MISSING_VALUES
+
+
+def resume_text_from_prompt(prompt):
+    return prompt[len(PROMPT_PREFIX):] if prompt.startswith(PROMPT_PREFIX) else prompt
+
+
+def split_entries(entries, holdout_percent, salt=""):
+    """(kept, held out) LLM-labeled entries, split by a hash of the prompt so the split is stable"""
+    kept, held_out = [], []
+    for entry in entries:
+        if not is_llm_labeled(entry):
+            continue
+        bucket = zlib.crc32((salt + entry.get("prompt", "")).encode("utf-8", "surrogatepass")) % 100
+        (held_out if bucket < holdout_percent else kept).append(entry)
+    return kept, held_out
+
+
+def labeled_fields(entry):
+    """The label of an entry as a dict, or None when its completion is not a JSON object"""
+    try:
+        fields = json.loads(entry["completion"]) if isinstance(entry["completion"], str) else entry["completion"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return fields if isinstance(fields, dict) else None
+
+
+# --- Contact fields -----------------------------------------------------------------------------
+
+def extract_email(text):
+    match = EMAIL_PATTERN.search(text)
+    if not match:
+        return "N/A", 0.8
+    local = match.group(1).lstrip("._%+-")
+    domain = re.sub(r"\s", "", match.group(2)).lower()
+    suffix = match.group(3).lower()
+    # The text run after a webmail address is often glued on ("gmail.comEmail") or cut ("gmail.co")
+    if domain in WEBMAIL_DOMAINS or suffix.startswith("com"):
+        suffix = "com"
+    return f"{local}@{domain}.{suffix}".lower(), 1.0
+
+
+def extract_phone(text):
+    """Digits of the first phone-like run with 10 to 13 digits"""
+    for match in PHONE_PATTERN.finditer(text):
+        digits = re.sub(r"\D", "", match.group())
+        if 10 <= len(digits) <= 13:
+            return digits, 0.95
+    return "N/A", 0.8
+
+
+def _name_run(words, email_local, non_name_words):
+    """Leading run of name-like words, stopping at a header/title word or punctuation"""
+    run = []
+    for word in words:
+        token = word.lower().strip(".")
+        if not NAME_TOKEN.match(word) or len(run) == 4:
+            break
+        if len(token) > 2 and token in non_name_words and token not in email_local:
+            break
+        run.append(word)
+    return run
+
+
+def extract_name(lines, email, non_name_words):
+    """
+    An explicit 'Name:' label, or a short run of name-like words near the top of the
+    resume, preferring one that also appears in the email address. `non_name_words`
+    are header/title words learned from training lines that were not names.
+    """
+    email_local = email.split("@")[0] if email != "N/A" else ""
+    match = NAME_LABEL_PATTERN.search("\n".join(lines[:60]))
+    if match:
+        run = _name_run(match.group(1).split(), email_local, non_name_words)
+        if len(run) >= 2:
+            return " ".join(run).title(), 0.9
+
+    candidates = []
+    for line in lines[:10]:
+        words = line.split()
+        while words and (words[0].lower().strip(".") in HONORIFICS or words[0].isdigit()):
+            words = words[1:]
+        run = _name_run(words, email_local, non_name_words)
+        in_email = any(w.lower().strip(".") in email_local for w in run if len(w) > 2)
+        if len(run) >= 2 or (run and in_email and len(run[0]) > 3):
+            name = " ".join(w.capitalize() if w.isupper() or w.islower() else w for w in run)
+            candidates.append((name, in_email))
+    for name, in_email in candidates:
+        if in_email:
+            return name, 0.95
+    if candidates:
+        return candidates[0][0], 0.7
+    return "N/A", 0.4
+
+
+# --- Experience ---------------------------------------------------------------------------------
+
+def parse_date(value, today):
+    """Return a month index (year * 12 + month - 1) for a date token, or None"""
+    value = value.strip().lower().rstrip(".")
+    if value in OPEN_ENDED:
+        return today.year * 12 + today.month - 1
+    match = re.match(r"([a-z]{3,9})\.?,?\s*'?(\d{2,4})$", value)
+    if match:
+        month = MONTHS.get(match.group(1)[:3])
+        year = int(match.group(2))
+        if month is None:
+            return None
+    else:
+        match = re.match(r"(\d{1,2})[/.](\d{2,4})$", value) or re.match(r"()(\d{4})$", value)
+        if not match:
+            return None
+        month = int(match.group(1)) if match.group(1) else 1
+        year = int(match.group(2))
+        if not 1 <= month <= 12:
+            return None
+    if year < 100:
+        year += 2000 if year <= today.year % 100 else 1900
+    if not 1960 <= year <= today.year + 1:
+        return None
+    return year * 12 + month - 1
+
+
+def experience_months(lines, today, skip_lines=()):
+    """Total months covered by the union of date ranges, ignoring lines in `skip_lines`"""
+    intervals = []
+    for index, line in enumerate(lines):
+        if index in skip_lines:
+            continue
+        for match in DATE_RANGE_PATTERN.finditer(line):
+            start, end = parse_date(match.group(1), today), parse_date(match.group(2), today)
+            if start is not None and end is not None and end >= start:
+                intervals.append((start, end))
+
+    total = 0
+    current = None
+    for start, end in sorted(intervals):
+        if current and start <= current[1]:
+            current[1] = max(current[1], end)
+            continue
+        if current:
+            total += current[1] - current[0]
+        current = [start, end]
+    if current:
+        total += current[1] - current[0]
+    return total, len(intervals)
+
+
+def format_experience(months):
+    years, months = divmod(months, 12)
+    if not years:
+        return f"{months} months"
+    return f"{years} years {months} months" if months else f"{years} years"
+
+
+def extract_experience(text, lines, today, education_lines):
+    match = EXPERIENCE_LINE_PATTERN.search(text) or EXPLICIT_EXPERIENCE_PATTERN.search(text)
+    if match:
+        months = round(float(match.group(1)) * 12) + int(match.group(2) or 0)
+        return format_experience(months), 0.9
+    # Education date ranges (e.g. "2019 - 2023") are not work experience
+    months, ranges = experience_months(lines, today, education_lines)
+    if ranges:
+        return format_experience(months), 0.7
+    return "N/A", 0.2
+
+
+# --- Trained model ------------------------------------------------------------------------------
+
+class ATSExtractor:
+    """
+    CPU-only ATS field extractor. Contact fields and experience come from regexes and a
+    date-range parser; Skills come from a phrase vocabulary scored by how often a phrase
+    found in a resume was also in its label; Education lines come from a naive Bayes line
+    classifier. Both are trained from the LLM-labeled entries of labeled_resumes.jsonl
+    with `train`.
+
+    The confidences the rules assign are raw scores. `calibrate` maps each field's raw
+    score, by bin, to the mean agreement with the LLM label that held-out resumes in the
+    bin reached; until then, `calibrated` is False and the confidences are not comparable
+    with a threshold.
+    """
+
+    def __init__(self, skills=None, education=None, non_name_words=(), skill_threshold=0.25, calibration=None):
+        # skills: {"n-gram": [precision, display form]}
+        self.skills = skills or {}
+        # education: {"prior": log odds, "weights": {token: log likelihood ratio}, "default": ratio}
+        self.education = education or {"prior": 0.0, "weights": {}, "default": 0.0}
+        self.non_name_words = set(non_name_words)
+        self.skill_threshold = skill_threshold
+        # calibration: {field: [expected agreement per raw confidence bin]}
+        self.calibration = calibration or {}
+
+    @property
+    def calibrated(self):
+        return bool(self.calibration)
+
+    @classmethod
+    def train(cls, entries, min_support=1, min_precision=0.2):
+        labeled_skills = Counter()
+        skill_hits = Counter()
+        skill_names = defaultdict(Counter)
+        documents = []
+        line_counts = {True: Counter(), False: Counter()}
+        line_totals = {True: 0, False: 0}
+        name_words = Counter()
+        non_name_words = Counter()
+
+        for entry in entries:
+            # Labels the extractor produced itself would only teach it its own mistakes
+            fields = labeled_fields(entry) if is_llm_labeled(entry) else None
+            if fields is None:
+                continue
+            text = normalize_text(resume_text_from_prompt(entry.get("prompt", "")))
+            lines = [line for line in text.split("\n") if line.strip()]
+            grams = {gram for _, gram in ngrams(tokenize(text))}
+            documents.append(grams)
+
+            for skill in split_skills(str(fields.get("Skills", ""))):
+                key = " ".join(tokenize(skill))
+                if not key:
+                    continue
+                labeled_skills[key] += 1
+                skill_names[key][skill] += 1
+                if key in grams:
+                    skill_hits[key] += 1
+
+            education = str(fields.get("Education", ""))
+            education_tokens = set(tokenize(education)) - STOPWORDS if not is_missing(education) else set()
+            for line in lines:
+                tokens = [t for t in tokenize(line) if t not in STOPWORDS]
+                if not tokens:
+                    continue
+                overlap = sum(1 for t in tokens if t in education_tokens)
+                positive = overlap / len(tokens) >= 0.6
+                line_counts[positive].update(tokens)
+                line_totals[positive] += 1
+
+            name = str(fields.get("Name", ""))
+            name_tokens = set(tokenize(name)) if not is_missing(name) else set()
+            name_words.update(name_tokens)
+            for line in lines[:8]:
+                non_name_words.update(t for t in tokenize(line) if t not in name_tokens)
+
+        # A phrase's precision is the share of resumes containing it whose label lists it
+        occurrences = Counter()
+        for grams in documents:
+            occurrences.update(key for key in skill_hits if key in grams)
+        skills = {}
+        for key, hits in skill_hits.items():
+            precision = hits / occurrences[key]
+            if hits >= min_support and precision >= min_precision:
+                skills[key] = [round(precision, 4), skill_names[key].most_common(1)[0][0]]
+
+        vocabulary = set(line_counts[True]) | set(line_counts[False])
+        positive_total = sum(line_counts[True].values()) + len(vocabulary)
+        negative_total = sum(line_counts[False].values()) + len(vocabulary)
+        weights = {}
+        for token in vocabulary:
+            if line_counts[True][token] + line_counts[False][token] < 2:
+                continue
+            weights[token] = round(
+                math.log((line_counts[True][token] + 1) / positive_total)
+                - math.log((line_counts[False][token] + 1) / negative_total), 4)
+        education = {
+            "prior": math.log((line_totals[True] + 1) / (line_totals[False] + 1)),
+            "weights": weights,
+            "default": math.log(negative_total / positive_total),
+        }
+
+        # Words seen near the top of resumes far more often than in names (section headers, titles)
+        non_names = {word for word, count in non_name_words.items() if count >= 2 and count > 2 * name_words[word]}
+        return cls(skills, education, non_names)
+
+    def save(self, path=ATS_MODEL_PATH):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "skills": self.skills,
+                "education": self.education,
+                "non_name_words": sorted(self.non_name_words),
+                "skill_threshold": self.skill_threshold,
+                "calibration": self.calibration,
+            }, f)
+
+    @classmethod
+    def load(cls, path=ATS_MODEL_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["skills"], data["education"], data["non_name_words"], data.get("skill_threshold", 0.25),
+                   data.get("calibration"))
+
+    def education_probability(self, line):
+        tokens = [t for t in tokenize(line) if t not in STOPWORDS]
+        if not tokens:
+            return 0.0
+        weights = self.education["weights"]
+        score = self.education["prior"] + sum(weights.get(t, 0.0) for t in tokens)
+        return 1 / (1 + math.exp(-max(min(score, 30), -30)))
+
+    def extract_education(self, lines, threshold=0.2):
+        """Returns (education, confidence, indices of education lines)"""
+        scored = [(i, self.education_probability(line)) for i, line in enumerate(lines)]
+        chosen = [(i, p) for i, p in scored if p > threshold]
+        if not chosen:
+            return "N/A", 0.3, set()
+        best = sorted(chosen, key=lambda item: -item[1])[:3]
+        indices = sorted(i for i, _ in best)
+        education = ", ".join(lines[i].strip(" ,;-") for i in indices)
+        return education, max(p for _, p in best), {i for i, _ in chosen}
+
+    def extract_skills(self, text):
+        found = {}
+        for position, gram in ngrams(tokenize(text)):
+            entry = self.skills.get(gram)
+            if entry and entry[0] >= self.skill_threshold and gram not in found:
+                found[gram] = (position, entry)
+        if not found:
+            return "N/A", 0.2
+        # Drop phrases contained in a longer matched phrase ("learning" inside "machine learning")
+        keys = [k for k in found if not any(k != other and f" {k} " in f" {other} " for other in found)]
+        keys.sort(key=lambda k: found[k][0])
+        confidence = min(1.0, sum(found[k][1][0] for k in keys) / 4)
+        return ", ".join(found[k][1][1] for k in keys[:25]), confidence
+
+    def calibrate(self, entries, today=None, bins=CALIBRATION_BINS):
+        """
+        Fit the per-field calibration on held-out labeled entries: the mean field_score
+        per raw confidence bin, shrunk towards the field's overall mean for sparse bins
+        """
+        totals = {field: [[0.0, 0] for _ in range(bins)] for field in ATS_FIELDS}
+        for entry in entries:
+            labels = labeled_fields(entry) if is_llm_labeled(entry) else None
+            if labels is None:
+                continue
+            fields, confidence = self.extract_raw(resume_text_from_prompt(entry.get("prompt", "")), today)
+            for field in ATS_FIELDS:
+                cell = totals[field][min(int(confidence[field] * bins), bins - 1)]
+                cell[0] += field_score(field, fields[field], str(labels.get(field, "")))
+                cell[1] += 1
+        calibration = {}
+        for field, cells in totals.items():
+            count = sum(n for _, n in cells)
+            if not count:
+                return self
+            mean = sum(total for total, _ in cells) / count
+            calibration[field] = [round((total + 2 * mean) / (n + 2), 4) for total, n in cells]
+        self.calibration = calibration
+        return self
+
+    def extract(self, resume_text, today=None):
+        """Return ({field: value}, {field: confidence}); confidences are calibrated once `calibrate` has run"""
+        fields, confidence = self.extract_raw(resume_text, today)
+        if self.calibration:
+            bins = len(next(iter(self.calibration.values())))
+            confidence = {field: self.calibration[field][min(int(value * bins), bins - 1)]
+                          for field, value in confidence.items()}
+        return fields, confidence
+
+    def extract_raw(self, resume_text, today=None):
+        """Return ({field: value}, {field: raw rule confidence})"""
+        today = today or date.today()
+        text = normalize_text(resume_text)
+        lines = [line for line in text.split("\n") if line.strip()]
+
+        email, email_confidence = extract_email(text)
+        phone, phone_confidence = extract_phone(text)
+        name, name_confidence = extract_name(lines, email, self.non_name_words)
+        education, education_confidence, education_lines = self.extract_education(lines)
+        experience, experience_confidence = extract_experience(text, lines, today, education_lines)
+        skills, skills_confidence = self.extract_skills(text)
+
+        fields = {"Name": name, "Email": email, "Phone": phone, "Experience": experience,
+                  "Education": education, "Skills": skills}
+        confidence = {"Name": name_confidence, "Email": email_confidence, "Phone": phone_confidence,
+                      "Experience": experience_confidence, "Education": education_confidence,
+                      "Skills": skills_confidence}
+        return fields, confidence
+
+
+def load_extractor(path=ATS_MODEL_PATH):
+    """The trained extractor, or None when no model file has been trained yet"""
+    if not os.path.exists(path):
+        return None
+    return ATSExtractor.load(path)
+
+
+# --- Evaluation ---------------------------------------------------------------------------------
+
+def token_f1(predicted, expected):
+    predicted_tokens = Counter(t for t in tokenize(predicted) if t not in STOPWORDS) if not is_missing(predicted) else Counter()
+    expected_tokens = Counter(t for t in tokenize(expected) if t not in STOPWORDS) if not is_missing(expected) else Counter()
+    if not predicted_tokens and not expected_tokens:
+        return 1.0
+    overlap = sum((predicted_tokens & expected_tokens).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(predicted_tokens.values())
+    recall = overlap / sum(expected_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def field_score(field, predicted, expected):
+    """Per-field agreement with a label, between 0 and 1"""
+    if field in ("Name", "Email"):
+        if is_missing(predicted) or is_missing(expected):
+            return float(is_missing(predicted) == is_missing(expected))
+        return float(predicted.strip().lower() == expected.strip().lower())
+    if field == "Phone":
+        # Labels keep or drop the country code inconsistently; compare national numbers
+        predicted_digits, expected_digits = re.sub(r"\D", "", predicted), re.sub(r"\D", "", expected)
+        return float(predicted_digits[-10:] == expected_digits[-10:])
+    if field == "Experience":
+        predicted_years = experience_years(predicted)
+        expected_years = experience_years(expected)
+        if math.isnan(expected_years):
+            return float(math.isnan(predicted_years))
+        return float(not math.isnan(predicted_years) and abs(predicted_years - expected_years) <= 1)
+    return token_f1(predicted, expected)
+
+
+def experience_years(experience):
+    """Years in an Experience value such as '10 years 2 months in ...', '9 months in HR' or 'Fresher'"""
+    if re.match(r"\s*fresher", experience or "", re.IGNORECASE):
+        return 0.0
+    years = parse_experience_years(experience)
+    months = re.search(r"(\d{1,2})\s*months?", experience or "", re.IGNORECASE)
+    if math.isnan(years):
+        return int(months.group(1)) / 12 if months else float("nan")
+    return years + (int(months.group(1)) / 12 if months else 0)
+
+
+def train_calibrated(entries, holdout_percent=20, today=None):
+    """Train on the LLM-labeled entries outside a hash-based holdout, then calibrate confidences on the holdout"""
+    train, held_out = split_entries(entries, holdout_percent, salt="calibration")
+    return ATSExtractor.train(train).calibrate(held_out, today)
+
+
+def evaluate(jsonl_path, holdout_percent=20, min_confidence=ATS_MIN_CONFIDENCE, today=None):
+    """
+    Train and calibrate on a hash-based split of the LLM-labeled data, then report
+    per-field agreement, calibration, the LLM fallback rate and throughput on the
+    held-out resumes.
+    """
+    train, test = split_entries(iter_labeled_entries(jsonl_path), holdout_percent)
+    extractor = train_calibrated(train, holdout_percent, today)
+
+    resumes = []
+    for entry in test:
+        fields = labeled_fields(entry)
+        if fields is not None:
+            resumes.append((resume_text_from_prompt(entry["prompt"]), fields))
+
+    started = time.perf_counter()
+    results = [extractor.extract(text, today) for text, _ in resumes]
+    elapsed = time.perf_counter() - started
+
+    scores = {field: [] for field in ATS_FIELDS}
+    confidences = {field: [] for field in ATS_FIELDS}
+    confident = 0
+    confident_scores = {field: [] for field in ATS_FIELDS}
+    for (_, labels), (fields, confidence) in zip(resumes, results):
+        is_confident = min(confidence.values()) >= min_confidence
+        confident += is_confident
+        for field in ATS_FIELDS:
+            score = field_score(field, fields[field], str(labels.get(field, "")))
+            scores[field].append(score)
+            confidences[field].append(confidence[field])
+            if is_confident:
+                confident_scores[field].append(score)
+
+    print(f"Trained on {len(train)} resumes ({len(extractor.skills)} skill phrases), evaluated on {len(resumes)}")
+    print(f"Throughput: {len(resumes) / elapsed:.0f} resumes/sec on one core "
+          f"({elapsed / max(len(resumes), 1) * 1000:.2f} ms per resume)")
+    print(f"Handled locally at confidence >= {min_confidence}: {confident}/{len(resumes)} "
+          f"({confident / max(len(resumes), 1) * 100:.0f}%), the rest fall back to the LLM")
+    # A calibrated extractor's mean confidence per field should be close to its agreement on unseen resumes
+    print(f"{'Field':12s} {'all':>6s} {'local only':>11s} {'confidence':>11s}  metric")
+    metrics = {"Name": "exact", "Email": "exact", "Phone": "last 10 digits", "Experience": "years within 1",
+               "Education": "token F1", "Skills": "token F1"}
+    for field in ATS_FIELDS:
+        overall = sum(scores[field]) / max(len(scores[field]), 1)
+        local = sum(confident_scores[field]) / max(len(confident_scores[field]), 1)
+        expected = sum(confidences[field]) / max(len(confidences[field]), 1)
+        print(f"{field:12s} {overall:6.2f} {local:11.2f} {expected:11.2f}  {metrics[field]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local ATS field extractor")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("jsonl_path", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("--model", default=ATS_MODEL_PATH)
+    parser.add_argument("--holdout-percent", type=int, default=20)
+    parser.add_argument("--min-confidence", type=float, default=ATS_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        extractor = train_calibrated(iter_labeled_entries(args.jsonl_path), args.holdout_percent)
+        extractor.save(args.model)
+        print(f"Saved {len(extractor.skills)} skill phrases and {len(extractor.education['weights'])} "
+              f"education features to {args.model}")
+        if extractor.calibrated:
+            print(f"Confidences calibrated on the {args.holdout_percent}% held-out resumes")
+        else:
+            print("No held-out resumes to calibrate confidences on; resume_score.py will label with the LLM only")
+    else:
+        evaluate(args.jsonl_path, args.holdout_percent, args.min_confidence)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
 #!/bin/bash
-pip install gunicorn
-python -m gunicorn app:app 
\ No newline at end of file
+# gunicorn is installed from requirements.txt at build time; settings come from gunicorn.conf.py
+exec python -m gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,275 @@
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from ats_extractor import ATSExtractor, load_extractor, resume_text_from_prompt, tokenize
+from resume_dedup import content_hash
+from resume_store import iter_labeled_entries, split_skills
+from text_normalizer import count_tokens, normalize_text
+from vector_sync import vector_id
+
+CANDIDATE_PROFILE_DB = os.getenv("CANDIDATE_PROFILE_DB", "candidate_profiles.db")
+# Resume text kept in the compact profile after the structured fields
+PROFILE_EXCERPT_CHARS = int(os.getenv("PROFILE_EXCERPT_CHARS", "2000"))
+SKILL_VECTOR_DIM = 256
+
+# Resume section headings: the experience section, and the headings that end it
+EXPERIENCE_HEADING = re.compile(
+    r"^\W*(?:(?:work|professional|employment|relevant|career)\s+)?(?:experience|employment|work history|"
+    r"employment history|career history)\W*$", re.IGNORECASE)
+SECTION_HEADING = re.compile(
+    r"^\W*(?:education|academic\w*|qualifications?|skills?|technical skills|key skills|projects?|"
+    r"certifications?|awards?|achievements?|publications?|languages?|interests?|hobbies|references?|"
+    r"summary|profile|objective|personal (?:details|information)|declaration|trainings?|courses?)\W*$",
+    re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    resume_hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    skills_vector BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    resume_hash TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    embedding BLOB,
+    PRIMARY KEY (resume_hash, chunk_index)
+);
+"""
+
+
+def skills_vector(skills, dim=SKILL_VECTOR_DIM):
+    """
+    L2-normalized hashed bag of skills: each normalized skill phrase adds +/-1 to one of
+    `dim` buckets, so two profiles' skill overlap is a dot product.
+    """
+    vector = [0.0] * dim
+    for skill in skills:
+        key = " ".join(tokenize(skill))
+        if not key:
+            continue
+        bucket = zlib.crc32(key.encode("utf-8"))
+        vector[bucket % dim] += 1.0 if bucket & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def skill_similarity(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _storable(text):
+    """Join UTF-16 surrogate pairs left by PDF extraction and replace lone surrogates, which SQLite cannot store"""
+    return text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+
+
+def experience_section(text):
+    """The resume's experience section(s), from each experience heading to the next section heading"""
+    sections, current = [], None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if len(stripped) <= 40 and EXPERIENCE_HEADING.match(stripped):
+            current = [line]
+            sections.append(current)
+        elif current is not None and len(stripped) <= 40 and SECTION_HEADING.match(stripped):
+            current = None
+        elif current is not None:
+            current.append(line)
+    return "\n".join("\n".join(section) for section in sections).strip()
+
+
+def compact_profile(profile, excerpt_chars=PROFILE_EXCERPT_CHARS):
+    """
+    Structured fields plus a bounded excerpt of the resume, used in place of the full text
+    in prompts. The experience section is never cut: when the excerpt ends before it does,
+    the whole section follows the excerpt.
+    """
+    fields = profile["fields"]
+    lines = [
+        f"Name: {fields.get('Name', 'N/A')}",
+        f"Contact: {fields.get('Email', 'N/A')}, {fields.get('Phone', 'N/A')}",
+        f"Experience: {fields.get('Experience', 'N/A')}",
+        f"Education: {fields.get('Education', 'N/A')}",
+        f"Skills: {fields.get('Skills', 'N/A')}",
+    ]
+    text = profile["text"]
+    if excerpt_chars and text:
+        excerpt = text[:excerpt_chars]
+        if len(text) > excerpt_chars:
+            excerpt = excerpt.rsplit("\n", 1)[0] + "\n..."
+        lines.append(f"Resume excerpt:\n{excerpt}")
+        experience = experience_section(text)
+        if len(text) > excerpt_chars and experience and experience not in excerpt:
+            lines.append(f"Experience section:\n{experience}")
+    return "\n".join(lines)
+
+
+class CandidateProfileStore:
+    """
+    Persistent candidate profiles keyed by the content hash of the normalized resume
+    text: the text itself, ATS fields in the shape extract_ats_fields produces, text
+    chunks with optional embeddings, and a skills vector. A resume is parsed once and
+    every later analysis, against any JD, reuses the stored profile.
+
+    With `embeddings` (a shared_embeddings.EmbeddingMatrix), chunk embeddings are also
+    appended there under vector_sync.vector_id(resume_hash, i), for searches that all
+    processes serve from one memory-mapped copy.
+    """
+
+    def __init__(self, path=CANDIDATE_PROFILE_DB, extractor=None, embed=None, chunker=None, embeddings=None):
+        self.path = path
+        # Falls back to an untrained extractor: regex contact fields and experience only
+        self.extractor = extractor or load_extractor() or ATSExtractor()
+        self.embed = embed
+        self.chunker = chunker
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def reopen(self):
+        """
+        New connection for a process forked after the store was opened (gunicorn workers
+        with preload_app); a SQLite connection must not be used across fork. The inherited
+        one is left unclosed, as closing it in the child could release the parent's locks.
+        """
+        with self._lock:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    @staticmethod
+    def resume_hash(text):
+        return content_hash(_storable(normalize_text(text)))
+
+    def get(self, resume_hash, with_chunks=False):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT text, fields, skills_vector, created_at FROM profiles WHERE resume_hash = ?", (resume_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = []
+            if with_chunks:
+                chunks = self._connection.execute(
+                    "SELECT text, embedding FROM chunks WHERE resume_hash = ? ORDER BY chunk_index", (resume_hash,)
+                ).fetchall()
+        fields = json.loads(row[1])
+        return {
+            "resume_hash": resume_hash,
+            "text": row[0],
+            "fields": fields,
+            "skills": split_skills(fields.get("Skills", "")),
+            "skills_vector": list(array("f", row[2])),
+            "chunks": [
+                {"text": text, "embedding": list(array("f", embedding)) if embedding else None}
+                for text, embedding in chunks
+            ],
+            "created_at": row[3],
+        }
+
+    def build(self, resume_text, fields=None):
+        """Parse a resume into a profile dict without storing it"""
+        text = _storable(normalize_text(resume_text))
+        if fields is None:
+            fields, _ = self.extractor.extract(text)
+        skills = split_skills(fields.get("Skills", ""))
+        chunk_texts = self.chunker(text) if self.chunker else []
+        embeddings = self.embed(chunk_texts) if self.embed and chunk_texts else [None] * len(chunk_texts)
+        return {
+            "resume_hash": content_hash(text),
+            "text": text,
+            "fields": fields,
+            "skills": skills,
+            "skills_vector": skills_vector(skills),
+            "chunks": [{"text": t, "embedding": e} for t, e in zip(chunk_texts, embeddings)],
+            "created_at": time.time(),
+        }
+
+    def put(self, profile):
+        vector = array("f", profile["skills_vector"]).tobytes()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                (profile["resume_hash"], profile["text"], json.dumps(profile["fields"]), vector, profile["created_at"]),
+            )
+            self._connection.execute("DELETE FROM chunks WHERE resume_hash = ?", (profile["resume_hash"],))
+            self._connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [
+                    (profile["resume_hash"], i, chunk["text"],
+                     array("f", chunk["embedding"]).tobytes() if chunk["embedding"] else None)
+                    for i, chunk in enumerate(profile["chunks"])
+                ],
+            )
+        embedded = [(i, chunk["embedding"]) for i, chunk in enumerate(profile["chunks"]) if chunk["embedding"]]
+        if self.embeddings is not None and embedded:
+            self.embeddings.append([vector_id(profile["resume_hash"], i) for i, _ in embedded], [e for _, e in embedded])
+
+    def get_or_create(self, resume_text, fields=None):
+        """Return (profile, created); the resume is only parsed when its hash is not stored yet"""
+        profile = self.get(self.resume_hash(resume_text))
+        if profile is not None:
+            return profile, False
+        profile = self.build(resume_text, fields)
+        self.put(profile)
+        return profile, True
+
+
+def benchmark(jsonl_path, db_path, excerpt_chars=PROFILE_EXCERPT_CHARS):
+    """Build profiles for the labeled resumes, then compare full-text and compact prompt tokens"""
+    resumes = [resume_text_from_prompt(entry.get("prompt", "")) for entry in iter_labeled_entries(jsonl_path)]
+    with CandidateProfileStore(db_path) as store:
+        started = time.perf_counter()
+        created = sum(store.get_or_create(text)[1] for text in resumes)
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        profiles = [store.get_or_create(text)[0] for text in resumes]
+        lookup_time = time.perf_counter() - started
+
+    full_tokens = sum(count_tokens(normalize_text(text)) for text in resumes)
+    compact_tokens = sum(count_tokens(compact_profile(profile, excerpt_chars)) for profile in profiles)
+    longer = sum(len(profile["text"]) > excerpt_chars for profile in profiles)
+    print(f"{len(resumes)} resumes, {created} new profiles in {build_time:.2f} s "
+          f"({build_time / max(len(resumes), 1) * 1000:.2f} ms per resume)")
+    print(f"Cached profile lookup: {lookup_time / max(len(resumes), 1) * 1000:.3f} ms per resume")
+    print(f"Resume tokens per prompt: {full_tokens / max(len(resumes), 1):.0f} full text -> "
+          f"{compact_tokens / max(len(resumes), 1):.0f} compact profile "
+          f"({(full_tokens - compact_tokens) / max(full_tokens, 1) * 100:.1f}% fewer)")
+    print(f"{longer / max(len(profiles), 1) * 100:.0f}% of resumes are longer than the {excerpt_chars}-character excerpt; "
+          f"beyond their experience section, the rest of their text is left out of compact prompts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build candidate profiles and report prompt token savings")
+    parser.add_argument("jsonl_path", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("--db", default=CANDIDATE_PROFILE_DB)
+    parser.add_argument("--excerpt-chars", type=int, default=PROFILE_EXCERPT_CHARS)
+    args = parser.parse_args()
+    benchmark(args.jsonl_path, args.db, args.excerpt_chars)
+
+
+if __name__ == "__main__":
+    main()
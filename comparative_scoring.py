@@ -0,0 +1,406 @@
+import argparse
+import contextvars
+import json
+import math
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_engine import AnalysisEngine, StubLLM, parse_analysis_content
+from ats_extractor import experience_years, resume_text_from_prompt
+from candidate_profiles import CandidateProfileStore, compact_profile
+from jd_requirements import SAMPLE_JD, compile_locally
+from resume_dedup import content_hash
+from resume_store import iter_labeled_entries
+from text_normalizer import count_tokens, normalize_text
+
+# Prompt budget of one list-wise call, and the most candidates compared in one call
+LISTWISE_CONTEXT_TOKENS = int(os.getenv("LISTWISE_CONTEXT_TOKENS", "12000"))
+LISTWISE_MAX_GROUP = int(os.getenv("LISTWISE_MAX_GROUP", "10"))
+# Response tokens reserved per candidate in the budget
+OUTPUT_TOKENS_PER_CANDIDATE = 90
+
+SUB_SCORES = {
+    "technical_skills": 40,
+    "work_experience": 25,
+    "education_certifications": 15,
+    "soft_skills_training": 10,
+    "adaptability": 10,
+}
+
+LISTWISE_TEMPLATE = """
+        You are assisting HR professionals with shortlisting. Compare the candidates below against the job description and rank them from strongest to weakest match.
+
+        Job Description:
+        {job_description}
+
+        Candidates:
+        {candidates}
+
+        Score every candidate with the same rubric, judged relative to the other candidates: technical_skills out of 40, work_experience out of 25, education_certifications out of 15, soft_skills_training out of 10 and adaptability out of 10; score is their sum (0-100). Penalize a missing MUST-HAVE skill only if it is not easily learnable. Ranks start at 1 for the best match, have no ties, and every candidate ID appears exactly once. Respond with a single JSON object and nothing else:
+
+        {{
+            "rankings": [
+                {{
+                    "id": "Candidate ID, e.g. C1",
+                    "rank": 1,
+                    "score": "Total score (0-100)",
+                    "sub_scores": {{"technical_skills": 0, "work_experience": 0, "education_certifications": 0, "soft_skills_training": 0, "adaptability": 0}},
+                    "reason": "One sentence on the strengths or gaps that decided the rank"
+                }}
+            ]
+        }}
+
+        The ranking is advisory and meant to support, not replace, the human shortlisting decision.
+        """
+
+CANDIDATE_MARKER = re.compile(r"^\s*\[(C\d+)\]\s*$", re.MULTILINE)
+
+
+def render_candidates(profiles):
+    """Candidate block of the list-wise prompt; candidates get short group-local IDs C1..Cn"""
+    return "\n\n".join(f"[C{i + 1}]\n{profile}" for i, profile in enumerate(profiles))
+
+
+def build_listwise_prompt(jd_text, profiles):
+    return LISTWISE_TEMPLATE.format(job_description=jd_text, candidates=render_candidates(profiles))
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_rankings(content, size):
+    """
+    Rankings for a group of `size` candidates from a list-wise response, best first, as
+    dicts with "index" (position in the group), "score", "sub_scores" and "reason".
+    Candidates the model left out are appended last with an "error". Raises ValueError
+    when the response has no JSON or no rankings list.
+    """
+    rankings = parse_analysis_content(content).get("rankings")
+    if not isinstance(rankings, list):
+        raise ValueError("Response has no rankings list")
+    ranked = {}
+    for position, entry in enumerate(rankings):
+        if not isinstance(entry, dict):
+            continue
+        match = re.fullmatch(r"C?(\d+)", str(entry.get("id", "")).strip().upper())
+        index = int(match.group(1)) - 1 if match else -1
+        if not 0 <= index < size or index in ranked:
+            continue
+        rank = _number(entry.get("rank"))
+        ranked[index] = {
+            "index": index,
+            "score": _number(entry.get("score")),
+            "sub_scores": entry.get("sub_scores") or {},
+            "reason": entry.get("reason", ""),
+            "_order": (rank if rank is not None else math.inf, position),
+        }
+    ordered = sorted(ranked.values(), key=lambda r: r.pop("_order"))
+    ordered.extend(
+        {"index": i, "score": None, "sub_scores": {}, "reason": "", "error": "Candidate missing from response"}
+        for i in range(size) if i not in ranked
+    )
+    return ordered
+
+
+class RankingError(RuntimeError):
+    """A group could not be ranked, so the tournament cannot tell which of its candidates advance"""
+
+
+class ListwiseScorer:
+    """
+    Ranks candidates for one JD with several candidates per LLM call.
+
+    Compact profiles are packed into groups that fit `context_tokens` (at most
+    `max_group` each) and every group is ranked in one call. With more than one group,
+    a tournament follows: the top `advance` fraction of each group goes on to the next
+    round, regrouped with the other groups' survivors, until one group remains. The
+    final order is the last group's ranking, then candidates by the round they were
+    eliminated in (later first) and their relative position within their group.
+
+    Calls go through `engine`, so its hooks see every call and its cache (keyed on the
+    rendered prompt) serves repeated groups. A group whose call fails or cannot be
+    parsed raises RankingError rather than advancing candidates in input order.
+    """
+
+    def __init__(self, engine, context_tokens=LISTWISE_CONTEXT_TOKENS, max_group=LISTWISE_MAX_GROUP, advance=0.5,
+                 max_workers=None):
+        self.engine = engine
+        self.context_tokens = context_tokens
+        self.max_group = max_group
+        self.advance = advance
+        self.max_workers = max_workers or engine.max_workers
+
+    def pack(self, jd_text, candidates):
+        """
+        Split (candidate_id, profile_text) pairs into groups that fit the prompt budget,
+        in order. Group sizes are evened out so the last group is not a remainder.
+        """
+        budget = self.context_tokens - count_tokens(build_listwise_prompt(jd_text, []))
+        costs = [count_tokens(profile) + OUTPUT_TOKENS_PER_CANDIDATE + 4 for _, profile in candidates]
+
+        def greedy(limit):
+            groups, group, used = [], [], 0
+            for candidate, cost in zip(candidates, costs):
+                if group and (used + cost > budget or len(group) >= limit):
+                    groups.append(group)
+                    group, used = [], 0
+                group.append(candidate)
+                used += cost
+            if group:
+                groups.append(group)
+            return groups
+
+        groups = greedy(self.max_group)
+        return greedy(math.ceil(len(candidates) / len(groups))) if len(groups) > 1 else groups
+
+    def rank_group(self, jd_text, group):
+        """Rank one group in a single call; raises RankingError if the call fails or its answer has no rankings"""
+        prompt = build_listwise_prompt(jd_text, [profile for _, profile in group])
+        key = self.engine.cache_key(prompt)
+        rankings = self.engine.cached(key)
+        if rankings is None:
+            try:
+                rankings = parse_rankings(self.engine.invoke(prompt, key).content, len(group))
+            except Exception as e:
+                raise RankingError(f"Ranking a group of {len(group)} candidates failed: {str(e)}") from e
+            self.engine.remember(key, rankings)
+        return [dict(r, candidate_id=group[r["index"]][0]) for r in rankings]
+
+    def score_alone(self, jd_text, candidate):
+        """
+        Per-candidate analysis of a (candidate_id, profile_text) pair as a ranking entry, for
+        profiles too long to share a call; raises RankingError if the analysis fails
+        """
+        candidate_id, profile = candidate
+        result = self.engine.analyze(profile, jd_text)
+        analysis = result["analysis_json"]
+        if "error" in analysis:
+            raise RankingError(f"Scoring candidate {candidate_id} alone failed: {analysis['error']}")
+        match = re.search(r"\d+(?:\.\d+)?", str(result.get("matching_score", "")))
+        recommendation = analysis.get("recommendation")
+        return {
+            "candidate_id": candidate_id,
+            "score": float(match.group()) if match else None,
+            "sub_scores": analysis.get("scoring_details") or {},
+            "reason": recommendation.get("final_suggestion", "") if isinstance(recommendation, dict) else "",
+        }
+
+    def rank(self, jd_text, candidates):
+        """
+        Rank (candidate_id, profile_text) pairs best first. Each result has candidate_id,
+        rank, score, sub_scores, reason and the tournament round it was last ranked in;
+        scores are relative to the group the candidate was last compared in. When no two
+        remaining profiles fit one call, they are scored one by one and ordered by score.
+        Raises RankingError if any group or candidate cannot be scored.
+        """
+        jd_text = normalize_text(jd_text) if self.engine.normalize else jd_text
+        alive = [(cid, normalize_text(p) if self.engine.normalize else p) for cid, p in candidates]
+        eliminated = []
+        round_number = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Calls run in the caller's context, which carries its cost and scheduling labels
+            def run_all(function, items):
+                contexts = [contextvars.copy_context() for _ in items]
+                return list(executor.map(lambda context, item: context.run(function, jd_text, item), contexts, items))
+
+            while alive:
+                groups = self.pack(jd_text, alive)
+                if len(groups) > 1 and all(len(group) == 1 for group in groups):
+                    # No two of the remaining profiles fit one call: order them by per-candidate scores
+                    scored = sorted(run_all(self.score_alone, alive),
+                                    key=lambda r: -(r["score"] if r["score"] is not None else -1))
+                    final = [dict(r, round=round_number) for r in scored]
+                    break
+                results = run_all(self.rank_group, groups)
+                if len(groups) == 1:
+                    final = [dict(r, round=round_number) for r in results[0]]
+                    break
+                survivors = []
+                profiles = dict(alive)
+                for group_rankings in results:
+                    keep = max(1, math.ceil(len(group_rankings) * self.advance))
+                    survivors.extend((r["candidate_id"], profiles[r["candidate_id"]]) for r in group_rankings[:keep])
+                    eliminated.extend(
+                        ((round_number, (keep + i) / len(group_rankings), -(r["score"] or 0)), dict(r, round=round_number))
+                        for i, r in enumerate(group_rankings[keep:])
+                    )
+                alive = survivors
+                round_number += 1
+            else:
+                final = []
+
+        # Later rounds first; within a round, by relative position in the group, then score
+        eliminated.sort(key=lambda item: (-item[0][0],) + item[0][1:])
+        ranked = final + [result for _, result in eliminated]
+        for i, result in enumerate(ranked):
+            result["rank"] = i + 1
+            result.pop("index", None)
+        return ranked
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def kendall_tau(order_a, order_b):
+    """Kendall rank correlation of two orderings of the same IDs (1 = identical, -1 = reversed)"""
+    position = {cid: i for i, cid in enumerate(order_b)}
+    ranks = [position[cid] for cid in order_a]
+    n = len(ranks)
+    if n < 2:
+        return 1.0
+    concordant = sum(1 for i in range(n) for j in range(i + 1, n) if ranks[i] < ranks[j])
+    pairs = n * (n - 1) // 2
+    return (2 * concordant - pairs) / pairs
+
+
+def top_k_overlap(order_a, order_b, k=10):
+    return len(set(order_a[:k]) & set(order_b[:k])) / max(min(k, len(order_a)), 1)
+
+
+def _benchmark_quality(profile_text, must_have, nice_to_have):
+    """Hidden 'true' fit of a compact profile, which the stub LLMs observe with noise"""
+    text = profile_text.lower()
+    must = sum(skill.lower() in text for skill in must_have) / max(len(must_have), 1)
+    nice = sum(skill.lower() in text for skill in nice_to_have) / max(len(nice_to_have), 1)
+    experience = re.search(r"^Experience: (.*)$", profile_text, re.MULTILINE)
+    years = experience_years(experience.group(1)) if experience else float("nan")
+    return 60 * must + 20 * nice + 20 * min(0 if math.isnan(years) else years, 10) / 10
+
+
+def benchmark(jsonl_path, jd_text=SAMPLE_JD, candidates=120, noise=6.0, base_latency_ms=400.0, ms_per_1k_prompt=15.0,
+              ms_per_output_token=8.0, context_tokens=LISTWISE_CONTEXT_TOKENS, max_group=LISTWISE_MAX_GROUP,
+              excerpt_chars=800, workers=8):
+    """
+    Per-candidate scoring versus list-wise tournament ranking of the same compact profiles
+    against one JD, with stub LLMs that see each candidate's hidden fit plus Gaussian
+    noise (`noise` points) and take `base_latency_ms` plus prefill and decode time.
+    """
+    requirements = compile_locally(jd_text)
+    must_have, nice_to_have = requirements["must_have_skills"], requirements["nice_to_have_skills"]
+
+    entries = list(iter_labeled_entries(jsonl_path))
+    store = CandidateProfileStore(":memory:")
+    pool, seen = [], set()
+    for entry in entries:
+        text = resume_text_from_prompt(entry.get("prompt", ""))
+        profile = store.build(text)
+        if profile["resume_hash"] in seen:
+            continue
+        seen.add(profile["resume_hash"])
+        pool.append((profile["resume_hash"][:12], compact_profile(profile, excerpt_chars)))
+        if len(pool) == candidates:
+            break
+    store.close()
+    truth = {cid: _benchmark_quality(normalize_text(p), must_have, nice_to_have) for cid, p in pool}
+    true_order = sorted(truth, key=lambda cid: -truth[cid])
+    by_text = {normalize_text(p): cid for cid, p in pool}
+
+    def observe(cid, salt):
+        rng = random.Random(content_hash(f"{cid}:{salt}"))
+        return max(0.0, min(100.0, truth[cid] + rng.gauss(0, noise)))
+
+    def wait(prompt, response):
+        time.sleep((base_latency_ms + count_tokens(prompt) / 1000 * ms_per_1k_prompt
+                    + count_tokens(response) * ms_per_output_token) / 1000)
+        return response
+
+    def respond_single(prompt):
+        cv = prompt.split("CV:", 1)[1].rsplit("Job Description:", 1)[0].strip()
+        cid = by_text[cv]
+        score = round(observe(cid, "single"))
+        analysis = {
+            "candidate_name": cid, "contact_information": "N/A",
+            "matching_skills": [s for s in must_have + nice_to_have if s.lower() in cv.lower()],
+            "missing_skills": [s for s in must_have if s.lower() not in cv.lower()],
+            "work_experience": "Relevant backend experience with the listed responsibilities.",
+            "education": "Bachelor's degree in computer science.",
+            "soft_skills": ["communication", "teamwork"],
+            "training_experience": "Mentored junior engineers.",
+            "adaptability": "Strong fundamentals; missing tools look learnable.",
+            "scoring_details": {name: round(score * weight / 100) for name, weight in SUB_SCORES.items()},
+            "score": score,
+            "recommendation": {
+                "pros": "Covers most of the must-have stack and has shipped comparable services.",
+                "cons": "Some nice-to-have skills are missing but can be picked up during onboarding.",
+                "final_suggestion": "Shortlist for a technical interview; this recommendation is advisory.",
+            },
+        }
+        return wait(prompt, json.dumps(analysis))
+
+    def respond_listwise(prompt):
+        block = prompt.split("Candidates:", 1)[1].split("Score every candidate", 1)[0]
+        parts = CANDIDATE_MARKER.split(block)[1:]
+        group = [(label, by_text[text.strip()]) for label, text in zip(parts[::2], parts[1::2])]
+        salt = ",".join(cid for _, cid in group)
+        scored = sorted(((round(observe(cid, salt)), label) for label, cid in group), reverse=True)
+        rankings = [
+            {"id": label, "rank": rank + 1, "score": score,
+             "sub_scores": {name: round(score * weight / 100) for name, weight in SUB_SCORES.items()},
+             "reason": "Covers most must-have skills with relevant backend experience."}
+            for rank, (score, label) in enumerate(scored)
+        ]
+        return wait(prompt, json.dumps({"rankings": rankings}))
+
+    results = {}
+    for label in ("per-candidate", "list-wise"):
+        usage = {"prompt": 0, "output": 0}
+
+        def hook(event, **info):
+            if event == "llm_start":
+                usage["prompt"] += count_tokens(info["prompt"])
+            elif event == "llm_end":
+                usage["output"] += count_tokens(info["response"].content)
+
+        if label == "per-candidate":
+            llm = StubLLM(respond=respond_single)
+            engine = AnalysisEngine(llm, hooks=[hook], max_workers=workers)
+            started = time.perf_counter()
+            scored = engine.analyze_batch([(profile, jd_text) for _, profile in pool])
+            elapsed = time.perf_counter() - started
+            scores = {cid: float(r["matching_score"]) for (cid, _), r in zip(pool, scored)}
+            order = sorted(scores, key=lambda cid: -scores[cid])
+        else:
+            llm = StubLLM(respond=respond_listwise)
+            engine = AnalysisEngine(llm, hooks=[hook], max_workers=workers)
+            scorer = ListwiseScorer(engine, context_tokens=context_tokens, max_group=max_group)
+            started = time.perf_counter()
+            order = [r["candidate_id"] for r in scorer.rank(jd_text, pool)]
+            elapsed = time.perf_counter() - started
+        results[label] = (llm.calls, usage["prompt"], usage["output"], elapsed, order)
+
+    print(f"{len(pool)} candidates, one JD; stub latency {base_latency_ms:.0f} ms + {ms_per_1k_prompt} ms per 1k prompt "
+          f"tokens + {ms_per_output_token} ms per output token; noise {noise} points; {workers} workers")
+    print(f"{'':14s} {'calls':>6s} {'prompt tok':>11s} {'output tok':>11s} {'wall s':>7s} "
+          f"{'tau vs truth':>13s} {'top-10 vs truth':>16s}")
+    for label, (calls, prompt_tokens, output_tokens, elapsed, order) in results.items():
+        print(f"{label:14s} {calls:6d} {prompt_tokens:11d} {output_tokens:11d} {elapsed:7.2f} "
+              f"{kendall_tau(order, true_order):13.3f} {top_k_overlap(order, true_order):16.2f}")
+    single, listwise = results["per-candidate"][4], results["list-wise"][4]
+    print(f"Agreement between the two rankings: Kendall tau {kendall_tau(listwise, single):.3f}, "
+          f"top-10 overlap {top_k_overlap(listwise, single):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-candidate and list-wise scoring with stub LLMs")
+    parser.add_argument("jsonl_path", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("--candidates", type=int, default=120)
+    parser.add_argument("--noise", type=float, default=6.0)
+    parser.add_argument("--context-tokens", type=int, default=LISTWISE_CONTEXT_TOKENS)
+    parser.add_argument("--max-group", type=int, default=LISTWISE_MAX_GROUP)
+    parser.add_argument("--excerpt-chars", type=int, default=800)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+    benchmark(args.jsonl_path, candidates=args.candidates, noise=args.noise, context_tokens=args.context_tokens,
+              max_group=args.max_group, excerpt_chars=args.excerpt_chars, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,32 @@
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+import argparse
+import asyncio
 import os
+import re
+import time
+
+from analysis_engine import MemoryCache, StubLLM, create_llm
+from cost_ledger import MeteredLLM
+from vector_sync import chunk_hash
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 
+PROMPT_TEMPLATE = """
+            Context: {context}
+            Question: {question}
+            Answer the question based on the provided context. If the context doesn't contain enough information, say "I don't know."
+        """
+
+_llm = None
+
+
+def get_llm():
+    """Groq chat model shared by every chain in the process instead of one per create_chain call"""
+    global _llm
+    if _llm is None:
+        _llm = create_llm("groq", api_key=GROQ_KEY)
+    return _llm
+
+
 class ConversationChain:
     def __init__(self, retriever):
         if retriever is None:
@@ -12,23 +34,244 @@ class ConversationChain:
         self.retriever = retriever
 
     def create_chain(self):
-        # Define the prompt template for the language model
-        prompt_template = """
-            Context: {context}
-            Question: {question}
-            Answer the question based on the provided context. If the context doesn't contain enough information, say "I don't know."
-        """
+        from langchain.chains import RetrievalQA
+        from langchain.prompts import PromptTemplate
 
+        # Define the prompt template for the language model
         PROMPT = PromptTemplate(
-            template=prompt_template, input_variables=["context", "question"]
+            template=PROMPT_TEMPLATE, input_variables=["context", "question"]
         )
 
-        # Initialize the language model with specific parameters
-        llm = ChatGroq(temperature=0, groq_api_key=GROQ_KEY, model_name="llama-3.1-70b-versatile")
-
-        # Create a RetrievalQA chain using the language model and document retriever
+        # Create a RetrievalQA chain using the shared language model and document retriever
         return RetrievalQA.from_llm(
-            llm=llm, 
-            retriever=self.retriever, 
+            llm=get_llm(),
+            retriever=self.retriever,
             prompt=PROMPT
-        ) 
\ No newline at end of file
+        )
+
+
+def normalize_question(question):
+    """Case-, punctuation- and whitespace-insensitive form of a question, for cache keys"""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+
+def document_id(document):
+    """
+    Content hash of a retrieved chunk: the chunk_hash vector_sync stores in its metadata,
+    else a hash of its text. Vector IDs are positional ('<doc>#0007') and stay the same
+    when a re-synced chunk's text changes, so they would keep stale answers cached.
+    """
+    metadata = getattr(document, "metadata", None) or {}
+    return metadata.get("chunk_hash") or chunk_hash(document.page_content)
+
+
+class AsyncConversationChain:
+    """
+    Async retrieval Q&A over one candidate's documents.
+
+    Several questions run concurrently: retrieval for queued questions is prefetched
+    (up to `prefetch` retrievals in flight) while earlier questions wait on the LLM (up
+    to `concurrency` calls in flight). Answers are cached by the normalized question and
+    the IDs of the retrieved chunks, so a repeated question is answered without an LLM
+    call for as long as retrieval returns the same chunks.
+    """
+
+    def __init__(self, retriever, llm=None, cache=None, concurrency=4, prefetch=8):
+        if retriever is None:
+            raise ValueError("retriever cannot be None")
+        self.retriever = retriever
+        # Calls on the shared model are recorded in the cost ledger
+        self.llm = llm or MeteredLLM(get_llm(), operation="conversation")
+        self.cache = cache if cache is not None else MemoryCache()
+        self.concurrency = concurrency
+        self.prefetch = prefetch
+        self._llm_slots = None
+        self._retrieval_slots = None
+
+    def _slots(self):
+        # Semaphores bind to the running loop, so they are created on first use
+        if self._llm_slots is None:
+            self._llm_slots = asyncio.Semaphore(self.concurrency)
+            self._retrieval_slots = asyncio.Semaphore(self.prefetch)
+        return self._llm_slots, self._retrieval_slots
+
+    async def retrieve(self, question):
+        _, retrieval_slots = self._slots()
+        async with retrieval_slots:
+            if hasattr(self.retriever, "ainvoke"):
+                return await self.retriever.ainvoke(question)
+            return await asyncio.get_running_loop().run_in_executor(None, self.retriever.invoke, question)
+
+    @staticmethod
+    def cache_key(question, documents):
+        return (normalize_question(question), tuple(sorted(document_id(d) for d in documents)))
+
+    @staticmethod
+    def build_prompt(question, documents):
+        context = "\n\n".join(d.page_content for d in documents)
+        return PROMPT_TEMPLATE.format(context=context, question=question)
+
+    async def answer(self, question):
+        """Retrieve, then answer one question (from the cache when possible)"""
+        documents = await self.retrieve(question)
+        key = self.cache_key(question, documents)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        llm_slots, _ = self._slots()
+        async with llm_slots:
+            response = await self.llm.ainvoke(self.build_prompt(question, documents))
+        self.cache.set(key, response.content)
+        return response.content
+
+    async def astream(self, question):
+        """Yield the answer as it is generated; cached answers arrive in one piece"""
+        documents = await self.retrieve(question)
+        key = self.cache_key(question, documents)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        llm_slots, _ = self._slots()
+        parts = []
+        async with llm_slots:
+            if hasattr(self.llm, "astream"):
+                async for chunk in self.llm.astream(self.build_prompt(question, documents)):
+                    parts.append(chunk.content)
+                    yield chunk.content
+            else:
+                response = await self.llm.ainvoke(self.build_prompt(question, documents))
+                parts.append(response.content)
+                yield response.content
+        self.cache.set(key, "".join(parts))
+
+    async def answer_many(self, questions):
+        """Answer questions concurrently; results come back in input order"""
+        return await asyncio.gather(*(self.answer(q) for q in questions))
+
+    async def stream_many(self, questions):
+        """Stream several answers concurrently as (question index, text piece) pairs"""
+        queue = asyncio.Queue()
+
+        async def pump(index, question):
+            try:
+                async for piece in self.astream(question):
+                    await queue.put((index, piece))
+            finally:
+                await queue.put((index, None))
+
+        tasks = [asyncio.ensure_future(pump(i, q)) for i, q in enumerate(questions)]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                index, piece = await queue.get()
+                if piece is None:
+                    remaining -= 1
+                else:
+                    yield index, piece
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class StubDocument:
+    def __init__(self, page_content, metadata=None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+
+class StubRetriever:
+    """Offline retriever: returns the `k` chunks sharing the most words with the question after `delay` seconds"""
+
+    def __init__(self, chunks, k=2, delay=0.0):
+        self.documents = [StubDocument(chunk, {"id": f"chunk-{i}"}) for i, chunk in enumerate(chunks)]
+        self.k = k
+        self.delay = delay
+
+    def _rank(self, question):
+        words = set(normalize_question(question).split())
+        return sorted(self.documents, key=lambda d: -len(words & set(normalize_question(d.page_content).split())))[:self.k]
+
+    def invoke(self, question, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._rank(question)
+
+    async def ainvoke(self, question, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._rank(question)
+
+
+BENCHMARK_CHUNKS = [
+    "AWS Certified Solutions Architect - Associate, 2022. AWS Certified Developer, 2021.",
+    "Five years building Python and Flask services; led a team of four engineers.",
+    "B.E. in Computer Engineering, Pune University, 2017.",
+    "Built CI/CD pipelines with Docker, Kubernetes and GitHub Actions.",
+    "Mentored interns and ran weekly knowledge-sharing sessions.",
+]
+BENCHMARK_QUESTIONS = [
+    "Does this candidate have AWS certifications?",
+    "How many years of Python experience?",
+    "What degree does the candidate hold?",
+    "Has the candidate used Kubernetes?",
+    "Any mentoring experience?",
+    "Which CI/CD tools are mentioned?",
+    "Has the candidate led a team?",
+    "Which university did they attend?",
+]
+
+
+def benchmark(retrieval_ms=150.0, llm_ms=1200.0, concurrency=4):
+    """Sequential retrieve-then-answer versus the async chain, cold and warm, with stub backends"""
+    answer = "Yes. The context lists the relevant experience and certifications for this question."
+
+    def make_chain():
+        return AsyncConversationChain(StubRetriever(BENCHMARK_CHUNKS, delay=retrieval_ms / 1000),
+                                      llm=StubLLM(response=answer, delay=llm_ms / 1000), concurrency=concurrency)
+
+    questions = BENCHMARK_QUESTIONS
+    chain = make_chain()
+    started = time.perf_counter()
+    for question in questions:
+        documents = chain.retriever.invoke(question)
+        chain.llm.invoke(chain.build_prompt(question, documents))
+    sequential = time.perf_counter() - started
+
+    async def run():
+        chain = make_chain()
+        started = time.perf_counter()
+        await chain.answer_many(questions)
+        cold = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await chain.answer_many([q.upper() + "  " for q in questions])
+        warm = time.perf_counter() - started
+
+        streaming = make_chain()
+        first_piece = {}
+        started = time.perf_counter()
+        async for index, _ in streaming.stream_many(questions):
+            first_piece.setdefault(index, time.perf_counter() - started)
+        return cold, warm, sum(first_piece.values()) / len(first_piece), chain.llm.calls
+
+    cold, warm, first_token, calls = asyncio.run(run())
+    print(f"{len(questions)} questions; stub retrieval {retrieval_ms:.0f} ms, stub LLM {llm_ms:.0f} ms, concurrency {concurrency}")
+    print(f"Sequential (retrieve, then LLM)   {sequential:6.2f} s")
+    print(f"Async chain, cold cache           {cold:6.2f} s")
+    print(f"Async chain, repeated questions   {warm:6.2f} s  ({calls} LLM calls for {2 * len(questions)} questions)")
+    print(f"Streaming: mean time to first piece {first_token * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmark of the async Q&A chain with stub backends")
+    parser.add_argument("--retrieval-ms", type=float, default=150.0)
+    parser.add_argument("--llm-ms", type=float, default=1200.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    benchmark(args.retrieval_ms, args.llm_ms, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import json
+import operator
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import reduce
+
+from analysis_engine import StubLLM, StubMessage, model_name
+from metrics import token_usage
+from text_normalizer import count_tokens
+
+COST_LEDGER_DB = os.getenv("COST_LEDGER_DB", "cost_ledger.db")
+# Rows buffered before the writer thread commits them; it also commits every COST_LEDGER_FLUSH_SECONDS
+COST_LEDGER_BATCH = int(os.getenv("COST_LEDGER_BATCH", "64"))
+COST_LEDGER_FLUSH_SECONDS = float(os.getenv("COST_LEDGER_FLUSH_SECONDS", "1"))
+
+# USD per million tokens: (prompt, cached prompt, completion). LLM_PRICES (JSON of the same
+# shape) overrides or adds models; unknown models are recorded with a cost of 0.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "llama-3.1-70b-versatile": (0.59, 0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.05, 0.08),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    model TEXT NOT NULL,
+    operation TEXT,
+    jd TEXT,
+    api_key TEXT,
+    request_id TEXT,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    estimated INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    cost_usd REAL NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_calls_created_at ON llm_calls (created_at);
+"""
+
+# Columns a rollup can group by
+ROLLUPS = ("jd", "api_key", "model", "operation", "outcome")
+
+# Labels (operation, jd, api_key, request_id) that calls made in the current context are attributed to
+_attribution = contextvars.ContextVar("cost_attribution", default={})
+
+
+@contextmanager
+def attribute(**labels):
+    """Attribute LLM calls made inside the block (including nested threads that copy the context) to `labels`"""
+    token = set_attribution(**labels)
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def set_attribution(**labels):
+    """attribute() for code that cannot wrap a block, such as request hooks; returns a token for reset_attribution"""
+    return _attribution.set(dict(_attribution.get(), **{k: v for k, v in labels.items() if v is not None}))
+
+
+def reset_attribution(token):
+    _attribution.reset(token)
+
+
+def key_id(api_key):
+    """Short, non-reversible identifier of an API key for the ledger"""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def cached_tokens(response):
+    """Prompt tokens served from the provider's prompt cache, if the response reports them"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return (usage.get("input_token_details") or {}).get("cache_read", 0)
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    return (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+
+def cost_usd(model, prompt_tokens, completion_tokens, cached=0):
+    prompt_price, cached_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+    return ((prompt_tokens - cached) * prompt_price + cached * cached_price
+            + completion_tokens * completion_price) / 1_000_000
+
+
+def outcome_of(error):
+    """"rate_limited" for provider rate limits (HTTP 429), "timeout" or "error" for other failures"""
+    text = f"{type(error).__name__} {error}".lower()
+    if getattr(error, "status_code", None) == 429 or "rate limit" in text or "ratelimit" in text or "429" in text:
+        return "rate_limited"
+    return "timeout" if "timeout" in text else "error"
+
+
+class CostLedger:
+    """
+    Append-only SQLite ledger of LLM calls: tokens (prompt, completion, cached), latency,
+    cost and outcome, attributed to an operation, JD, API key and request.
+
+    record() only puts a row on a queue; a writer thread commits rows in batches, so a
+    call on the request path costs microseconds. The writer starts on first use in each
+    process, which keeps the ledger usable in gunicorn workers forked after it was made.
+    """
+
+    def __init__(self, path=COST_LEDGER_DB, batch=COST_LEDGER_BATCH, flush_seconds=COST_LEDGER_FLUSH_SECONDS):
+        self.path = path
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self._lock = threading.Lock()
+        with sqlite3.connect(path) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, args=(self._queue,), daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+                atexit.register(self.flush)
+
+    def _write_loop(self, rows):
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            pending, flushes = [], []
+            try:
+                item = rows.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            while True:
+                if isinstance(item, threading.Event):
+                    flushes.append(item)
+                else:
+                    pending.append(item)
+                if len(pending) >= self.batch:
+                    break
+                try:
+                    item = rows.get_nowait()
+                except queue.Empty:
+                    break
+            if pending:
+                try:
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO llm_calls (created_at, model, operation, jd, api_key, request_id, prompt_tokens,"
+                            " completion_tokens, cached_tokens, estimated, latency_ms, cost_usd, outcome)"
+                            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", pending)
+                except sqlite3.Error as e:
+                    print(f"Cost ledger write failed, {len(pending)} rows dropped: {e}")
+            for event in flushes:
+                event.set()
+
+    def record(self, model, prompt_tokens=0, completion_tokens=0, cached=0, latency=0.0, outcome="ok",
+               estimated=False, **labels):
+        """Queue one call; labels default to the current attribute() context"""
+        labels = dict(_attribution.get(), **{k: v for k, v in labels.items() if v is not None})
+        self._ensure_writer()
+        self._queue.put((
+            time.time(), model, labels.get("operation"), labels.get("jd"), key_id(labels.get("api_key")),
+            labels.get("request_id"), prompt_tokens, completion_tokens, cached, int(estimated),
+            round(latency * 1000, 1), cost_usd(model, prompt_tokens, completion_tokens, cached), outcome,
+        ))
+
+    def flush(self, timeout=5.0):
+        """Wait until every row queued so far is committed"""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def rollup(self, by="model", since=None, limit=100):
+        """
+        Totals grouped by one of ROLLUPS (calls, errors, rate limits, tokens, cost and
+        latency), most expensive first; `since` is a Unix time.
+        """
+        if by not in ROLLUPS:
+            raise ValueError(f"Unknown rollup '{by}'. Available: {', '.join(ROLLUPS)}")
+        with sqlite3.connect(self.path) as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                f"SELECT {by} AS name, COUNT(*) AS calls,"
+                " SUM(outcome != 'ok') AS errors, SUM(outcome = 'rate_limited') AS rate_limited,"
+                " SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens,"
+                " SUM(cached_tokens) AS cached_tokens, SUM(estimated) AS estimated_calls,"
+                " ROUND(SUM(cost_usd), 6) AS cost_usd, ROUND(AVG(latency_ms), 1) AS avg_latency_ms,"
+                " MAX(latency_ms) AS max_latency_ms"
+                " FROM llm_calls WHERE created_at >= ? GROUP BY 1 ORDER BY cost_usd DESC, calls DESC LIMIT ?",
+                (since or 0, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """Process-wide ledger at COST_LEDGER_DB"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = CostLedger()
+        return _ledger
+
+
+class MeteredLLM:
+    """
+    Drop-in wrapper around a chat model (invoke/ainvoke/astream) that records every
+    call in a CostLedger. Token counts come from the response's usage metadata; when
+    the provider reports none (stub models, some streams) they are estimated with
+    count_tokens and flagged as estimated. `labels` are defaults under attribute().
+    """
+
+    def __init__(self, llm, ledger=None, **labels):
+        self.llm = llm
+        self.ledger = ledger or get_ledger()
+        self.labels = labels
+
+    @property
+    def model_name(self):
+        return model_name(self.llm)
+
+    def _record(self, prompt, response, started, error=None):
+        latency = time.perf_counter() - started
+        labels = dict(self.labels, **_attribution.get())
+        if error is not None:
+            self.ledger.record(self.model_name, latency=latency, outcome=outcome_of(error), **labels)
+            return
+        prompt_tokens, completion_tokens = token_usage(response)
+        estimated = not (prompt_tokens or completion_tokens)
+        if estimated:
+            prompt_tokens, completion_tokens = count_tokens(str(prompt)), count_tokens(response.content or "")
+        self.ledger.record(self.model_name, prompt_tokens, completion_tokens, cached_tokens(response), latency,
+                           estimated=estimated, **labels)
+
+    def invoke(self, prompt, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.llm.invoke(prompt, **kwargs)
+        except Exception as e:
+            self._record(prompt, None, started, e)
+            raise
+        self._record(prompt, response, started)
+        return response
+
+    async def ainvoke(self, prompt, **kwargs):
+        started = time.perf_counter()
+        try:
+            if hasattr(self.llm, "ainvoke"):
+                response = await self.llm.ainvoke(prompt, **kwargs)
+            else:
+                context = contextvars.copy_context()
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: context.run(self.llm.invoke, prompt, **kwargs))
+        except Exception as e:
+            self._record(prompt, None, started, e)
+            raise
+        self._record(prompt, response, started)
+        return response
+
+    async def astream(self, prompt, **kwargs):
+        """Stream chunks through; the call is recorded once the stream ends"""
+        if not hasattr(self.llm, "astream"):
+            yield await self.ainvoke(prompt, **kwargs)
+            return
+        started = time.perf_counter()
+        chunks = []
+        try:
+            async for chunk in self.llm.astream(prompt, **kwargs):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            self._record(prompt, None, started, e)
+            raise
+        if chunks:
+            self._record(prompt, merge_chunks(chunks), started)
+
+
+def merge_chunks(chunks):
+    """One message from streamed chunks; LangChain chunks add up, usage metadata included"""
+    try:
+        return reduce(operator.add, chunks)
+    except TypeError:
+        return StubMessage("".join(chunk.content for chunk in chunks))
+
+
+# ---------------------------------------------------------------------------
+# Overhead benchmark
+# ---------------------------------------------------------------------------
+
+def benchmark(calls=5000):
+    """Per-call cost of metering a stub model, and the rollups it produces"""
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = CostLedger(os.path.join(directory, "ledger.db"))
+        llm = StubLLM(response=json.dumps({"score": 72, "recommendation": "Shortlist"}), model="gpt-4o")
+        metered = MeteredLLM(llm, ledger, operation="analyze")
+        prompt = "Score this resume against the job description. " * 40
+
+        started = time.perf_counter()
+        for i in range(calls):
+            llm.invoke(prompt)
+        bare = (time.perf_counter() - started) / calls
+
+        started = time.perf_counter()
+        for i in range(calls):
+            with attribute(jd=f"jd-{i % 7}", api_key=f"key-{i % 3}"):
+                metered.invoke(prompt)
+        timed = (time.perf_counter() - started) / calls
+        ledger.flush()
+
+        print(f"{calls} stub calls: {bare * 1e6:.1f} us bare, {timed * 1e6:.1f} us metered "
+              f"({(timed - bare) * 1e6:.1f} us per call, token counts estimated)")
+        for by in ("model", "jd"):
+            print(f"Rollup by {by}:")
+            for row in ledger.rollup(by):
+                print(f"  {row['name']:12s} {row['calls']:6d} calls {row['prompt_tokens']:9d} prompt "
+                      f"{row['completion_tokens']:7d} completion tokens  ${row['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM token and cost ledger")
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser("report", help="print rollups from COST_LEDGER_DB")
+    report_parser.add_argument("--by", choices=ROLLUPS, default="model")
+    report_parser.add_argument("--hours", type=float, help="only calls from the last HOURS")
+    bench_parser = subparsers.add_parser("benchmark", help="measure the per-call overhead of metering")
+    bench_parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.calls)
+    else:
+        by = getattr(args, "by", "model")
+        since = time.time() - args.hours * 3600 if getattr(args, "hours", None) else None
+        print(json.dumps(CostLedger().rollup(by, since), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import bisect
+import gzip
+import heapq
+import hashlib
+import json
+import os
+import re
+import time
+from array import array
+from itertools import islice
+from multiprocessing import Pool
+
+from resume_dedup import minhash_signature, shingles
+from resume_store import ATS_FIELDS, PROMPT_PREFIX, is_llm_labeled
+from text_normalizer import count_tokens, normalize_text
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+MISSING_VALUES = {"", "n/a", "na", "none", "null"}
+
+# Token-length histogram bucket upper bounds (powers of two up to 64k)
+TOKEN_BUCKETS = [2 ** i for i in range(4, 17)]
+
+
+def validate_completion(completion):
+    """
+    Parse and check a completion against the ATS schema produced by
+    resume_score.extract_ats_fields. Returns (fields, None) or (None, reason).
+    """
+    try:
+        fields = json.loads(completion) if isinstance(completion, str) else completion
+    except (TypeError, ValueError):
+        return None, "completion is not valid JSON"
+    if not isinstance(fields, dict):
+        return None, "completion is not a JSON object"
+    missing = [field for field in ATS_FIELDS if field not in fields]
+    if missing:
+        return None, f"missing fields: {', '.join(missing)}"
+    for field in ATS_FIELDS:
+        if not isinstance(fields[field], str):
+            return None, f"{field} is not a string"
+    email = fields["Email"].strip()
+    if email.lower() not in MISSING_VALUES and not EMAIL_PATTERN.match(email):
+        return None, "Email is not an email address"
+    return {field: fields[field].strip() for field in ATS_FIELDS}, None
+
+
+def process_line(line, bands=0):
+    """
+    Worker step for one JSONL line: parse, normalize, validate, hash and count tokens.
+    Returns a small dict so only compact results travel back to the writer.
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return {"error": "line is not valid JSON"}
+    prompt = entry.get("prompt", "")
+    resume_text = prompt[len(PROMPT_PREFIX):] if prompt.startswith(PROMPT_PREFIX) else prompt
+    resume_text = normalize_text(resume_text)
+    if not resume_text:
+        return {"error": "empty resume text"}
+
+    if not is_llm_labeled(entry):
+        return {"error": "labeled by the local extractor, not the LLM"}
+    fields, error = validate_completion(entry.get("completion"))
+    if error:
+        return {"error": error}
+
+    prompt = PROMPT_PREFIX + resume_text
+    completion = json.dumps(fields)
+    digest = hashlib.blake2b(resume_text.lower().encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    result = {
+        "prompt": prompt,
+        "completion": completion,
+        "hash": int.from_bytes(digest, "little"),
+        "prompt_tokens": count_tokens(prompt),
+        "completion_tokens": count_tokens(completion),
+    }
+    if bands:
+        # LSH band keys only; the full signature is not kept, which keeps near-duplicate
+        # detection memory at `bands` integers per resume
+        signature = minhash_signature(shingles(resume_text), bands * 8)
+        result["bands"] = [
+            int.from_bytes(hashlib.blake2b(repr((band, signature[band * 8:band * 8 + 8])).encode(), digest_size=8).digest(), "little")
+            for band in range(bands)
+        ]
+    return result
+
+
+def _process(args):
+    return process_line(*args)
+
+
+class HashSet:
+    """
+    Set of 64-bit hashes held as a few sorted array('Q') runs, 8 bytes per hash.
+    Each added run is merged into the previous one while it is at least half its
+    size, so there are O(log n) runs to probe and each hash is merged O(log n) times.
+    """
+
+    def __init__(self, hashes=()):
+        self.runs = []
+        self.add_run(hashes)
+
+    def __contains__(self, value):
+        for run in self.runs:
+            i = bisect.bisect_left(run, value)
+            if i < len(run) and run[i] == value:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def add_run(self, hashes):
+        run = array("Q", sorted(hashes))
+        if not run:
+            return
+        self.runs.append(run)
+        while len(self.runs) > 1 and len(self.runs[-1]) * 2 >= len(self.runs[-2]):
+            newer = self.runs.pop()
+            self.runs[-1] = array("Q", heapq.merge(self.runs[-1], newer))
+
+
+class TokenStats:
+    """Streaming token-length statistics with a fixed-size histogram"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.total = state.get("total", 0)
+        self.max = state.get("max", 0)
+        self.histogram = state.get("histogram", [0] * (len(TOKEN_BUCKETS) + 1))
+
+    def add(self, tokens):
+        self.count += 1
+        self.total += tokens
+        self.max = max(self.max, tokens)
+        index = next((i for i, bound in enumerate(TOKEN_BUCKETS) if tokens <= bound), len(TOKEN_BUCKETS))
+        self.histogram[index] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the histogram bucket holding the given percentile"""
+        target = fraction * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.histogram):
+            running += bucket_count
+            if running >= target and bucket_count:
+                return TOKEN_BUCKETS[i] if i < len(TOKEN_BUCKETS) else self.max
+        return 0
+
+    def state(self):
+        return {"count": self.count, "total": self.total, "max": self.max, "histogram": self.histogram}
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 1) if self.count else 0,
+            "p50_at_most": self.percentile(0.5),
+            "p95_at_most": self.percentile(0.95),
+            "max": self.max,
+        }
+
+
+class DatasetBuilder:
+    """
+    Streams a labeled JSONL file into gzip-compressed train/eval shards.
+
+    Input is consumed `shard_size` lines at a time; each batch is processed by a
+    process pool, written as one train and one eval shard, and then checkpointed
+    (input byte offset, counters, token statistics and the hashes seen so far).
+    A rerun with the same output directory resumes after the last checkpoint.
+    Memory is bounded by one batch plus the seen hashes, 8 bytes each in a HashSet:
+    one per kept resume, plus `bands` more when near-duplicate detection is on.
+    """
+
+    def __init__(self, input_file, output_dir, eval_percent=10, shard_size=10000,
+                 processes=None, near_duplicate_bands=0):
+        self.input_file = input_file
+        self.output_dir = output_dir
+        self.eval_percent = eval_percent
+        self.shard_size = shard_size
+        self.processes = processes
+        self.bands = near_duplicate_bands
+        self.checkpoint_path = os.path.join(output_dir, "checkpoint.json")
+        self.seen_path = os.path.join(output_dir, "seen_hashes.bin")
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {"offset": 0, "shard": 0, "counts": {}, "tokens": {}}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _load_seen(self, count):
+        seen = array("Q")
+        if os.path.exists(self.seen_path):
+            with open(self.seen_path, "rb") as f:
+                seen.frombytes(f.read(count * seen.itemsize))
+        return HashSet(seen)
+
+    def _write_checkpoint(self, checkpoint):
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(checkpoint, f, indent=4)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _read_batches(self, offset):
+        """Yield (lines, end_offset) batches of raw lines starting at a byte offset"""
+        with open(self.input_file, "rb") as f:
+            f.seek(offset)
+            while True:
+                lines = list(islice(f, self.shard_size))
+                if not lines:
+                    return
+                offset += sum(len(line) for line in lines)
+                yield [line.decode("utf-8") for line in lines if line.strip()], offset
+
+    def _is_eval(self, resume_hash):
+        return resume_hash % 100 < self.eval_percent
+
+    def build(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint = self._load_checkpoint()
+        counts = checkpoint["counts"]
+        seen_count = counts.get("seen_hashes", 0)
+        seen = self._load_seen(seen_count)
+        # Drop any hashes appended after the last checkpoint by an interrupted run
+        with open(self.seen_path, "ab") as f:
+            f.truncate(seen_count * array("Q").itemsize)
+        stats = {split: TokenStats(checkpoint["tokens"].get(split)) for split in ("train", "eval")}
+
+        started = time.perf_counter()
+        with Pool(self.processes) as pool, open(self.seen_path, "ab") as seen_file:
+            for lines, end_offset in self._read_batches(checkpoint["offset"]):
+                shard = checkpoint["shard"]
+                writers = {
+                    split: gzip.open(os.path.join(self.output_dir, f"{split}-{shard:05d}.jsonl.gz"), "wt", encoding="utf-8")
+                    for split in ("train", "eval")
+                }
+                # Hashes kept in this batch; merged into `seen` at the checkpoint
+                new_hashes = set()
+                try:
+                    for result in pool.imap(_process, ((line, self.bands) for line in lines), chunksize=64):
+                        counts["read"] = counts.get("read", 0) + 1
+                        if "error" in result:
+                            counts["invalid"] = counts.get("invalid", 0) + 1
+                            continue
+                        keys = [result["hash"]] + result.get("bands", [])
+                        if any(key in new_hashes or key in seen for key in keys):
+                            counts["duplicates"] = counts.get("duplicates", 0) + 1
+                            continue
+                        new_hashes.update(keys)
+
+                        split = "eval" if self._is_eval(result["hash"]) else "train"
+                        writers[split].write(json.dumps({"prompt": result["prompt"], "completion": result["completion"]}) + "\n")
+                        stats[split].add(result["prompt_tokens"] + result["completion_tokens"])
+                        counts[split] = counts.get(split, 0) + 1
+                finally:
+                    for writer in writers.values():
+                        writer.close()
+
+                seen.add_run(new_hashes)
+                seen_file.write(array("Q", new_hashes).tobytes())
+                seen_file.flush()
+                counts["seen_hashes"] = counts.get("seen_hashes", 0) + len(new_hashes)
+                checkpoint.update({
+                    "offset": end_offset,
+                    "shard": shard + 1,
+                    "counts": counts,
+                    "tokens": {split: s.state() for split, s in stats.items()},
+                })
+                self._write_checkpoint(checkpoint)
+                print(f"Shard {shard:05d}: {counts.get('read', 0)} read, {counts.get('train', 0)} train, "
+                      f"{counts.get('eval', 0)} eval, {counts.get('duplicates', 0)} duplicates, "
+                      f"{counts.get('invalid', 0)} invalid")
+
+        summary = {
+            "input": os.path.basename(self.input_file),
+            "shards": checkpoint["shard"],
+            "counts": {key: value for key, value in counts.items() if key != "seen_hashes"},
+            "tokens": {split: s.summary() for split, s in stats.items()},
+            "seconds_this_run": round(time.perf_counter() - started, 2),
+        }
+        with open(os.path.join(self.output_dir, "stats.json"), "w") as f:
+            json.dump(summary, f, indent=4)
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build sharded train/eval fine-tuning data from labeled resumes")
+    parser.add_argument("input_file", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("output_dir", nargs="?", default="finetune_dataset")
+    parser.add_argument("--eval-percent", type=int, default=10)
+    parser.add_argument("--shard-size", type=int, default=10000, help="input lines per shard/checkpoint")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--near-duplicate-bands", type=int, default=0,
+                        help="LSH bands for near-duplicate removal (0 = exact duplicates only)")
+    args = parser.parse_args()
+
+    builder = DatasetBuilder(args.input_file, args.output_dir, args.eval_percent, args.shard_size,
+                             args.processes, args.near_duplicate_bands)
+    summary = builder.build()
+    print(json.dumps(summary, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import gc
+import os
+
+from server_tuning import gunicorn_settings
+
+# Workers and threads follow the CPU and memory limits of the container and the memory
+# measured by `python server_tuning.py measure`; `python server_tuning.py show` prints them
+settings = gunicorn_settings()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = settings["worker_class"]
+workers = settings["workers"]
+threads = settings["threads"]
+timeout = settings["timeout"]
+graceful_timeout = 30
+keepalive = 5
+# Import the app (templates, ATS model, LLM clients) once in the master; workers share it copy-on-write
+preload_app = True
+# Recycle workers now and then so slow growth in one worker cannot use up the memory budget
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def when_ready(server):
+    import app
+    app.warm_up()
+    # Move everything built so far out of the collector's reach, so collections in the
+    # workers do not write to (and un-share) the preloaded pages
+    gc.freeze()
+    server.log.info(f"{workers} {worker_class} workers x {threads} threads "
+                    f"(planned {settings['planned_mb']} MB of a {settings['budget_mb']} MB budget)")
+    if workers > 1:
+        server.log.warning("/metrics, the LLM scheduler and the circuit breakers are per worker: each scrape "
+                           "sees one worker and recruiters are queued fairly only within a worker")
+
+
+def post_fork(server, worker):
+    import app
+    app.candidate_profiles.reopen()
+    app.resume_index.reopen()
@@ -0,0 +1,344 @@
+import argparse
+import json
+import math
+import os
+import random
+import re
+import time
+from array import array
+from operator import mul
+
+from shared_embeddings import map_floats
+from text_normalizer import normalize_text
+
+# numpy makes a query over thousands of JDs take milliseconds; without it the same
+# search runs in pure Python, which is fine for small indexes
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+JD_INDEX_DIR = os.environ.get("JD_INDEX_DIR", "jd_index")
+EMBEDDING_DIM = 768
+
+SENIORITY_LEVELS = ["intern", "junior", "mid", "senior", "lead"]
+SENIORITY_PATTERNS = [
+    ("intern", re.compile(r"\bintern(ship)?\b|\btrainee\b", re.IGNORECASE)),
+    ("lead", re.compile(r"\b(lead|principal|staff|head|manager|director|architect)\b", re.IGNORECASE)),
+    ("senior", re.compile(r"\b(senior|sr\.?)\b", re.IGNORECASE)),
+    ("junior", re.compile(r"\b(junior|jr\.?|entry[- ]level|fresher|graduate)\b", re.IGNORECASE)),
+]
+
+
+def infer_seniority(title, min_years=None):
+    """Seniority from the job title, else from the minimum years of experience"""
+    for level, pattern in SENIORITY_PATTERNS:
+        if pattern.search(title or ""):
+            return level
+    if min_years is None:
+        return "mid"
+    if min_years < 2:
+        return "junior"
+    return "senior" if min_years >= 5 else "mid"
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
+
+def mean_pool(embeddings):
+    """L2-normalized mean of L2-normalized chunk embeddings"""
+    embeddings = [_normalize(e) for e in embeddings]
+    return _normalize([sum(column) / len(embeddings) for column in zip(*embeddings)])
+
+
+def _dot(a, b):
+    return sum(map(mul, a, b))
+
+
+class JDIndex:
+    """
+    Local reverse-search index over job descriptions. Each JD keeps a mean-pooled
+    embedding plus its chunk embeddings, and metadata (title, location, seniority).
+
+    search() filters on metadata, ranks every remaining JD by cosine similarity of the
+    mean-pooled vectors, then re-ranks the best `candidates` by max-sim: for each resume
+    chunk, its best-matching JD chunk, averaged over resume chunks.
+
+    On disk: meta.jsonl (one JD per line, with its chunk offset), mean.f32 and chunks.f32
+    (raw float32 matrices). load() maps the matrices read-only, so every gunicorn worker
+    searching the same index shares one copy; the first add() or compact() copies them.
+    """
+
+    def __init__(self, path=JD_INDEX_DIR, dim=EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.meta = []
+        self.ids = {}
+        self._means = array("f")
+        self._chunks = array("f")
+        self._matrices = None
+        self._columns = {}
+        if path and os.path.exists(os.path.join(path, "meta.jsonl")):
+            self.load()
+
+    def __len__(self):
+        return len(self.meta)
+
+    def add(self, jd_id, chunk_embeddings, title="", location="", seniority=None, min_years=None, **extra):
+        """Add or replace one JD; `chunk_embeddings` is a list of vectors of length `dim`"""
+        if not chunk_embeddings:
+            raise ValueError(f"JD {jd_id} has no chunk embeddings")
+        if any(len(e) != self.dim for e in chunk_embeddings):
+            raise ValueError(f"JD {jd_id} embeddings must have {self.dim} dimensions")
+        if jd_id in self.ids:
+            self.remove(jd_id)
+        # Cached numpy views export the arrays' buffers, which then cannot grow
+        self._matrices = None
+        self._columns = {}
+        self._writable()
+        entry = dict(extra, id=jd_id, title=title, location=(location or "").strip().lower(),
+                     seniority=seniority or infer_seniority(title, min_years),
+                     chunk_offset=len(self._chunks) // self.dim, chunk_count=len(chunk_embeddings))
+        self.ids[jd_id] = len(self.meta)
+        self.meta.append(entry)
+        self._means.extend(mean_pool(chunk_embeddings))
+        for embedding in chunk_embeddings:
+            self._chunks.extend(_normalize(embedding))
+
+    def remove(self, jd_id):
+        """Drop a JD; its chunk rows are reclaimed on the next compact()"""
+        row = self.ids.pop(jd_id)
+        self.meta[row]["removed"] = True
+
+    def _writable(self):
+        """Copy memory-mapped matrices into arrays before the first change"""
+        for attribute in ("_means", "_chunks"):
+            values = getattr(self, attribute)
+            if not isinstance(values, array):
+                copy = array("f")
+                copy.frombytes(values.cast("B"))
+                setattr(self, attribute, copy)
+
+    def compact(self):
+        """Rewrite the matrices without removed JDs"""
+        self._matrices = None
+        self._columns = {}
+        self._writable()
+        old_meta, old_means, old_chunks = self.meta, self._means, self._chunks
+        self.meta, self.ids, self._means, self._chunks = [], {}, array("f"), array("f")
+        for row, entry in enumerate(old_meta):
+            if entry.get("removed"):
+                continue
+            start = entry["chunk_offset"] * self.dim
+            chunk_values = old_chunks[start:start + entry["chunk_count"] * self.dim]
+            entry = dict(entry, chunk_offset=len(self._chunks) // self.dim)
+            self.ids[entry["id"]] = len(self.meta)
+            self.meta.append(entry)
+            self._means.extend(old_means[row * self.dim:(row + 1) * self.dim])
+            self._chunks.extend(chunk_values)
+        self._matrices = None
+        self._columns = {}
+
+    def save(self):
+        self.compact()
+        os.makedirs(self.path, exist_ok=True)
+        for name, values in (("mean.f32", self._means), ("chunks.f32", self._chunks)):
+            with open(os.path.join(self.path, f"{name}.tmp"), "wb") as f:
+                values.tofile(f)
+            os.replace(os.path.join(self.path, f"{name}.tmp"), os.path.join(self.path, name))
+        with open(os.path.join(self.path, "meta.jsonl.tmp"), "w", encoding="utf-8") as f:
+            for entry in self.meta:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(os.path.join(self.path, "meta.jsonl.tmp"), os.path.join(self.path, "meta.jsonl"))
+
+    def load(self):
+        with open(os.path.join(self.path, "meta.jsonl"), "r", encoding="utf-8") as f:
+            self.meta = [json.loads(line) for line in f if line.strip()]
+        self.ids = {entry["id"]: row for row, entry in enumerate(self.meta)}
+        self._means = map_floats(os.path.join(self.path, "mean.f32"))
+        self._chunks = map_floats(os.path.join(self.path, "chunks.f32"))
+        self._matrices = None
+        self._columns = {}
+
+    def _numpy_matrices(self):
+        if self._matrices is None:
+            self._matrices = (
+                np.frombuffer(self._means, dtype=np.float32).reshape(-1, self.dim),
+                np.frombuffer(self._chunks, dtype=np.float32).reshape(-1, self.dim),
+            )
+        return self._matrices
+
+    def _column(self, key):
+        """Lower-cased metadata values for one key, cached until the index changes"""
+        if key not in self._columns:
+            self._columns[key] = [str(entry.get(key, "")).lower() for entry in self.meta]
+        return self._columns[key]
+
+    def _rows(self, filters):
+        """Row numbers of live JDs matching every filter (None for all rows); list values match any item"""
+        filters = {
+            key: {str(v).lower() for v in (value if isinstance(value, (list, tuple, set)) else [value])}
+            for key, value in (filters or {}).items() if value
+        }
+        removed = len(self.ids) != len(self.meta)
+        if not filters and not removed:
+            return None
+        rows = range(len(self.meta))
+        if removed:
+            rows = [row for row in rows if not self.meta[row].get("removed")]
+        for key, values in filters.items():
+            column = self._column(key)
+            rows = [row for row in rows if column[row] in values]
+        return rows
+
+    def search(self, resume_embeddings, top_n=10, filters=None, mode="maxsim", candidates=200):
+        """
+        Return [(jd_id, score, metadata)] for the `top_n` JDs best matching a resume's
+        chunk embeddings. `mode` is "mean" (pooled cosine only) or "maxsim" (re-ranked).
+        """
+        if not self.meta or not resume_embeddings:
+            return []
+        rows = self._rows(filters)
+        if rows is not None and not rows:
+            return []
+        query = mean_pool(resume_embeddings)
+        resume_chunks = [_normalize(e) for e in resume_embeddings]
+
+        if np is not None:
+            means, chunks = self._numpy_matrices()
+            if rows is None:
+                rows = range(len(self.meta))
+                scores = means @ np.asarray(query, dtype=np.float32)
+            else:
+                scores = means[np.asarray(rows)] @ np.asarray(query, dtype=np.float32)
+            keep = min(len(rows), candidates if mode == "maxsim" else top_n)
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            ranked = [(rows[i], float(scores[i])) for i in best]
+            if mode == "maxsim":
+                resume_matrix = np.asarray(resume_chunks, dtype=np.float32)
+                ranked = [
+                    (row, float((resume_matrix @ chunks[self.meta[row]["chunk_offset"]:
+                                                        self.meta[row]["chunk_offset"] + self.meta[row]["chunk_count"]].T)
+                                .max(axis=1).mean()))
+                    for row, _ in ranked
+                ]
+        else:
+            rows = range(len(self.meta)) if rows is None else rows
+            ranked = [(row, _dot(query, self._means[row * self.dim:(row + 1) * self.dim])) for row in rows]
+            ranked.sort(key=lambda item: -item[1])
+            ranked = ranked[:candidates if mode == "maxsim" else top_n]
+            if mode == "maxsim":
+                rescored = []
+                for row, _ in ranked:
+                    start = self.meta[row]["chunk_offset"] * self.dim
+                    jd_chunks = [self._chunks[start + i * self.dim:start + (i + 1) * self.dim]
+                                 for i in range(self.meta[row]["chunk_count"])]
+                    rescored.append((row, sum(max(_dot(r, c) for c in jd_chunks) for r in resume_chunks) / len(resume_chunks)))
+                ranked = rescored
+
+        ranked.sort(key=lambda item: -item[1])
+        return [(self.meta[row]["id"], score, self.meta[row]) for row, score in ranked[:top_n]]
+
+
+def add_jd_text(index, jd_id, jd_text, embed, chunker, location="", compiler=None, **extra):
+    """Chunk, embed and add one JD; title and minimum years come from the JD compiler when given"""
+    text = normalize_text(jd_text)
+    title, min_years = text.split("\n", 1)[0][:80], None
+    if compiler is not None:
+        try:
+            requirements, _ = compiler.compile(jd_text)
+            title = requirements.get("title") or title
+            min_years = requirements.get("min_years_experience")
+        except ValueError as e:
+            print(f"Could not compile JD {jd_id}, indexing it without minimum years: {str(e)}")
+    index.add(jd_id, embed(chunker(text)), title=title, location=location, min_years=min_years, **extra)
+
+
+def shortlist_and_score(resume_text, index, engine, embed, chunker, jd_texts, top_n=50, score_top=5, filters=None):
+    """
+    Rank JDs for a resume locally, then send only the best `score_top` to full LLM scoring.
+    `jd_texts` maps JD id to its text. Returns [(jd_id, similarity, analysis or None)].
+    """
+    matches = index.search(embed(chunker(normalize_text(resume_text))), top_n=top_n, filters=filters)
+    pairs = [(resume_text, jd_texts[jd_id]) for jd_id, _, _ in matches[:score_top]]
+    analyses = engine.analyze_batch(pairs) if pairs else []
+    return [
+        (jd_id, score, analyses[i] if i < len(analyses) else None)
+        for i, (jd_id, score, _) in enumerate(matches)
+    ]
+
+
+def benchmark(jds=5000, chunks_per_jd=4, resume_chunks=4, dim=EMBEDDING_DIM, queries=20, seed=7):
+    """Query latency over a synthetic index of random unit vectors"""
+    rng = random.Random(seed)
+    index = JDIndex(path=None, dim=dim)
+    locations = ["pune", "mumbai", "bengaluru", "remote"]
+    started = time.perf_counter()
+    for i in range(jds):
+        index.add(f"jd-{i}", [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(chunks_per_jd)],
+                  title=f"Role {i}", location=locations[i % len(locations)], seniority=SENIORITY_LEVELS[i % 5])
+    build_time = time.perf_counter() - started
+
+    resumes = [[[rng.gauss(0, 1) for _ in range(dim)] for _ in range(resume_chunks)] for _ in range(queries)]
+    print(f"{jds} JDs x {chunks_per_jd} chunks, {dim} dims, built in {build_time:.1f} s; "
+          f"{'numpy' if np is not None else 'pure Python (install numpy for millisecond queries)'}")
+    for label, kwargs in (("mean-pooled", {"mode": "mean"}),
+                          ("max-sim re-rank", {"mode": "maxsim"}),
+                          ("filtered + max-sim", {"mode": "maxsim", "filters": {"location": "pune", "seniority": "senior"}})):
+        index.search(resumes[0], **kwargs)
+        started = time.perf_counter()
+        for resume in resumes:
+            index.search(resume, top_n=10, **kwargs)
+        print(f"{label:20s} {(time.perf_counter() - started) / queries * 1000:8.2f} ms per query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reverse search: the best-matching JDs for a resume")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="embed and index JD PDFs")
+    add.add_argument("pdfs", nargs="+")
+    add.add_argument("--location", default="")
+    search = subparsers.add_parser("search", help="top JDs for a resume PDF")
+    search.add_argument("resume")
+    search.add_argument("--top", type=int, default=10)
+    search.add_argument("--location")
+    search.add_argument("--seniority", choices=SENIORITY_LEVELS)
+    search.add_argument("--mode", choices=["mean", "maxsim"], default="maxsim")
+    bench = subparsers.add_parser("benchmark", help="query latency on a synthetic index")
+    bench.add_argument("--jds", type=int, default=5000)
+    bench.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.jds, dim=args.dim)
+        return
+
+    from document_search import generate_embeddings
+    from jd_requirements import JDCompiler
+    from pdf_processor import extract_text_from_pdf
+    from text_splitter import split_text
+
+    index = JDIndex()
+    if args.command == "add":
+        compiler = JDCompiler()
+        for pdf in args.pdfs:
+            add_jd_text(index, os.path.basename(pdf), extract_text_from_pdf(pdf), generate_embeddings, split_text,
+                        location=args.location, compiler=compiler, source=pdf)
+        index.save()
+        print(f"Indexed {len(args.pdfs)} JDs; {len(index)} in {index.path}")
+    else:
+        resume_text = normalize_text(extract_text_from_pdf(args.resume))
+        started = time.perf_counter()
+        embeddings = generate_embeddings(split_text(resume_text))
+        embedded = time.perf_counter()
+        matches = index.search(embeddings, top_n=args.top, mode=args.mode,
+                               filters={"location": args.location, "seniority": args.seniority})
+        print(f"Embedding {(embedded - started) * 1000:.0f} ms, search {(time.perf_counter() - embedded) * 1000:.1f} ms")
+        for jd_id, score, meta in matches:
+            print(f"{score:.3f}  {jd_id}  {meta['title']}  [{meta['location'] or '-'}, {meta['seniority']}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import re
+import time
+
+from analysis_engine import ANALYSIS_TEMPLATE, COMPILED_JD_TEMPLATE, AnalysisEngine, StubLLM, parse_analysis_content
+from ats_extractor import ATS_MODEL_PATH, ATSExtractor, load_extractor, ngrams, resume_text_from_prompt, tokenize
+from resume_dedup import content_hash
+from resume_store import iter_labeled_entries
+from text_normalizer import count_tokens, normalize_text
+
+# Bump when the compile prompt or the requirements shape changes; older cache entries are then ignored
+REQUIREMENTS_VERSION = 2
+JD_CACHE_DIR = os.environ.get("JD_CACHE_DIR", "jd_cache")
+# Seconds a local fallback is reused after the LLM fails to compile a JD, before the LLM is tried again
+JD_FALLBACK_TTL = float(os.environ.get("JD_FALLBACK_TTL", "300"))
+
+REQUIREMENT_FIELDS = ["title", "must_have_skills", "nice_to_have_skills", "min_years_experience",
+                      "required_degree", "certifications"]
+
+COMPILE_TEMPLATE = """
+        Extract the hiring requirements from this job description. Respond with a single JSON object and nothing else:
+
+        {{
+            "title": "Job title",
+            "must_have_skills": ["Skills stated as required or essential"],
+            "nice_to_have_skills": ["Skills stated as preferred, desirable or a plus"],
+            "min_years_experience": "Minimum years of experience as a number, or null",
+            "required_degree": "Minimum degree and field, or null",
+            "certifications": ["Required or preferred certifications"]
+        }}
+
+        Job Description:
+        {job_description}
+        """
+
+NICE_TO_HAVE_HEADER = re.compile(r"prefer|nice to have|good to have|desirable|bonus|\bplus\b|advantage", re.IGNORECASE)
+MUST_HAVE_HEADER = re.compile(r"require|must|essential|qualification|mandatory|what you.ll need", re.IGNORECASE)
+MIN_YEARS_PATTERN = re.compile(r"(\d{1,2})\s*\+?\s*(?:-\s*\d{1,2}\s*)?(?:years?|yrs?)", re.IGNORECASE)
+DEGREE_PATTERN = re.compile(
+    r"(?:bachelor|master|ph\.?d|doctorate|b\.?\s?tech|b\.?e\b|m\.?\s?tech|mba|bsc|msc|b\.?sc|m\.?sc|degree|diploma)[^.;\n]{0,80}",
+    re.IGNORECASE,
+)
+CERTIFICATION_PATTERN = re.compile(r"[^.;\n]{0,60}certifi[^.;\n]{0,60}", re.IGNORECASE)
+
+
+def jd_key(jd_text):
+    """Cache key of a JD: content hash of its normalized text plus the compiler version"""
+    return f"{content_hash(normalize_text(jd_text))}.v{REQUIREMENTS_VERSION}"
+
+
+def compile_locally(jd_text, extractor=None):
+    """
+    Regex and skill-vocabulary compilation, used without an LLM or when the LLM's answer
+    cannot be parsed. Skills under a 'preferred / nice to have' heading are optional.
+    Raises ValueError if no skills are found, as clean_requirements does.
+    """
+    extractor = extractor or load_extractor() or ATSExtractor()
+    text = normalize_text(jd_text)
+    must_have, nice_to_have = [], []
+    optional = False
+    for line in text.split("\n"):
+        if len(line) < 60 and NICE_TO_HAVE_HEADER.search(line):
+            optional = True
+        elif len(line) < 60 and MUST_HAVE_HEADER.search(line):
+            optional = False
+        found = [extractor.skills[gram][1] for _, gram in ngrams(tokenize(line)) if gram in extractor.skills]
+        target = nice_to_have if optional or NICE_TO_HAVE_HEADER.search(line) else must_have
+        target.extend(skill for skill in found if skill not in must_have and skill not in nice_to_have)
+
+    years = [int(m.group(1)) for m in MIN_YEARS_PATTERN.finditer(text) if int(m.group(1)) <= 20]
+    degree = DEGREE_PATTERN.search(text)
+    certifications = [m.group().strip(" -,") for m in CERTIFICATION_PATTERN.finditer(text)]
+    if not must_have and not nice_to_have:
+        raise ValueError("no skills were extracted")
+    return {
+        "title": text.split("\n", 1)[0][:80] if text else None,
+        "must_have_skills": must_have,
+        "nice_to_have_skills": nice_to_have,
+        # "5+ years of experience, 3+ years with Python" needs 5
+        "min_years_experience": max(years) if years else None,
+        "required_degree": degree.group().strip() if degree else None,
+        "certifications": certifications[:5],
+    }
+
+
+def clean_requirements(requirements):
+    """Coerce an LLM answer into the requirements shape; raises ValueError if it is not usable"""
+    if not isinstance(requirements, dict):
+        raise ValueError("requirements are not a JSON object")
+    cleaned = {}
+    for field in ("must_have_skills", "nice_to_have_skills", "certifications"):
+        value = requirements.get(field) or []
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",")]
+        cleaned[field] = [str(item).strip() for item in value if str(item).strip()]
+    years = requirements.get("min_years_experience")
+    try:
+        cleaned["min_years_experience"] = float(years) if years not in (None, "", "null") else None
+    except (TypeError, ValueError):
+        match = MIN_YEARS_PATTERN.search(str(years))
+        cleaned["min_years_experience"] = float(match.group(1)) if match else None
+    for field in ("title", "required_degree"):
+        value = requirements.get(field)
+        cleaned[field] = str(value).strip() if value not in (None, "", "null") else None
+    if not cleaned["must_have_skills"] and not cleaned["nice_to_have_skills"]:
+        raise ValueError("no skills were extracted")
+    return cleaned
+
+
+def render_requirements(requirements):
+    """Compact text passed to the scoring prompt in place of the full JD"""
+    return json.dumps({field: requirements.get(field) for field in REQUIREMENT_FIELDS}, separators=(",", ":"))
+
+
+class JDCompiler:
+    """
+    Compiles a job description once into a requirements object and caches it on disk
+    by JD hash and REQUIREMENTS_VERSION, so every candidate scored against the JD
+    reuses it. Uses the LLM when one is given, otherwise compile_locally.
+
+    Requirements record which compiler produced them. When the LLM fails and the local
+    compiler stands in, the result is only kept in memory for `fallback_ttl` seconds and
+    the LLM is tried again after that; with an LLM, local results on disk are recompiled.
+    """
+
+    def __init__(self, llm=None, cache_dir=JD_CACHE_DIR, extractor=None, fallback_ttl=JD_FALLBACK_TTL):
+        self.llm = llm
+        self.cache_dir = cache_dir
+        self.extractor = extractor
+        self.fallback_ttl = fallback_ttl
+        self._memory = {}
+        # key -> (expiry, requirements) for local fallbacks after an LLM failure
+        self._fallbacks = {}
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_cache(self, key):
+        if key in self._memory:
+            return self._memory[key]
+        try:
+            with open(self._cache_path(key), "r", encoding="utf-8") as f:
+                requirements = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.llm is not None and requirements.get("compiler") != "llm":
+            return None
+        self._memory[key] = requirements
+        return requirements
+
+    def _write_cache(self, key, requirements):
+        self._memory[key] = requirements
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f"{self._cache_path(key)}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(requirements, f)
+        os.replace(temp_path, self._cache_path(key))
+
+    def _read_fallback(self, key):
+        now = time.monotonic()
+        for stale in [k for k, (expiry, _) in self._fallbacks.items() if expiry <= now]:
+            self._fallbacks.pop(stale, None)
+        entry = self._fallbacks.get(key)
+        return entry[1] if entry else None
+
+    def compile_uncached(self, jd_text):
+        """Requirements tagged with the compiler that produced them, "llm" or "local" """
+        if self.llm is not None:
+            try:
+                response = self.llm.invoke(COMPILE_TEMPLATE.format(job_description=normalize_text(jd_text)))
+                return dict(clean_requirements(parse_analysis_content(response.content)), compiler="llm")
+            except Exception as e:
+                print(f"JD compilation with the LLM failed, compiling locally: {str(e)}")
+        return dict(compile_locally(jd_text, self.extractor), compiler="local")
+
+    def compile(self, jd_text):
+        """Return (requirements, cached); raises ValueError if no skills can be extracted"""
+        key = jd_key(jd_text)
+        requirements = self._read_cache(key) or self._read_fallback(key)
+        if requirements is not None:
+            return requirements, True
+        requirements = dict(self.compile_uncached(jd_text), version=REQUIREMENTS_VERSION, jd_hash=key.split(".")[0])
+        if self.llm is not None and requirements["compiler"] != "llm":
+            self._fallbacks[key] = (time.monotonic() + self.fallback_ttl, requirements)
+        else:
+            self._write_cache(key, requirements)
+        return requirements, False
+
+
+SAMPLE_JD = """Senior Python Developer
+About the role
+We are hiring a Senior Python Developer to build and scale the APIs behind our recruiting platform. You will work
+with product managers, data scientists and front-end engineers in an agile team, own services end to end, review
+code and mentor junior developers.
+Responsibilities
+- Design, build and maintain REST APIs and background workers in Python (Flask or Django)
+- Model data in PostgreSQL and MongoDB, write efficient SQL and tune slow queries
+- Containerize services with Docker and deploy them to AWS with CI/CD pipelines
+- Instrument services, monitor production and lead incident reviews
+- Write unit and integration tests and keep the codebase clean
+Requirements
+- 5+ years of professional software development experience, 3+ years with Python
+- Bachelor's degree in Computer Science, Engineering or a related field
+- Strong knowledge of Flask or Django, SQL, Git and Linux
+- Experience with AWS, Docker and REST API design
+- Good communication and teamwork skills
+Nice to have
+- Machine Learning or Data Analysis experience with Pandas and Scikit-learn
+- Kubernetes, Redis, Kafka
+- AWS Certified Developer certification
+What we offer
+Competitive salary, hybrid work from our Pune office, learning budget and health insurance for you and your family.
+"""
+
+
+def benchmark(jsonl_path, jd_text, candidates=50, ms_per_1k_tokens=15.0, base_latency_ms=400.0, workers=8):
+    """
+    Score `candidates` labeled resumes against one JD with a stub LLM whose latency is
+    `base_latency_ms` plus prefill time proportional to prompt tokens, with and without
+    compiling the JD first. Reports prompt tokens and LLM latency per candidate.
+    """
+    resumes = [resume_text_from_prompt(entry.get("prompt", "")) for entry in iter_labeled_entries(jsonl_path)]
+    resumes = resumes[:candidates]
+
+    def respond(prompt):
+        time.sleep((base_latency_ms + count_tokens(prompt) / 1000 * ms_per_1k_tokens) / 1000)
+        return json.dumps({"score": 50})
+
+    started = time.perf_counter()
+    requirements = compile_locally(jd_text)
+    compile_time = time.perf_counter() - started
+    compiled_jd = render_requirements(requirements)
+
+    results = {}
+    for label, jd, template in (("full JD", jd_text, ANALYSIS_TEMPLATE), ("compiled JD", compiled_jd, COMPILED_JD_TEMPLATE)):
+        prompt_tokens, latencies = [], []
+
+        def hook(event, **info):
+            if event == "llm_start":
+                prompt_tokens.append(count_tokens(info["prompt"]))
+            elif event == "llm_end":
+                latencies.append(info["duration"])
+
+        engine = AnalysisEngine(StubLLM(respond=respond), hooks=[hook], max_workers=workers)
+        started = time.perf_counter()
+        engine.analyze_batch([(resume, jd, template) for resume in resumes])
+        elapsed = time.perf_counter() - started
+        results[label] = (sum(prompt_tokens) / len(prompt_tokens), sum(latencies) / len(latencies), elapsed)
+
+    print(f"JD: {count_tokens(normalize_text(jd_text))} tokens full, {count_tokens(compiled_jd)} tokens compiled "
+          f"({len(requirements['must_have_skills'])} must-have, {len(requirements['nice_to_have_skills'])} "
+          f"nice-to-have skills; local compile {compile_time * 1000:.1f} ms, once per JD)")
+    print(f"{len(resumes)} candidates; stub latency {base_latency_ms:.0f} ms + {ms_per_1k_tokens} ms per 1k prompt tokens")
+    for label, (tokens, latency, elapsed) in results.items():
+        print(f"{label:12s} {tokens:7.0f} prompt tokens/candidate  {latency * 1000:7.1f} ms LLM latency/candidate  "
+              f"{elapsed:6.2f} s batch wall time ({workers} workers)")
+    full, compiled = results["full JD"][0], results["compiled JD"][0]
+    print(f"Prompt tokens saved per candidate: {full - compiled:.0f} ({(full - compiled) / max(full, 1) * 100:.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a JD into cached requirements, or benchmark scoring with compiled JDs")
+    parser.add_argument("command", choices=["compile", "benchmark"])
+    parser.add_argument("--jd", help="JD as a .txt or .pdf file (default: a built-in sample JD)")
+    parser.add_argument("--resumes", default="labeled_resumes.jsonl")
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=15.0)
+    parser.add_argument("--base-latency-ms", type=float, default=400.0)
+    args = parser.parse_args()
+
+    jd_text = SAMPLE_JD
+    if args.jd and args.jd.endswith(".pdf"):
+        from pdf_processor import extract_text_from_pdf
+        jd_text = extract_text_from_pdf(args.jd)
+    elif args.jd:
+        with open(args.jd, "r", encoding="utf-8") as f:
+            jd_text = f.read()
+
+    # Both commands compile locally, which needs the trained skill vocabulary
+    if load_extractor() is None:
+        parser.exit(1, f"No ATS model at {ATS_MODEL_PATH}; run `python ats_extractor.py train` first\n")
+    try:
+        if args.command == "compile":
+            requirements, cached = JDCompiler().compile(jd_text)
+            print(json.dumps(requirements, indent=4))
+            print(f"({'from cache' if cached else 'compiled'} {JD_CACHE_DIR}/{jd_key(jd_text)}.json)")
+        else:
+            benchmark(args.resumes, jd_text, args.candidates, args.ms_per_1k_tokens, args.base_latency_ms)
+    except ValueError as e:
+        parser.exit(1, f"Could not compile the JD: {str(e)}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import metrics
+from analysis_engine import StubLLM, model_name
+from server_tuning import gunicorn_settings
+
+# LLM calls in flight per process, and how many of them only interactive calls may use.
+# Unset, they follow the worker's request threads: one call per thread, a quarter reserved
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "0")) or None
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED")) if os.getenv("LLM_INTERACTIVE_RESERVED") else None
+# Requests admitted (queued or running) per priority class, and per tenant within a class,
+# beyond which new ones get 429. Unset (0), the worker's request threads and half of them
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "0")) or None
+LLM_MAX_TENANT_QUEUE = int(os.getenv("LLM_MAX_TENANT_QUEUE", "0")) or None
+# JSON of tenant -> weight; tenants not listed weigh 1
+LLM_TENANT_WEIGHTS = json.loads(os.getenv("LLM_TENANT_WEIGHTS", "{}"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot", ("priority",)
+)
+REJECTED = metrics.REGISTRY.counter(
+    "llm_scheduler_rejected_total", "Requests refused by LLM admission control", ("priority",)
+)
+
+# (tenant, priority) that LLM calls made in the current context are scheduled as
+_schedule = contextvars.ContextVar("llm_schedule", default=("default", INTERACTIVE))
+
+
+class QueueFullError(RuntimeError):
+    """Raised by admit() when a queue is too deep; `retry_after` estimates when to try again, in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def set_schedule(tenant, priority=INTERACTIVE):
+    """Schedule LLM calls in the current context as `tenant` at `priority`; returns a token for reset_schedule"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'. Available: {', '.join(PRIORITIES)}")
+    return _schedule.set((tenant, priority))
+
+
+def reset_schedule(token):
+    _schedule.reset(token)
+
+
+@contextmanager
+def schedule_as(tenant, priority=INTERACTIVE):
+    token = set_schedule(tenant, priority)
+    try:
+        yield
+    finally:
+        reset_schedule(token)
+
+
+class Ticket:
+    def __init__(self, tenant, priority, tag):
+        self.tenant = tenant
+        self.priority = priority
+        self.tag = tag
+        self.queued_at = time.perf_counter()
+        self.granted = threading.Event()
+
+
+def worker_threads():
+    """Requests one server process handles at once: its gunicorn threads"""
+    return gunicorn_settings()["threads"]
+
+
+class FairScheduler:
+    """
+    Admission control and weighted fair queuing for `capacity` concurrent LLM calls.
+
+    Calls are queued per priority class and, within a class, per tenant. Interactive
+    calls are dispatched before batch calls, and `reserved` slots are only ever given to
+    interactive calls, so a batch job can fill at most capacity - reserved slots and an
+    interactive call waits at most for one of the reserved slots to free up. Within a
+    class, tenants share slots in proportion to their weights (start-time fair queuing
+    on virtual finish tags), so one recruiter's large batch does not delay another's.
+
+    admit() is the backpressure check for new requests. It counts the request in under
+    the lock, or raises QueueFullError once `max_queue` requests of the class (batch:
+    max_queue - reserved) or `max_tenant_queue` of the tenant are admitted and not yet
+    finish()ed, so concurrent requests cannot all pass the check at once. Calls of an
+    admitted request always queue. Limits are per process; left as None they are sized
+    from `threads`, the requests a worker serves at once (its gunicorn threads), since
+    more admitted requests than threads could only wait in the listen backlog.
+    """
+
+    def __init__(self, capacity=LLM_CONCURRENCY, reserved=LLM_INTERACTIVE_RESERVED, max_queue=LLM_MAX_QUEUE,
+                 max_tenant_queue=LLM_MAX_TENANT_QUEUE, weights=None, threads=None):
+        if None in (capacity, reserved, max_queue, max_tenant_queue):
+            threads = threads or worker_threads()
+        self.capacity = capacity or threads
+        if reserved is None:
+            reserved = max(1, self.capacity // 4)
+        self.reserved = max(0, min(reserved, self.capacity - 1))
+        self.max_queue = max_queue or threads
+        self.max_tenant_queue = max_tenant_queue or max(1, threads // 2)
+        self.weights = dict(LLM_TENANT_WEIGHTS if weights is None else weights)
+        self.admitted = {priority: {} for priority in PRIORITIES}
+        self.in_flight = {priority: 0 for priority in PRIORITIES}
+        self.service_seconds = 1.0
+        self._queues = {priority: {} for priority in PRIORITIES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self._finish = {}
+        self._completed = 0
+        self._lock = threading.Lock()
+
+    def weight(self, tenant):
+        return float(self.weights.get(tenant, 1.0))
+
+    def queued(self, priority, tenant=None):
+        with self._lock:
+            return self._queued(priority, tenant)
+
+    def _queued(self, priority, tenant=None):
+        if tenant is not None:
+            return len(self._queues[priority].get(tenant, ()))
+        return sum(len(queue) for queue in self._queues[priority].values())
+
+    def _slots(self, priority):
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+
+    def _admitted(self, priority, tenant=None):
+        if tenant is not None:
+            return self.admitted[priority].get(tenant, 0)
+        return sum(self.admitted[priority].values())
+
+    def _admit_limit(self, priority):
+        return self.max_queue if priority == INTERACTIVE else max(1, self.max_queue - self.reserved)
+
+    def _retry_after(self, priority, tenant=None):
+        # Caller holds the lock
+        slots = self._slots(priority)
+        if tenant is not None:
+            admitted = self.admitted[priority]
+            share = self.weight(tenant) / sum(self.weight(t) for t in admitted) if tenant in admitted else 1.0
+            ahead, rate = self._admitted(priority, tenant), slots * share
+        else:
+            ahead, rate = self._admitted(priority), slots
+            if priority == BATCH:
+                ahead += self._admitted(INTERACTIVE)
+        return max(ahead / 2, 1) * self.service_seconds / rate
+
+    def retry_after(self, priority, tenant=None):
+        """
+        Seconds until half of the requests admitted ahead have finished, from the mean
+        call time: the class's requests, or with `tenant` that tenant's at its fair share
+        of the class's slots. Retrying then keeps the queue fed without refilling it at once.
+        """
+        with self._lock:
+            return self._retry_after(priority, tenant)
+
+    def admit(self, tenant, priority=INTERACTIVE):
+        """Count a new request from `tenant` in, or raise QueueFullError; every admit() needs a finish()"""
+        with self._lock:
+            if self._admitted(priority) >= self._admit_limit(priority):
+                error = QueueFullError(f"Too many {priority} LLM requests queued", self._retry_after(priority))
+            elif self._admitted(priority, tenant) >= self.max_tenant_queue:
+                error = QueueFullError(f"Too many {priority} LLM requests queued for {tenant}",
+                                       self._retry_after(priority, tenant))
+            else:
+                self.admitted[priority][tenant] = self._admitted(priority, tenant) + 1
+                return
+        REJECTED.inc(priority=priority)
+        raise error
+
+    def finish(self, tenant, priority=INTERACTIVE):
+        """The admitted request from `tenant` is done"""
+        with self._lock:
+            remaining = self._admitted(priority, tenant) - 1
+            if remaining > 0:
+                self.admitted[priority][tenant] = remaining
+            else:
+                self.admitted[priority].pop(tenant, None)
+
+    @contextmanager
+    def admission(self, tenant, priority=INTERACTIVE):
+        """admit() for the duration of the block"""
+        self.admit(tenant, priority)
+        try:
+            yield
+        finally:
+            self.finish(tenant, priority)
+
+    def _dispatch(self):
+        # Caller holds the lock
+        while sum(self.in_flight.values()) < self.capacity:
+            for priority in PRIORITIES:
+                if self.in_flight[priority] >= self._slots(priority):
+                    continue
+                heads = [queue[0] for queue in self._queues[priority].values() if queue]
+                if heads:
+                    break
+            else:
+                return
+            ticket = min(heads, key=lambda t: t.tag)
+            queue = self._queues[priority][ticket.tenant]
+            queue.popleft()
+            if not queue:
+                del self._queues[priority][ticket.tenant]
+            self._virtual_time[priority] = ticket.tag - 1.0 / self.weight(ticket.tenant)
+            self.in_flight[priority] += 1
+            ticket.granted.set()
+
+    def acquire(self, tenant, priority=INTERACTIVE):
+        """Block until a slot is granted to this call; returns the ticket to release()"""
+        with self._lock:
+            key = (priority, tenant)
+            start = max(self._virtual_time[priority], self._finish.get(key, 0.0))
+            ticket = Ticket(tenant, priority, start + 1.0 / self.weight(tenant))
+            self._finish[key] = ticket.tag
+            self._queues[priority].setdefault(tenant, deque()).append(ticket)
+            self._dispatch()
+        ticket.granted.wait()
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - ticket.queued_at, priority=priority)
+        ticket.started = time.perf_counter()
+        return ticket
+
+    def try_acquire(self, tenant=None, priority=None):
+        """
+        A slot only if one is free now and no call of the class is queued for it, else None;
+        for optional extra work such as hedged duplicates. Tenant and priority default to
+        the current schedule_as() context.
+        """
+        scheduled_tenant, scheduled_priority = _schedule.get()
+        ticket = Ticket(tenant or scheduled_tenant, priority or scheduled_priority, 0.0)
+        with self._lock:
+            if (sum(self.in_flight.values()) >= self.capacity or self.in_flight[ticket.priority] >= self._slots(ticket.priority)
+                    or self._queued(ticket.priority)):
+                return None
+            self.in_flight[ticket.priority] += 1
+        ticket.granted.set()
+        ticket.started = time.perf_counter()
+        return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            self.in_flight[ticket.priority] -= 1
+            # Mean call time, weighted to recent calls once there are enough of them
+            self._completed += 1
+            alpha = max(0.05, 1.0 / self._completed)
+            self.service_seconds += alpha * (time.perf_counter() - ticket.started - self.service_seconds)
+            if not self._queued(ticket.priority) and not self.in_flight[ticket.priority]:
+                # An idle class starts fresh, so finish tags do not grow without bound
+                self._finish = {k: v for k, v in self._finish.items() if k[0] != ticket.priority}
+                self._virtual_time[ticket.priority] = 0.0
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant=None, priority=None):
+        """Hold one LLM slot for the block; tenant and priority default to the current schedule_as() context"""
+        scheduled_tenant, scheduled_priority = _schedule.get()
+        ticket = self.acquire(tenant or scheduled_tenant, priority or scheduled_priority)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+
+class ScheduledLLM:
+    """Drop-in wrapper around a chat model (invoke/ainvoke) whose calls each wait for a FairScheduler slot"""
+
+    def __init__(self, llm, scheduler):
+        self.llm = llm
+        self.scheduler = scheduler
+
+    @property
+    def model_name(self):
+        return model_name(self.llm)
+
+    def invoke(self, prompt, **kwargs):
+        with self.scheduler.slot():
+            return self.llm.invoke(prompt, **kwargs)
+
+    async def ainvoke(self, prompt, **kwargs):
+        # Waiting for a slot blocks, so it runs on the default executor in the caller's context
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: context.run(self.invoke, prompt, **kwargs))
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)] if ordered else 0.0
+
+
+def simulate(scheduler, batch_jobs, recruiters=4, interactive_rate=3.0, duration=10.0, workers=32, fifo=False, seed=0):
+    """
+    Batch jobs ({tenant: calls}) submitted `workers` at a time by each tenant, alongside
+    Poisson interactive /analyze traffic at `interactive_rate` per second from
+    `recruiters` other tenants for `duration` seconds. Rejected batch submissions back
+    off for their Retry-After. With `fifo`, every call is scheduled as one tenant in one
+    class, i.e. a plain FIFO queue. Returns interactive latencies, rejections and
+    per-tenant batch completion times.
+    """
+    llm = ScheduledLLM(StubLLM(response='{"score": 70}', delay=0.1), scheduler)
+    started = time.perf_counter()
+    interactive, rejected = [], {INTERACTIVE: 0, BATCH: 0}
+    finished = {}
+    lock = threading.Lock()
+
+    def submit(tenant, priority):
+        scheduled = ("shared", INTERACTIVE) if fifo else (tenant, priority)
+        while True:
+            try:
+                call_started = time.perf_counter()
+                with scheduler.admission(*scheduled), schedule_as(*scheduled):
+                    llm.invoke("score this resume")
+                return time.perf_counter() - call_started
+            except QueueFullError as e:
+                with lock:
+                    rejected[priority] += 1
+                if priority == INTERACTIVE:
+                    return None
+                time.sleep(e.retry_after)
+
+    def run_batch(tenant, calls):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda _: submit(tenant, BATCH), range(calls)))
+        finished[tenant] = time.perf_counter() - started
+
+    def run_interactive(executor):
+        rng = random.Random(seed)
+        futures = []
+        while time.perf_counter() - started < duration:
+            time.sleep(rng.expovariate(interactive_rate))
+            futures.append(executor.submit(submit, f"recruiter-{rng.randrange(recruiters)}", INTERACTIVE))
+        for future in futures:
+            latency = future.result()
+            if latency is not None:
+                interactive.append(latency)
+
+    batch_threads = [threading.Thread(target=run_batch, args=(tenant, calls)) for tenant, calls in batch_jobs.items()]
+    for thread in batch_threads:
+        thread.start()
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        run_interactive(executor)
+    for thread in batch_threads:
+        thread.join()
+    return interactive, rejected, finished
+
+
+def demo(batch_jobs=None, duration=10.0, capacity=4):
+    """Interactive latency and batch completion under one shared FIFO queue versus the fair scheduler"""
+    batch_jobs = batch_jobs or {"recruiter-a (batch)": 300, "recruiter-b (batch)": 60}
+    print(f"Stub LLM 100 ms, {capacity} concurrent calls; batch jobs {batch_jobs} submitted 32 at a time, "
+          f"interactive requests at 3/s for {duration:.0f} s")
+    setups = [
+        ("shared FIFO", FairScheduler(capacity, reserved=0, max_queue=10 ** 6, max_tenant_queue=10 ** 6), True),
+        ("fair scheduler", FairScheduler(capacity, reserved=1, max_queue=64, max_tenant_queue=16), False),
+    ]
+    print(f"{'':16s} {'p50 ms':>8s} {'p95 ms':>8s} {'max ms':>8s} {'rejected':>9s}   batch done at")
+    for label, scheduler, fifo in setups:
+        interactive, rejected, finished = simulate(scheduler, batch_jobs, duration=duration, fifo=fifo)
+        done = ", ".join(f"{tenant} {seconds:.1f} s" for tenant, seconds in sorted(finished.items()))
+        print(f"{label:16s} {_percentile(interactive, 0.5) * 1000:8.0f} {_percentile(interactive, 0.95) * 1000:8.0f} "
+              f"{max(interactive) * 1000:8.0f} {rejected[INTERACTIVE] + rejected[BATCH]:9d}   {done}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate interactive and batch LLM traffic with and without fair queuing")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--capacity", type=int, default=4)
+    args = parser.parse_args()
+    demo(duration=args.duration, capacity=args.capacity)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from fast in-process stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus +Inf, then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self._series.get(key)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(series[0]), series[1], series[2])) for key, series in self._series.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Metrics are per process; with several gunicorn workers each worker serves its own numbers
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "analyze_stage_seconds", "Time spent in each stage of a request", ("endpoint", "stage")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Total request time", ("endpoint", "method", "status")
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "llm_call_seconds", "LLM call latency", ("model", "outcome")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens reported by LLM responses", ("model", "kind")
+)
+TOKENS_SAVED = REGISTRY.counter(
+    "prompt_tokens_saved_total", "Prompt tokens removed by text normalization"
+)
+CACHE_HITS = REGISTRY.counter(
+    "analysis_cache_hits_total", "Analyses served from the engine cache"
+)
+JD_COMPILE_FAILURES = REGISTRY.counter(
+    "jd_compile_failures_total", "JDs scored against their full text because no requirements could be compiled",
+    ("endpoint",)
+)
+
+
+class Trace:
+    """Per-request list of (stage, seconds) spans"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def record(self, stage, duration):
+        self.spans.append((stage, duration))
+        STAGE_SECONDS.observe(duration, endpoint=self.endpoint, stage=stage)
+
+    def timing_header(self):
+        """Stage breakdown for the X-Timing response header, e.g. 'extract_text;dur=12.1, llm;dur=8030.4'"""
+        total = (time.perf_counter() - self.started) * 1000
+        parts = [f"{stage};dur={duration * 1000:.1f}" for stage, duration in self.spans]
+        parts.append(f"total;dur={total:.1f}")
+        return ", ".join(parts)
+
+
+_local = threading.local()
+
+
+def start_trace(endpoint):
+    trace = Trace(endpoint)
+    _local.trace = trace
+    return trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def end_trace():
+    trace = current_trace()
+    _local.trace = None
+    return trace
+
+
+@contextmanager
+def span(stage):
+    """Time a block and attach it to the current request's trace (no-op outside a request)"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(stage, time.perf_counter() - started)
+
+
+def token_usage(response):
+    """Return (prompt_tokens, completion_tokens) from a LangChain chat response, if reported"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def engine_hook(event, **info):
+    """AnalysisEngine hook feeding LLM latency, token counts and cache hits into the registry"""
+    trace = current_trace()
+    if event == "cache_hit":
+        CACHE_HITS.inc()
+    elif event in ("prompt_built", "parsed"):
+        if info.get("tokens_saved"):
+            TOKENS_SAVED.inc(info["tokens_saved"])
+        if trace is not None:
+            trace.record("format_prompt" if event == "prompt_built" else "parse_json", info["duration"])
+    elif event == "llm_end":
+        model = info.get("model", "")
+        LLM_CALL_SECONDS.observe(info["duration"], model=model, outcome="ok")
+        prompt_tokens, completion_tokens = token_usage(info["response"])
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        if trace is not None:
+            trace.record("llm", info["duration"])
+    elif event == "llm_error":
+        LLM_CALL_SECONDS.observe(info["duration"], model=info.get("model", ""), outcome="error")
+
+
+def benchmark_overhead(requests=2000, stage_work=0.002):
+    """
+    Compare a simulated request of six stages (each sleeping `stage_work` seconds)
+    with and without tracing, and report the instrumentation cost per request.
+    """
+    stages = ("save_upload", "extract_text", "dedup_lookup", "format_prompt", "llm", "parse_json")
+
+    def run(traced):
+        started = time.perf_counter()
+        for _ in range(requests):
+            if traced:
+                start_trace("/bench")
+            for stage in stages:
+                if traced:
+                    with span(stage):
+                        pass
+                else:
+                    pass
+            if traced:
+                trace = end_trace()
+                trace.timing_header()
+                REQUEST_SECONDS.observe(0.0, endpoint="/bench", method="POST", status=200)
+        return time.perf_counter() - started
+
+    baseline = run(False)
+    traced = run(True)
+    overhead = max(traced - baseline, 0.0) / requests
+
+    # Wall time of one simulated request, so the overhead can be expressed as a fraction of it
+    started = time.perf_counter()
+    for _ in stages:
+        time.sleep(stage_work)
+    request_time = time.perf_counter() - started
+    return overhead, request_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure tracing overhead per request")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--stage-ms", type=float, default=2.0, help="simulated work per stage")
+    args = parser.parse_args()
+
+    overhead, request_time = benchmark_overhead(args.requests, args.stage_ms / 1000)
+    print(f"Tracing overhead: {overhead * 1e6:.1f} µs per request")
+    print(f"Simulated request time: {request_time * 1000:.1f} ms")
+    print(f"Overhead: {overhead / request_time * 100:.3f}% of request time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+import time
+
+import PyPDF2
+
+import pdf_processor
+from upload_benchmark import build_pdf
+
+
+def build_scanned_pdf(path, pages=3, text="Scanned resume: Python, Flask, AWS, 5 years experience"):
+    """Write an image-only PDF (no text layer), like a scanned document"""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for number in range(pages):
+        image = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(20):
+            draw.text((100, 100 + line * 60), f"{text} (page {number + 1}, line {line + 1})", fill=0)
+        images.append(image.convert("RGB"))
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+    return path
+
+
+def build_corpus(directory, text_docs, scanned_docs, pages):
+    paths = []
+    for i in range(text_docs):
+        paths.append(build_pdf(os.path.join(directory, f"text_{i}.pdf"), pages=pages))
+    for i in range(scanned_docs):
+        paths.append(build_scanned_pdf(os.path.join(directory, f"scanned_{i}.pdf"), pages=pages))
+    return paths
+
+
+def count_pages(paths):
+    text_pages = ocr_pages = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            for page in PyPDF2.PdfReader(f).pages:
+                if len((page.extract_text() or "").strip()) < pdf_processor.MIN_PAGE_CHARS:
+                    ocr_pages += 1
+                else:
+                    text_pages += 1
+    return text_pages, ocr_pages
+
+
+def run(paths, ocr=True):
+    started = time.perf_counter()
+    characters = sum(len(pdf_processor.extract_text_from_pdf(path, ocr=ocr)) for path in paths)
+    return time.perf_counter() - started, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages/sec of PDF extraction with OCR fallback")
+    parser.add_argument("corpus", nargs="?", help="directory of PDFs (default: generate a mixed corpus)")
+    parser.add_argument("--text-docs", type=int, default=20)
+    parser.add_argument("--scanned-docs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    if not pdf_processor.ocr_available():
+        print("OCR is not available (install pytesseract, pdf2image, tesseract and poppler).")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.corpus:
+            paths = [os.path.join(args.corpus, f) for f in sorted(os.listdir(args.corpus)) if f.endswith(".pdf")]
+        else:
+            paths = build_corpus(directory, args.text_docs, args.scanned_docs, args.pages)
+        # Fresh cache so the first pass measures real OCR work
+        pdf_processor.OCR_CACHE_DIR = os.path.join(directory, "ocr_cache")
+
+        text_pages, ocr_pages = count_pages(paths)
+        total_pages = text_pages + ocr_pages
+        print(f"{len(paths)} documents: {text_pages} text pages, {ocr_pages} image-only pages, "
+              f"{pdf_processor.OCR_WORKERS} OCR workers")
+
+        for label, ocr in (("text layer only", False), ("with OCR, cold cache", True), ("with OCR, warm cache", True)):
+            elapsed, characters = run(paths, ocr)
+            print(f"{label:22s} {total_pages / elapsed:8.1f} pages/s  {elapsed:7.2f} s  {characters} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,189 @@
 import PyPDF2
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 
-def extract_text_from_pdf(pdf_path):
+# OCR is optional: without pdf2image (poppler) and pytesseract (tesseract),
+# image-only pages simply contribute no text.
+try:
+    import pytesseract
+    from pdf2image import convert_from_path
+except ImportError:
+    pytesseract = None
+    convert_from_path = None
+
+# Pages with fewer extractable characters than this are treated as scanned images
+MIN_PAGE_CHARS = int(os.environ.get("OCR_MIN_PAGE_CHARS", "25"))
+OCR_ENABLED = os.environ.get("OCR_ENABLED", "1").lower() in ("1", "true", "yes")
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "ocr_cache")
+# Seconds one document's OCR may take; also bounds poppler and tesseract on each page
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", "120"))
+
+_ocr_pool = None
+
+
+class PDFLimitError(ValueError):
+    """Raised when a PDF is rejected for exceeding a configured limit"""
+
+
+def ocr_available():
+    return OCR_ENABLED and pytesseract is not None and convert_from_path is not None
+
+
+def extract_text_from_pdf(pdf_path, max_pages=None, max_chars=None, ocr=True):
+    """
+    Extract text from a PDF path or binary file object.
+    Rejects documents with more than `max_pages` pages before parsing any of them,
+    and stops reading pages once `max_chars` characters have been gathered.
+    Pages with (almost) no text layer are OCR'd when `ocr` is set and OCR is installed,
+    in page order and only until the OCR'd text also reaches `max_chars`.
+    """
+    if hasattr(pdf_path, 'read'):
+        return _extract_text(pdf_path, max_pages, max_chars, ocr)
     with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ''
-        for page in reader.pages:
-            text += page.extract_text()
-    return text
\ No newline at end of file
+        return _extract_text(file, max_pages, max_chars, ocr)
+
+
+def _extract_text(file, max_pages, max_chars, ocr):
+    reader = PyPDF2.PdfReader(file)
+    if max_pages is not None and len(reader.pages) > max_pages:
+        raise PDFLimitError(f"PDF has {len(reader.pages)} pages; the limit is {max_pages}")
+
+    page_texts = []
+    gathered = 0
+    for page in reader.pages:
+        page_text = page.extract_text() or ''
+        page_texts.append(page_text)
+        gathered += len(page_text)
+        if max_chars is not None and gathered >= max_chars:
+            break
+
+    if ocr and ocr_available():
+        sparse = [i for i, page_text in enumerate(page_texts) if len(page_text.strip()) < MIN_PAGE_CHARS]
+        # Without a character limit every sparse page is OCR'd at once; with one, a pool's
+        # worth at a time so a long scanned document stops once enough text is gathered
+        batch_size = len(sparse) if max_chars is None else OCR_WORKERS
+        deadline = time.monotonic() + OCR_TIMEOUT
+        for start in range(0, len(sparse), max(batch_size, 1)):
+            batch = sparse[start:start + batch_size]
+            for i, page_text in ocr_pages(file, reader, batch, deadline).items():
+                page_texts[i] = page_text
+            # Text is cut to max_chars from the start, so only pages up to this batch count
+            if max_chars is not None and sum(len(page_text) for page_text in page_texts[:batch[-1] + 1]) >= max_chars:
+                break
+
+    text = ''.join(page_texts)
+    return text[:max_chars] if max_chars is not None else text
+
+
+def page_hash(page):
+    """Hash of a page's content stream and image data, used as the OCR cache key"""
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if xobjects:
+        for name in sorted(xobjects.get_object()):
+            xobject = xobjects.get_object()[name].get_object()
+            digest.update(name.encode())
+            digest.update(getattr(xobject, "_data", b"") or b"")
+    return digest.hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+
+
+def _read_cache(key):
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_cache(key, text):
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    temp_path = f"{_cache_path(key)}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, _cache_path(key))
+
+
+def get_ocr_pool():
+    """Process pool shared by all OCR work in this process; bounds OCR concurrency to OCR_WORKERS"""
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _ocr_pool
+
+
+def ocr_page(pdf_path, page_number, dpi=OCR_DPI, lang=OCR_LANG, timeout=OCR_TIMEOUT):
+    """Rasterize one page (1-based) and OCR it; runs in a pool worker"""
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, timeout=timeout)
+    return "".join(pytesseract.image_to_string(image, lang=lang, timeout=timeout) for image in images)
+
+
+def ocr_pages(file, reader, page_indices, deadline=None):
+    """
+    OCR the given 0-based pages in parallel, reusing cached text by page hash; returns
+    {index: text}. Pages not finished by `deadline` (time.monotonic(), default
+    OCR_TIMEOUT from now) are left out.
+    """
+    if deadline is None:
+        deadline = time.monotonic() + OCR_TIMEOUT
+    results = {}
+    missing = {}
+    for i in page_indices:
+        try:
+            key = page_hash(reader.pages[i])
+        except Exception:
+            key = None
+        cached = _read_cache(key) if key else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            missing[i] = key
+    if not missing:
+        return results
+
+    # Pool workers rasterize from a path, so uploads held in memory are written out once
+    pdf_path = getattr(file, "name", None)
+    temp_path = None
+    if not isinstance(pdf_path, str) or not os.path.exists(pdf_path):
+        file.seek(0)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp:
+            while True:
+                chunk = file.read(1024 * 1024)
+                if not chunk:
+                    break
+                temp.write(chunk)
+            temp_path = pdf_path = temp.name
+
+    try:
+        pool = get_ocr_pool()
+        futures = {i: pool.submit(ocr_page, pdf_path, i + 1) for i in missing}
+        for i, future in futures.items():
+            try:
+                text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                print(f"OCR timed out for page {i + 1}")
+                continue
+            except Exception as e:
+                print(f"OCR failed for page {i + 1}: {str(e)}")
+                continue
+            results[i] = text
+            if missing[i]:
+                _write_cache(missing[i], text)
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+    return results
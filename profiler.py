@@ -0,0 +1,165 @@
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Fraction of requests profiled automatically (0 disables sampling)
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Milliseconds between stack samples
+INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+# Whether an "X-Profile" request header forces profiling; with PROFILE_SECRET set the header must carry it
+ALLOW_ON_DEMAND = os.environ.get("PROFILE_ON_DEMAND", "0").lower() in ("1", "true", "yes")
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+MAX_PROFILE_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+MAX_PROFILE_BYTES = int(os.environ.get("PROFILE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+# Characters of a caller-supplied id kept in a profile file name
+MAX_NAME_CHARS = 64
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack on a background thread every `interval`
+    seconds and counts identical stacks, root first, in collapsed-stack form.
+    """
+
+    def __init__(self, thread_id=None, interval=INTERVAL_MS / 1000, max_depth=128):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(frame_label(frame))
+            frame = frame.f_back
+        if labels:
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def collapsed(self):
+        """Collapsed-stack text, one 'frame;frame;frame count' line per stack (flamegraph.pl input)"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """
+    Directory of collapsed-stack files keyed by profile_id(). Acts as a ring buffer:
+    the oldest files are deleted once the file count or total size exceeds its limits.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, max_files=MAX_PROFILE_FILES, max_bytes=MAX_PROFILE_BYTES):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, profile_id):
+        return os.path.join(self.directory, f"{_SAFE_NAME.sub('_', profile_id)[:MAX_NAME_CHARS + 9]}.folded")
+
+    def write(self, profile_id, collapsed):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path_for(profile_id)
+            with open(path, "w") as f:
+                f.write(collapsed)
+            self._rotate()
+        return path
+
+    def _rotate(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".folded"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_files or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            os.unlink(path)
+            total -= size
+
+
+default_store = ProfileStore()
+
+
+def profile_id(request_id):
+    """
+    File name stem for a profile: the request id, made safe and truncated, plus a random
+    suffix so a client-chosen X-Request-ID can neither overwrite another profile nor
+    grow the file name without bound
+    """
+    return f"{_SAFE_NAME.sub('_', request_id)[:MAX_NAME_CHARS]}-{uuid.uuid4().hex[:8]}"
+
+
+def on_demand(header):
+    """Whether an X-Profile header value forces profiling"""
+    if not ALLOW_ON_DEMAND or not header:
+        return False
+    return not PROFILE_SECRET or hmac.compare_digest(header.encode(), PROFILE_SECRET.encode())
+
+
+def should_profile(force=False):
+    """Decide whether to profile this unit of work"""
+    if force and ALLOW_ON_DEMAND:
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def start_profile(force=False):
+    """Start sampling the current thread if this unit of work is selected; returns the sampler or None"""
+    return StackSampler().start() if should_profile(force) else None
+
+
+def finish_profile(profile_id, sampler, store=None):
+    """Stop a sampler from start_profile and write its collapsed stacks under a profile_id(); returns the file path"""
+    if sampler is None:
+        return None
+    sampler.stop()
+    return (store or default_store).write(profile_id, sampler.collapsed())
+
+
+@contextmanager
+def profile_request(request_id, force=False, store=None):
+    """
+    Profile the enclosed block on the current thread if it is sampled (or forced).
+    Yields the sampler, or None when this block is not profiled.
+    """
+    sampler = start_profile(force)
+    try:
+        yield sampler
+    finally:
+        finish_profile(profile_id(request_id), sampler, store)
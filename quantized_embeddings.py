@@ -0,0 +1,430 @@
+import argparse
+import bisect
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from shared_embeddings import EMBEDDING_DIM, EmbeddingMatrix
+
+# none, float16, int8 or pq; "none" searches the float32 matrix directly
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "none").lower()
+# Approximate candidates re-ranked with the exact float32 rows
+QUANTIZED_RERANK = int(os.environ.get("QUANTIZED_RERANK", "100"))
+PQ_SUBSPACES = 96
+PQ_CENTROIDS = 256
+# Rows sampled to train the PQ codebook
+PQ_TRAIN_ROWS = 16384
+QUANTIZATION_MODES = ("float16", "int8", "pq")
+# Rows scored per step, so decoding to float32 never materializes the whole matrix
+SCORE_BLOCK = 16384
+# Decoded float32 blocks of float16/int8 codes kept per process (LRU), so repeated full scans skip the
+# conversion; this is private memory on top of the shared mapped codes, up to the float32 matrix size
+QUANTIZED_DECODE_CACHE_MB = int(os.environ.get("QUANTIZED_DECODE_CACHE_MB", "256"))
+
+
+def map_array(path, dtype, width):
+    """Read-only (rows, width) numpy view of a file through mmap, shared between processes like map_floats"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        rows = size // (np.dtype(dtype).itemsize * width)
+        if rows == 0:
+            return np.zeros((0, width), dtype=dtype)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mapped, dtype=dtype, count=rows * width).reshape(rows, width)
+
+
+def train_pq(vectors, subspaces=PQ_SUBSPACES, centroids=PQ_CENTROIDS, iterations=10, seed=0):
+    """(subspaces, centroids, dim / subspaces) codebook: k-means on each slice of the vectors"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rows, dim = vectors.shape
+    if dim % subspaces:
+        raise ValueError(f"Dimension {dim} is not divisible into {subspaces} subspaces")
+    width = dim // subspaces
+    centroids = min(centroids, rows)
+    rng = np.random.default_rng(seed)
+    codebook = np.empty((subspaces, centroids, width), dtype=np.float32)
+    for m in range(subspaces):
+        part = np.ascontiguousarray(vectors[:, m * width:(m + 1) * width])
+        centers = part[rng.choice(rows, centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assigned = _nearest(part, centers)
+            counts = np.bincount(assigned, minlength=centroids)
+            sums = np.stack([np.bincount(assigned, part[:, d], minlength=centroids) for d in range(width)], axis=1)
+            filled = counts > 0
+            centers[filled] = sums[filled] / counts[filled, None]
+            # Re-seed empty clusters from random points rather than leaving dead codes
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centers[empty] = part[rng.choice(rows, len(empty), replace=False)]
+        codebook[m] = centers
+    return codebook
+
+
+def _nearest(part, centers):
+    distances = part @ centers.T
+    distances *= -2
+    distances += (centers * centers).sum(axis=1)
+    return distances.argmin(axis=1)
+
+
+def pq_encode(vectors, codebook):
+    subspaces, _, width = codebook.shape
+    vectors = np.asarray(vectors, dtype=np.float32)
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for m in range(subspaces):
+        codes[:, m] = _nearest(vectors[:, m * width:(m + 1) * width], codebook[m])
+    return codes
+
+
+def int8_encode(vectors):
+    """Symmetric per-vector int8 codes and the float32 scale that restores each row"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+    """
+    Compressed codes for the rows of an EmbeddingMatrix: float16 (2 bytes per dimension),
+    int8 with a per-vector scale (1 byte per dimension) or product quantization
+    (PQ_SUBSPACES bytes per vector). search() scores the codes, then re-ranks the best
+    `rerank` rows with their exact float32 vectors, so only those pages of the mapped
+    matrix are read.
+
+    Codes live next to the matrix (`<path>.f16`, `<path>.i8` and `<path>.i8s`, or
+    `<path>.pq` and the `<path>.pq.npy` codebook) and are mapped read-only the same way.
+    Rows appended to the matrix are encoded on the next update() or search(); the
+    codebook is trained on the rows present at the first update and kept afterwards.
+
+    Scoring float16 or int8 codes converts them to float32, which costs more than the
+    matrix product itself; up to `decode_cache_mb` of decoded blocks are kept so full
+    scans only pay it once. Row ranges per document ID (the part of a vector_id before
+    "#") are indexed as rows are encoded, so prefix searches score only those rows.
+    """
+
+    def __init__(self, matrix, mode=EMBEDDING_QUANTIZATION, rerank=QUANTIZED_RERANK,
+                 decode_cache_mb=QUANTIZED_DECODE_CACHE_MB):
+        if np is None:
+            raise ImportError("Quantized embeddings need numpy")
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {', '.join(QUANTIZATION_MODES)}")
+        self.matrix = matrix
+        self.mode = mode
+        self.rerank = rerank
+        self.codebook = None
+        self.codes = None
+        self.scales = None
+        self.decode_cache_bytes = decode_cache_mb * 2 ** 20
+        self._decoded = OrderedDict()
+        self._decoded_bytes = 0
+        self._decoded_lock = threading.Lock()
+        # document ID -> [[start, end), ...] row ranges, and the sorted document IDs for prefix lookups
+        self._doc_rows = {}
+        self._docs = []
+        self._indexed_rows = 0
+        suffix = {"float16": ".f16", "int8": ".i8", "pq": ".pq"}[mode]
+        self.codes_path = matrix.path + suffix
+        open(self.codes_path, "ab").close()
+        if mode == "int8":
+            open(matrix.path + ".i8s", "ab").close()
+        self._load()
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def bytes_per_vector(self):
+        return {"float16": 2 * self.matrix.dim, "int8": self.matrix.dim + 4, "pq": PQ_SUBSPACES}[self.mode]
+
+    def _load(self):
+        if self.mode == "float16":
+            self.codes = map_array(self.codes_path, np.float16, self.matrix.dim)
+        elif self.mode == "int8":
+            self.codes = map_array(self.codes_path, np.int8, self.matrix.dim)
+            self.scales = map_array(self.matrix.path + ".i8s", np.float32, 1)[:len(self.codes), 0]
+            self.codes = self.codes[:len(self.scales)]
+        else:
+            if self.codebook is None and os.path.exists(self.codes_path + ".npy"):
+                self.codebook = np.load(self.codes_path + ".npy", mmap_mode="r")
+            self.codes = map_array(self.codes_path, np.uint8, PQ_SUBSPACES)
+        # A partial last block may have grown
+        with self._decoded_lock:
+            for key in [key for key in self._decoded if key[1] - key[0] < SCORE_BLOCK]:
+                self._decoded_bytes -= self._decoded.pop(key).nbytes
+        self._index_ids()
+
+    def _index_ids(self):
+        """Extend the per-document row ranges to the rows encoded since the last call"""
+        ids = self.matrix.ids
+        for row in range(self._indexed_rows, min(len(self.codes), len(ids))):
+            doc = ids[row].split("#", 1)[0]
+            ranges = self._doc_rows.get(doc)
+            if ranges is None:
+                self._doc_rows[doc] = [[row, row + 1]]
+                bisect.insort(self._docs, doc)
+            elif ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+        self._indexed_rows = max(self._indexed_rows, min(len(self.codes), len(ids)))
+
+    def prefix_rows(self, prefix):
+        """Sorted rows whose vector_id starts with `prefix`, from the per-document ranges"""
+        doc_prefix, separator, _ = prefix.partition("#")
+        if separator:
+            docs = [doc_prefix] if doc_prefix in self._doc_rows else []
+        else:
+            start = bisect.bisect_left(self._docs, prefix)
+            end = bisect.bisect_left(self._docs, prefix + "\uffff")
+            docs = self._docs[start:end]
+        ranges = [np.arange(a, b) for doc in docs for a, b in self._doc_rows[doc]]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.sort(np.concatenate(ranges))
+        if separator and len(prefix) > len(doc_prefix) + 1:
+            # A prefix inside one document's chunk IDs: only that document's rows are checked
+            ids = self.matrix.ids
+            rows = rows[np.fromiter((ids[row].startswith(prefix) for row in rows), dtype=bool, count=len(rows))]
+        return rows
+
+    def update(self):
+        """Encode matrix rows that have no codes yet; returns the number encoded"""
+        self.matrix.refresh()
+        if len(self.codes) >= len(self.matrix):
+            return 0
+        with open(self.codes_path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have encoded them while we waited
+            self._load()
+            start = len(self.codes)
+            rows = self.matrix.matrix[start:]
+            if not len(rows):
+                return 0
+            if self.mode == "float16":
+                self._write(self.codes_path, start * self.bytes_per_vector, rows.astype(np.float16))
+            elif self.mode == "int8":
+                codes, scales = int8_encode(rows)
+                self._write(self.matrix.path + ".i8s", start * 4, scales)
+                self._write(self.codes_path, start * self.matrix.dim, codes)
+            else:
+                if self.codebook is None:
+                    sample = np.random.default_rng(0).choice(len(self.matrix), min(len(self.matrix), PQ_TRAIN_ROWS),
+                                                             replace=False)
+                    codebook = train_pq(self.matrix.matrix[np.sort(sample)], PQ_SUBSPACES)
+                    np.save(self.codes_path + ".npy", codebook)
+                    self.codebook = codebook
+                self._write(self.codes_path, start * PQ_SUBSPACES, pq_encode(rows, self.codebook))
+            self._load()
+        return len(rows)
+
+    def _write(self, path, offset, values):
+        with open(path, "r+b") as f:
+            # A writer that died mid-update may have left a partial block; overwrite it
+            f.seek(offset)
+            f.write(np.ascontiguousarray(values).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _decode(self, start, end):
+        """float32 rows of codes[start:end], int8 rows already multiplied by their scale"""
+        block = self.codes[start:end].astype(np.float32)
+        if self.mode == "int8":
+            block *= self.scales[start:end, None]
+        return block
+
+    def _decoded_block(self, start):
+        key = (start, min(start + SCORE_BLOCK, len(self.codes)))
+        with self._decoded_lock:
+            block = self._decoded.get(key)
+            if block is not None:
+                self._decoded.move_to_end(key)
+                return block
+        block = self._decode(*key)
+        if block.nbytes <= self.decode_cache_bytes:
+            with self._decoded_lock:
+                if key not in self._decoded:
+                    self._decoded[key] = block
+                    self._decoded_bytes += block.nbytes
+                while self._decoded_bytes > self.decode_cache_bytes:
+                    self._decoded_bytes -= self._decoded.popitem(last=False)[1].nbytes
+        return block
+
+    def approximate_scores(self, queries, rows=None):
+        """
+        (queries, rows) inner products of normalized float32 queries with the codes of
+        `rows` (all rows by default). Each block of codes is decoded once for the whole
+        batch, so scoring several queries together costs little more than one.
+        """
+        if self.mode != "pq":
+            if rows is not None:
+                block = self.codes[rows].astype(np.float32)
+                if self.mode == "int8":
+                    block *= self.scales[rows, None]
+                return queries @ block.T
+            scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+            for i in range(0, len(self.codes), SCORE_BLOCK):
+                block = self._decoded_block(i)
+                scores[:, i:i + len(block)] = queries @ block.T
+            return scores
+
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        subspaces, centroids, width = self.codebook.shape
+        # Per-subspace dot products with every centroid, then one table lookup per code
+        tables = np.einsum("mkd,qmd->qmk", self.codebook, queries.reshape(len(queries), subspaces, width))
+        offsets = np.arange(subspaces) * centroids
+        for i in range(0, len(codes), SCORE_BLOCK):
+            positions = codes[i:i + SCORE_BLOCK] + offsets
+            for q, table in enumerate(tables):
+                scores[q, i:i + len(positions)] = table.ravel().take(positions).sum(axis=1)
+        return scores
+
+    def search(self, query, top_n=10, prefix=None, rerank=None):
+        """[(vector_id, cosine)] like EmbeddingMatrix.search, from approximate scores re-ranked exactly"""
+        return self.search_many([query], top_n, prefix, rerank)[0]
+
+    def search_many(self, queries, top_n=10, prefix=None, rerank=None):
+        """search() for a batch of queries, sharing the decoding of each block of codes"""
+        self.update()
+        if not len(self.codes):
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.matrix.dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        rows = None
+        if prefix is not None:
+            rows = self.prefix_rows(prefix)
+            if not len(rows):
+                return [[] for _ in queries]
+        scores = self.approximate_scores(queries, rows)
+        keep = min(max(top_n, self.rerank if rerank is None else rerank), scores.shape[1])
+        results = []
+        for query, row_scores in zip(queries, scores):
+            best = np.argpartition(-row_scores, keep - 1)[:keep]
+            candidates = best if rows is None else rows[best]
+            # Exact cosine from the mapped float32 rows, read in row order
+            candidates.sort()
+            exact = self.matrix.matrix[candidates] @ query
+            order = np.argsort(-exact)[:top_n]
+            results.append([(self.matrix.ids[candidates[i]], float(exact[i])) for i in order])
+        return results
+
+
+def open_index(matrix, mode=EMBEDDING_QUANTIZATION, rerank=QUANTIZED_RERANK):
+    """The matrix itself for "none", else a QuantizedIndex over it; both have search(query, top_n, prefix)"""
+    if mode == "none":
+        return matrix
+    return QuantizedIndex(matrix, mode, rerank)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def clustered_vectors(rows, dim, clusters=500, spread=0.35, seed=0):
+    """Synthetic normalized embeddings around `clusters` topics, closer to real resume chunks than pure noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)]
+    vectors += spread * rng.standard_normal((rows, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _timed(search, queries, batch):
+    """Results and queries per second, issuing the queries `batch` at a time"""
+    started = time.perf_counter()
+    results = []
+    for i in range(0, len(queries), batch):
+        results.extend(search(queries[i:i + batch]))
+    return results, len(queries) / (time.perf_counter() - started)
+
+
+def _exact_many(matrix, queries, top_n):
+    scores = queries @ matrix.matrix.T
+    best = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    return [[matrix.ids[row] for row in rows] for rows in best]
+
+
+def benchmark(rows=100000, dim=EMBEDDING_DIM, queries=128, top_n=10, rerank=QUANTIZED_RERANK, batch=32,
+              decode_cache_mb=QUANTIZED_DECODE_CACHE_MB):
+    """
+    Bytes per vector, code size, build time, QPS (one query at a time and in batches)
+    and recall@top_n against exact float32 search, for each quantization mode with and
+    without exact re-ranking; float16 and int8 also without the decode cache.
+    """
+    if np is None:
+        print("The quantization benchmark needs numpy")
+        return
+    vectors = clustered_vectors(rows, dim)
+    rng = np.random.default_rng(1)
+    # Queries near stored vectors, as a resume chunk is near its job description
+    picks = vectors[rng.integers(0, rows, queries)] + rng.standard_normal((queries, dim), dtype=np.float32) / dim ** 0.5
+    picks /= np.linalg.norm(picks, axis=1, keepdims=True)
+    with tempfile.TemporaryDirectory() as directory:
+        matrix = EmbeddingMatrix(os.path.join(directory, "embeddings"), dim)
+        for start in range(0, rows, 50000):
+            matrix.append([f"row-{i}" for i in range(start, min(start + 50000, rows))], vectors[start:start + 50000])
+        del vectors
+        truth, single = _timed(lambda q: [[i for i, _ in matrix.search(q[0], top_n)]], picks, 1)
+        _, batched = _timed(lambda q: _exact_many(matrix, q, top_n), picks, batch)
+        truth = [set(result) for result in truth]
+        float32_mb = rows * dim * 4 / 2 ** 20
+        print(f"{rows} x {dim} vectors, {queries} queries, recall@{top_n} against exact float32 search")
+        print(f"{'mode':26s} {'bytes/vec':>9s} {'codes MB':>9s} {'build s':>8s} {'QPS':>7s} "
+              f"{f'QPS x{batch}':>8s} {f'recall@{top_n}':>10s}")
+        print(f"{'float32 exact':26s} {dim * 4:9d} {float32_mb:9.1f} {0:8.1f} {single:7.1f} {batched:8.1f} {1:10.3f}")
+        for mode in QUANTIZATION_MODES:
+            index = QuantizedIndex(matrix, mode, rerank, decode_cache_mb)
+            started = time.perf_counter()
+            index.update()
+            build = time.perf_counter() - started
+            codes_mb = rows * index.bytes_per_vector / 2 ** 20
+            runs = [(f"{mode} approximate", index, top_n), (f"{mode} + rerank {rerank}", index, rerank)]
+            if mode == "pq":
+                runs.append((f"{mode} + rerank {5 * rerank}", index, 5 * rerank))
+            else:
+                runs.append((f"{mode} + rerank, no cache", QuantizedIndex(matrix, mode, rerank, 0), rerank))
+            for label, searched, depth in runs:
+                results, single = _timed(lambda q: searched.search_many(q, top_n, rerank=depth), picks, 1)
+                _, batched = _timed(lambda q: searched.search_many(q, top_n, rerank=depth), picks, batch)
+                recall = np.mean([len(t & {vector_id for vector_id, _ in r}) / top_n for t, r in zip(truth, results)])
+                print(f"{label:26s} {index.bytes_per_vector:9d} {codes_mb:9.1f} {build:8.1f} {single:7.1f} "
+                      f"{batched:8.1f} {recall:10.3f}")
+        print(f"Re-ranking reads {rerank} float32 rows ({rerank * dim * 4 / 1024:.0f} KB) per query from the mapped "
+              f"{float32_mb:.0f} MB matrix, which need not stay resident; PQ needs a deeper re-rank for the same recall")
+        print(f"float16 and int8 scans convert codes to float32: without the decode cache they are slower than exact "
+              f"float32 search, and the cache takes up to {min(decode_cache_mb, float32_mb):.0f} MB of private memory "
+              f"per process, so they save memory only where the cache is kept small")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory, QPS and recall of quantized embedding search")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=128)
+    parser.add_argument("--rerank", type=int, default=QUANTIZED_RERANK)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--decode-cache-mb", type=int, default=QUANTIZED_DECODE_CACHE_MB)
+    args = parser.parse_args()
+    benchmark(args.rows, args.dim, args.queries, rerank=args.rerank, batch=args.batch,
+              decode_cache_mb=args.decode_cache_mb)
+
+
+if __name__ == "__main__":
+    main()
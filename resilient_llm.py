@@ -0,0 +1,446 @@
+import argparse
+import asyncio
+import contextvars
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from analysis_engine import StubLLM, create_llm, model_name
+
+# Hard bounds on one model's share of a call, in seconds; inside them the deadline follows observed
+# latency. Primary plus fallback stay under the Streamlit client's 180 s timeout.
+LLM_MIN_TIMEOUT = float(os.getenv("LLM_MIN_TIMEOUT", "5"))
+LLM_MAX_TIMEOUT = float(os.getenv("LLM_MAX_TIMEOUT", "60"))
+# Send a duplicate request when the first has not answered by the p90 latency; 0 disables hedging
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1").lower() in ("1", "true", "yes")
+# Faster model used when the primary times out, fails or its circuit is open; empty disables the fallback.
+# Unset, each backend uses its entry in FALLBACK_MODELS.
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL")
+FALLBACK_MODELS = {
+    "openai": "gpt-4o-mini",
+    "groq": "llama-3.1-8b-instant",
+    "stub": "stub-fallback",
+}
+# Threads running attempts, shared by every ResilientLLM in the process. With a scheduler,
+# attempts in flight are bounded by its capacity and each calling thread waits for at most
+# one more, so this covers capacity plus the server's threads (16 each at most by default).
+ATTEMPT_WORKERS = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when neither the primary model nor the fallback produced a response in time"""
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies; percentiles fall back to `default` until `min_samples` are seen"""
+
+    def __init__(self, window=200, min_samples=20, default=30.0):
+        self.min_samples = min_samples
+        self.default = default
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker: opens after `failure_threshold` consecutive failures, rejects
+    calls for `reset_seconds`, then lets one trial call through (half-open) and closes
+    again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+# Breakers are shared by every ResilientLLM in the process, one per provider name
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider, **kwargs):
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(**kwargs)
+        return _breakers[provider]
+
+
+def get_executor():
+    """Thread pool for attempts, shared by every ResilientLLM in the process; threads start on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ATTEMPT_WORKERS, thread_name_prefix="llm-attempt")
+        return _executor
+
+
+class ResilientLLM:
+    """
+    Drop-in wrapper around a chat model (invoke/ainvoke) for calls on the request path.
+
+    The deadline of a call is `timeout_multiplier` times the observed p99 latency,
+    clamped to [min_timeout, max_timeout]. If the first attempt has not answered by the
+    observed p90, a duplicate is sent and the first response wins (an attempt that fails
+    early is retried the same way), up to `max_attempts`. When the deadline passes or
+    every attempt fails, the call goes to `fallback`, a faster model, and failing that
+    raises LLMUnavailableError. Each provider has a CircuitBreaker; while the primary's
+    is open, calls go straight to the fallback.
+
+    With `scheduler` (an llm_scheduler.FairScheduler), every attempt holds its own slot,
+    so the provider never sees more than the scheduler's capacity in flight: first
+    attempts, retries and the fallback wait for a slot, and the deadline starts once the
+    first attempt has one. A hedge is only sent when a slot is free right away.
+
+    `stats` counts calls, hedges, skipped hedges (no free slot), fallbacks, timeouts and
+    rejected (circuit open) calls.
+    """
+
+    def __init__(self, llm, fallback=None, provider=None, fallback_provider=None, hedge=LLM_HEDGE, max_attempts=2,
+                 min_timeout=LLM_MIN_TIMEOUT, max_timeout=LLM_MAX_TIMEOUT, timeout_multiplier=2.0, tracker=None,
+                 fallback_tracker=None, breaker=None, fallback_breaker=None, scheduler=None):
+        self.llm = llm
+        self.fallback = fallback
+        self.scheduler = scheduler
+        self.hedge = hedge
+        self.max_attempts = max_attempts
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.tracker = tracker or LatencyTracker(default=max_timeout / 4)
+        self.fallback_tracker = fallback_tracker or LatencyTracker(default=max_timeout / 4)
+        self.breaker = breaker or get_breaker(provider or model_name(llm))
+        self.fallback_breaker = fallback_breaker or (
+            get_breaker(fallback_provider or model_name(fallback)) if fallback is not None else None
+        )
+        self.stats = {"calls": 0, "attempts": 0, "hedges": 0, "hedges_skipped": 0, "fallbacks": 0, "timeouts": 0,
+                      "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        # Cache keys and metrics keep naming the primary model
+        return model_name(self.llm)
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def deadlines(self, tracker):
+        """(hedge_after, timeout) in seconds from the tracker's current percentiles"""
+        timeout = min(max(tracker.percentile(0.99) * self.timeout_multiplier, self.min_timeout), self.max_timeout)
+        return min(tracker.percentile(0.9), timeout), timeout
+
+    def _timed(self, llm, tracker, prompt, kwargs, ticket, granted):
+        if self.scheduler is not None and ticket is None:
+            # Waits for a slot under the caller's schedule_as() tenant and priority
+            with self.scheduler.slot():
+                return self._call(llm, tracker, prompt, kwargs, granted)
+        try:
+            return self._call(llm, tracker, prompt, kwargs, granted)
+        finally:
+            if ticket is not None:
+                self.scheduler.release(ticket)
+
+    @staticmethod
+    def _call(llm, tracker, prompt, kwargs, granted):
+        granted.set()
+        started = time.perf_counter()
+        response = llm.invoke(prompt, **kwargs)
+        # Abandoned attempts still report, so slow responses keep the tail percentiles honest
+        tracker.record(time.perf_counter() - started)
+        return response
+
+    def _submit(self, llm, tracker, prompt, kwargs, ticket=None):
+        """
+        Start an attempt holding `ticket`, or waiting for a scheduler slot without one;
+        returns (future, event set once the attempt has its slot)
+        """
+        granted = threading.Event()
+        # Attempts run in the caller's context, so cost_ledger.attribute() labels and the schedule follow them
+        future = get_executor().submit(contextvars.copy_context().run, self._timed, llm, tracker, prompt, kwargs,
+                                       ticket, granted)
+        return future, granted
+
+    def _race(self, llm, tracker, breaker, prompt, kwargs):
+        """Run hedged attempts on one model; returns the first response, or raises the last error"""
+        hedge_after, timeout = self.deadlines(tracker)
+        future, granted = self._submit(llm, tracker, prompt, kwargs)
+        # Time queued for a scheduler slot does not count against the deadline
+        granted.wait()
+        started = time.monotonic()
+        pending = {future}
+        attempts = 1
+        self._count("attempts")
+        hedge = self.hedge
+        error = None
+        while True:
+            if not pending and attempts < self.max_attempts:
+                pending.add(self._submit(llm, tracker, prompt, kwargs)[0])
+                attempts += 1
+                self._count("attempts")
+            elapsed = time.monotonic() - started
+            if elapsed >= timeout or not pending:
+                break
+            if hedge and attempts < self.max_attempts:
+                wait_for = min(hedge_after, timeout) - elapsed
+                if wait_for <= 0:
+                    ticket = self.scheduler.try_acquire() if self.scheduler is not None else None
+                    if self.scheduler is not None and ticket is None:
+                        # No spare capacity: keep waiting on the attempts already sent
+                        self._count("hedges_skipped")
+                        hedge = False
+                        continue
+                    pending.add(self._submit(llm, tracker, prompt, kwargs, ticket)[0])
+                    attempts += 1
+                    self._count("attempts")
+                    self._count("hedges")
+                    continue
+            else:
+                wait_for = timeout - elapsed
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                breaker.record_success()
+                return response
+        breaker.record_failure()
+        if pending:
+            self._count("timeouts")
+            raise TimeoutError(f"{model_name(llm)} did not respond within {timeout:.1f} s")
+        raise error
+
+    def invoke(self, prompt, **kwargs):
+        self._count("calls")
+        error = None
+        if self.breaker.allow():
+            try:
+                return self._race(self.llm, self.tracker, self.breaker, prompt, kwargs)
+            except Exception as e:
+                error = e
+        else:
+            self._count("rejected")
+            error = LLMUnavailableError(f"Circuit for {model_name(self.llm)} is open")
+        if self.fallback is not None and self.fallback_breaker.allow():
+            self._count("fallbacks")
+            try:
+                return self._race(self.fallback, self.fallback_tracker, self.fallback_breaker, prompt, kwargs)
+            except Exception as e:
+                raise LLMUnavailableError(f"Primary and fallback models failed: {e}") from error
+        raise LLMUnavailableError(f"{model_name(self.llm)} failed: {error}") from error
+
+    async def ainvoke(self, prompt, **kwargs):
+        """Async variant of invoke; attempts run on the shared attempt thread pool"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: context.run(self.invoke, prompt, **kwargs))
+
+
+def create_resilient_llm(backend="openai", api_key=None, model=None, fallback_model=None, ledger=None, scheduler=None,
+                         **kwargs):
+    """
+    create_llm for the primary model (and the fallback model on the same backend) wrapped
+    in ResilientLLM. With a cost_ledger.CostLedger, every attempt on either model is
+    recorded there, hedged duplicates included; with an llm_scheduler.FairScheduler, every
+    attempt holds one of its slots. `fallback_model` defaults to LLM_FALLBACK_MODEL, else
+    the backend's entry in FALLBACK_MODELS.
+    """
+    if fallback_model is None:
+        fallback_model = LLM_FALLBACK_MODEL if LLM_FALLBACK_MODEL is not None else FALLBACK_MODELS.get(backend)
+    options = dict(kwargs, model=model) if model else dict(kwargs)
+    if backend != "stub":
+        # Bound abandoned attempts at the client too
+        options.setdefault("timeout", LLM_MAX_TIMEOUT)
+    llm = create_llm(backend, api_key=api_key, **options)
+    fallback = None
+    if fallback_model and fallback_model != model:
+        fallback = create_llm(backend, api_key=api_key, **dict(options, model=fallback_model))
+    if ledger is not None:
+        from cost_ledger import MeteredLLM
+        llm = MeteredLLM(llm, ledger, api_key=api_key)
+        fallback = MeteredLLM(fallback, ledger, api_key=api_key) if fallback is not None else None
+    return ResilientLLM(llm, fallback=fallback, provider=f"{backend}:{model_name(llm)}",
+                        fallback_provider=f"{backend}:{fallback_model}", scheduler=scheduler)
+
+
+# ---------------------------------------------------------------------------
+# Tail-latency demo
+# ---------------------------------------------------------------------------
+
+def tail_latency(median, slow_rate=0.08, slow_factor=5.0, stall_rate=0.02, stall_factor=25.0, seed=0):
+    """
+    Stub latency sampler: lognormal around `median` seconds, with `slow_rate` of calls
+    `slow_factor` times slower and `stall_rate` stalled for `stall_factor` times the median.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def sample():
+        with lock:
+            roll, jitter = rng.random(), rng.lognormvariate(0, 0.25)
+        if roll < stall_rate:
+            return median * stall_factor * jitter
+        if roll < stall_rate + slow_rate:
+            return median * slow_factor * jitter
+        return median * jitter
+
+    return sample
+
+
+def _stub(median, model, seed, outage=None):
+    sample = tail_latency(median, seed=seed)
+
+    def respond(prompt):
+        if outage is not None and outage.is_set():
+            time.sleep(median * 0.1)
+            raise ConnectionError(f"{model} unavailable")
+        time.sleep(sample())
+        return '{"score": 70}'
+
+    return StubLLM(respond=respond, model=model)
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+    return pick(0.5), pick(0.9), pick(0.99), ordered[-1]
+
+
+def demo(requests=400, concurrency=16, median=0.05, fallback_median=0.02, max_timeout=1.5):
+    """
+    Latency percentiles of bare invoke versus ResilientLLM on stub models with injected
+    tail latency (times are scaled down: `median` stands in for a multi-second GPT-4o call),
+    then a primary outage showing the circuit breaker.
+    """
+    print(f"{requests} requests, {concurrency} concurrent; primary median {median * 1000:.0f} ms with 8% slow (5x) "
+          f"and 2% stalled (25x) calls; fallback median {fallback_median * 1000:.0f} ms")
+
+    def run(invoke):
+        latencies, failures = [], 0
+
+        def one(i):
+            started = time.perf_counter()
+            try:
+                invoke(f"prompt {i}")
+            except Exception:
+                return None
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for latency in executor.map(one, range(requests)):
+                if latency is None:
+                    failures += 1
+                else:
+                    latencies.append(latency)
+        return latencies, failures
+
+    def warm(tracker):
+        # Percentiles from an earlier window of traffic, as a long-running process would have
+        sample = tail_latency(median, seed=99)
+        for _ in range(200):
+            tracker.record(sample())
+        return tracker
+
+    setups = [
+        ("bare invoke", _stub(median, "primary", 1).invoke, None),
+        ("hedged", None, dict(hedge=True, fallback=False)),
+        ("hedged + fallback", None, dict(hedge=True, fallback=True)),
+    ]
+    print(f"{'':20s} {'p50 ms':>8s} {'p90 ms':>8s} {'p99 ms':>8s} {'max ms':>8s} {'failed':>7s} {'extra calls':>12s} "
+          f"{'fallbacks':>10s}")
+    for label, invoke, options in setups:
+        wrapper = None
+        if invoke is None:
+            wrapper = ResilientLLM(
+                _stub(median, "primary", 1),
+                fallback=_stub(fallback_median, "fallback", 2) if options["fallback"] else None,
+                hedge=options["hedge"], min_timeout=median * 4, max_timeout=max_timeout,
+                tracker=warm(LatencyTracker()), breaker=CircuitBreaker(), fallback_breaker=CircuitBreaker(),
+            )
+            invoke = wrapper.invoke
+        latencies, failures = run(invoke)
+        p50, p90, p99, worst = _percentiles(latencies)
+        extra = f"{(wrapper.stats['attempts'] - wrapper.stats['calls']) / requests * 100:.1f}%" if wrapper else "-"
+        fallbacks = str(wrapper.stats["fallbacks"]) if wrapper else "-"
+        print(f"{label:20s} {p50 * 1000:8.0f} {p90 * 1000:8.0f} {p99 * 1000:8.0f} {worst * 1000:8.0f} {failures:7d} "
+              f"{extra:>12s} {fallbacks:>10s}")
+
+    outage = threading.Event()
+    outage.set()
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=60)
+    wrapper = ResilientLLM(_stub(median, "primary", 3, outage), fallback=_stub(fallback_median, "fallback", 4),
+                           min_timeout=median * 4, max_timeout=max_timeout, tracker=warm(LatencyTracker()),
+                           breaker=breaker, fallback_breaker=CircuitBreaker())
+    latencies, failures = run(wrapper.invoke)
+    p50, p90, p99, worst = _percentiles(latencies)
+    print(f"Primary outage: breaker {breaker.state} after {wrapper.stats['calls'] - wrapper.stats['rejected']} "
+          f"primary calls, {wrapper.stats['rejected']} calls sent straight to the fallback; "
+          f"p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms, {failures} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail-latency demo of hedged, fallback-backed LLM calls on stub models")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--median-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    demo(args.requests, args.concurrency, args.median_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from resume_store import PROMPT_PREFIX, iter_labeled_entries
+
+# 32-bit shingle hashes; empty one-permutation bins are filled from their right
+# neighbour shifted past this range so they never collide with a real value.
+HASH_RANGE = 1 << 32
+EMPTY_BIN = -1
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    doc_id TEXT PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payloads (
+    doc_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (doc_id, key)
+);
+"""
+
+
+def content_hash(text):
+    """Stable identifier for a document's exact text"""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def shingles(text, size=3):
+    """Lowercased word n-grams, so whitespace and punctuation edits do not matter"""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash_signature(shingle_set, num_perm=128):
+    """
+    One-permutation MinHash: every shingle is hashed once and only the minimum
+    per bin is kept, then empty bins are densified by rotation. This keeps the
+    signature cost linear in the number of shingles instead of num_perm times it.
+    """
+    bins = [EMPTY_BIN] * num_perm
+    for shingle in shingle_set:
+        h = zlib.crc32(shingle.encode("utf-8", "surrogatepass"))
+        index = h % num_perm
+        value = h // num_perm
+        current = bins[index]
+        if current == EMPTY_BIN or value < current:
+            bins[index] = value
+
+    if all(value == EMPTY_BIN for value in bins):
+        return bins
+
+    signature = list(bins)
+    for i in range(num_perm):
+        if bins[i] != EMPTY_BIN:
+            continue
+        distance = 1
+        while bins[(i + distance) % num_perm] == EMPTY_BIN:
+            distance += 1
+        signature[i] = bins[(i + distance) % num_perm] + distance * HASH_RANGE
+    return signature
+
+
+def estimate_similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity between two signatures"""
+    if not signature_a or signature_a[0] == EMPTY_BIN or signature_b[0] == EMPTY_BIN:
+        return 0.0
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH index of resume texts.
+
+    Signatures and payloads are persisted in SQLite: one row per document signature and
+    one row per (document, key) payload, e.g. the analysis of a resume (by content hash)
+    against a JD (by its hash), so storing a result never rewrites earlier ones. The LSH
+    buckets are kept in memory and pick up signatures that other processes sharing the
+    database added since the last lookup.
+    """
+
+    def __init__(self, path=None, num_perm=128, bands=16, threshold=0.8, shingle_size=3):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.path = path or ":memory:"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.signatures = {}
+        self.buckets = {}
+        self._last_rowid = 0
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        if self.path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def reopen(self):
+        """New connection for a process forked after the index was opened (see CandidateProfileStore.reopen)"""
+        with self._lock:
+            self._connect()
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self.signatures)
+
+    def __contains__(self, doc_id):
+        with self._lock:
+            self._refresh()
+            return doc_id in self.signatures
+
+    def signature(self, text):
+        return minhash_signature(shingles(text, self.shingle_size), self.num_perm)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, tuple(signature[start:start + self.rows])
+
+    def _insert(self, doc_id, signature):
+        if doc_id in self.signatures:
+            return
+        self.signatures[doc_id] = signature
+        if signature[0] == EMPTY_BIN:
+            return
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(doc_id)
+
+    def _refresh(self):
+        """Load signatures written since the last refresh, by this or another process"""
+        rows = self._connection.execute(
+            "SELECT rowid, doc_id, signature FROM signatures WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+        ).fetchall()
+        for rowid, doc_id, signature in rows:
+            self._insert(doc_id, list(array("q", signature)))
+            self._last_rowid = rowid
+
+    def add(self, doc_id, text=None, signature=None, payload=None, key=""):
+        """Index a document; adding an id that is already present only stores its payload under `key`"""
+        if signature is None:
+            signature = self.signature(text or "")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO signatures (doc_id, signature) VALUES (?, ?)",
+                (doc_id, array("q", signature).tobytes()),
+            )
+            if payload is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO payloads VALUES (?, ?, ?)", (doc_id, key, json.dumps(payload))
+                )
+        return signature
+
+    def set_payload(self, doc_id, payload, key=""):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO payloads VALUES (?, ?, ?)", (doc_id, key, json.dumps(payload)))
+
+    def get_payload(self, doc_id, key=""):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT payload FROM payloads WHERE doc_id = ? AND key = ?", (doc_id, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, text=None, signature=None):
+        """Return (doc_id, similarity) pairs at or above the threshold, best first"""
+        if signature is None:
+            signature = self.signature(text or "")
+        if signature[0] == EMPTY_BIN:
+            return []
+        candidates = set()
+        with self._lock:
+            self._refresh()
+            for key in self._band_keys(signature):
+                candidates.update(self.buckets.get(key, ()))
+        matches = []
+        for doc_id in candidates:
+            similarity = estimate_similarity(signature, self.signatures[doc_id])
+            if similarity >= self.threshold:
+                matches.append((doc_id, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def find_duplicate(self, text=None, signature=None):
+        """Return the closest (doc_id, similarity) near-duplicate, or None"""
+        matches = self.query(text, signature)
+        return matches[0] if matches else None
+
+
+def resume_text_from_prompt(prompt):
+    return prompt[len(PROMPT_PREFIX):] if prompt.startswith(PROMPT_PREFIX) else prompt
+
+
+def dedupe_labeled_jsonl(input_file, output_file, threshold=0.8, index_path=None):
+    """
+    Stream a labeled JSONL file and keep only the first of each group of
+    near-duplicate resumes. Returns (kept, dropped) counts.
+    """
+    index = NearDuplicateIndex(path=index_path, threshold=threshold)
+    kept = dropped = 0
+    with open(output_file, "w") as out:
+        for entry in iter_labeled_entries(input_file):
+            text = resume_text_from_prompt(entry.get("prompt", ""))
+            signature = index.signature(text)
+            if index.find_duplicate(signature=signature):
+                dropped += 1
+                continue
+            index.add(content_hash(text), signature=signature)
+            out.write(json.dumps(entry) + "\n")
+            kept += 1
+    return kept, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove near-duplicate resumes from a labeled JSONL file")
+    parser.add_argument("input_file", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("output_file", nargs="?", default="labeled_resumes.dedup.jsonl")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    kept, dropped = dedupe_labeled_jsonl(args.input_file, args.output_file, args.threshold)
+    elapsed = time.perf_counter() - start
+    total = kept + dropped
+    print(f"✅ Kept {kept} of {total} resumes ({dropped} near-duplicates removed) in {args.output_file}")
+    if total:
+        print(f"Average time per resume: {elapsed / total * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,29 +6,49 @@ from langchain.prompts import PromptTemplate
 import json
 import os
 from dotenv import load_dotenv
+from resume_dedup import content_hash
+from profiler import profile_request
+from text_normalizer import normalize_text
+from ats_extractor import ATS_MIN_CONFIDENCE, load_extractor
+from resume_store import EXTRACTOR_SOURCE, LLM_SOURCE
+from cost_ledger import MeteredLLM
 
 
-def extract_and_label_resumes(resume_folder, llm, output_file, api_keys, current_key_index):
+def extract_and_label_resumes(resume_folder, llm, output_file, api_keys, current_key_index, extractor=None):
     """
-    Extract text from resumes, label them with the LLM, and save to a JSONL file for fine-tuning.
+    Extract text from resumes, label them with the local extractor (or the LLM when it
+    is not confident), and save to a JSONL file for fine-tuning.
     """
     labeled_data = []
+    # Labels by resume content hash; a near-duplicate can differ in exactly the fields being labeled
+    seen_resumes = {}
     resumes = [os.path.join(resume_folder, f) for f in os.listdir(resume_folder) if f.endswith('.pdf')]
 
     for resume_file in resumes:
         while True:
             try:
-                # Extract text from PDF
-                resume_text = extract_text_from_pdf(resume_file)
-                
-                # Process with the LLM for ATS-relevant fields
-                labeled_output = extract_ats_fields(resume_text, llm)
+                # A PROFILE_SAMPLE_RATE fraction of resumes is stack-profiled into PROFILE_DIR
+                with profile_request(f"label-{os.path.basename(resume_file)}"):
+                    # Extract text from PDF
+                    resume_text = extract_text_from_pdf(resume_file)
+
+                    # Reuse the label of an identical resume instead of another LLM call
+                    resume_hash = content_hash(resume_text)
+                    if resume_hash in seen_resumes:
+                        print(f"{resume_file} is identical to an earlier resume; reusing its label")
+                        labeled_output, source = seen_resumes[resume_hash]
+                    else:
+                        # Process with the LLM for ATS-relevant fields
+                        labeled_output, source = extract_ats_fields(resume_text, llm, extractor)
+                        if labeled_output:
+                            seen_resumes[resume_hash] = (labeled_output, source)
                 
                 if labeled_output:
-                    # Prepare JSONL entry
+                    # Prepare JSONL entry; "source" keeps extractor labels out of training
                     labeled_entry = {
                         "prompt": f"Extract key details from this resume:\n\n{resume_text}",
-                        "completion": labeled_output
+                        "completion": labeled_output,
+                        "source": source
                     }
                     labeled_data.append(labeled_entry)
                 break  # Exit the loop if successful
@@ -49,10 +69,19 @@ def extract_and_label_resumes(resume_folder, llm, output_file, api_keys, current
     print(f"✅ Labeled data saved to {output_file}")
 
 
-def extract_ats_fields(resume_text, llm):
+def extract_ats_fields(resume_text, llm, extractor=None, min_confidence=ATS_MIN_CONFIDENCE):
     """
-    Extract ATS-relevant fields using the LLM.
+    Extract ATS-relevant fields with the local extractor, falling back to the LLM
+    when any field's calibrated confidence is below `min_confidence`. Returns
+    (JSON fields or None, source), source being EXTRACTOR_SOURCE or LLM_SOURCE.
+    An extractor whose confidences were never calibrated is not used.
     """
+    if extractor is not None and extractor.calibrated:
+        fields, confidence = extractor.extract(resume_text)
+        if min(confidence.values()) >= min_confidence:
+            return json.dumps(fields), EXTRACTOR_SOURCE
+        print(f"Low extractor confidence ({min(confidence, key=confidence.get)}); using the LLM")
+
     analysis_prompt = PromptTemplate(
         input_variables=["resume"],
         template="""
@@ -74,7 +103,8 @@ def extract_ats_fields(resume_text, llm):
     )
     
     try:
-        analysis_input = {"resume": resume_text}
+        # Repair mojibake and strip layout noise so the prompt carries fewer tokens
+        analysis_input = {"resume": normalize_text(resume_text)}
         analysis_result = llm.invoke(analysis_prompt.format(**analysis_input))
         
         # Extract JSON output from the response
@@ -88,10 +118,10 @@ def extract_ats_fields(resume_text, llm):
 
         labeled_output = json.loads(json_str)
         
-        return json.dumps(labeled_output)
+        return json.dumps(labeled_output), LLM_SOURCE
     except Exception as e:
         print(f"Error extracting fields: {str(e)}")
-        return None
+        return None, LLM_SOURCE
 
 
 def initialize_llm(api_keys):
@@ -101,7 +131,8 @@ def initialize_llm(api_keys):
         groq_api_key=api_keys[current_key_index],
         model_name="llama-3.1-70b-versatile"
     )
-    return llm, current_key_index
+    # Tokens, cost and rate-limit errors per key go to the cost ledger
+    return MeteredLLM(llm, operation="extract_ats_fields", api_key=api_keys[current_key_index]), current_key_index
 
 
 def switch_api_key(api_keys, current_key_index):
@@ -112,7 +143,8 @@ def switch_api_key(api_keys, current_key_index):
         groq_api_key=api_keys[current_key_index],
         model_name="llama-3.1-70b-versatile"
     )
-    return llm, current_key_index
+    # Tokens, cost and rate-limit errors per key go to the cost ledger
+    return MeteredLLM(llm, operation="extract_ats_fields", api_key=api_keys[current_key_index]), current_key_index
 
 
 def main():
@@ -136,8 +168,11 @@ def main():
     # Output file for labeled data
     output_file = "labeled_resumes.jsonl"
 
+    # Local extractor trained with `python ats_extractor.py train`; None when no model exists
+    extractor = load_extractor()
+
     # Extract and label resumes
-    extract_and_label_resumes(resume_folder, llm, output_file, api_keys, current_key_index)
+    extract_and_label_resumes(resume_folder, llm, output_file, api_keys, current_key_index, extractor)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,243 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from array import array
+
+# Columns decoded from the ATS completion JSON produced by resume_score.extract_ats_fields
+ATS_FIELDS = ["Name", "Email", "Phone", "Experience", "Education", "Skills"]
+
+# Column name -> storage kind. "zstr" columns are zlib-compressed per row so a single
+# row can still be decoded without touching its neighbours.
+COLUMNS = {
+    "prompt": "zstr",
+    "Name": "str",
+    "Email": "str",
+    "Phone": "str",
+    "Experience": "str",
+    "Education": "str",
+    "Skills": "list",
+    "experience_years": "float",
+}
+
+PROMPT_PREFIX = "Extract key details from this resume:\n\n"
+# "source" of a labeled entry: who produced its completion. Entries without one predate
+# local labeling and came from the LLM; only LLM labels are used for training.
+LLM_SOURCE = "llm"
+EXTRACTOR_SOURCE = "ats_extractor"
+LIST_SEPARATOR = "\x1f"
+MISSING_VALUES = {"", "n/a", "na", "none", "null"}
+
+_YEARS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*\+?\s*(?:years?|yrs?)", re.IGNORECASE)
+_OFFSET = struct.Struct("<Q")
+_FLOAT = struct.Struct("<d")
+
+
+def parse_experience_years(experience):
+    """Return the first 'N years' figure in an Experience field, or NaN"""
+    match = _YEARS_PATTERN.search(experience or "")
+    return float(match.group(1)) if match else float("nan")
+
+
+def split_skills(skills):
+    """Split a comma separated Skills field into a clean list"""
+    if not skills or skills.strip().lower() in MISSING_VALUES:
+        return []
+    return [skill.strip() for skill in skills.split(",") if skill.strip()]
+
+
+def parse_labeled_entry(entry):
+    """Decode one labeled_resumes.jsonl entry into a flat row of typed columns"""
+    completion = entry.get("completion") or "{}"
+    fields = json.loads(completion) if isinstance(completion, str) else completion
+
+    prompt = entry.get("prompt", "")
+    row = {"prompt": prompt}
+    for field in ATS_FIELDS:
+        value = fields.get(field, "")
+        row[field] = value if isinstance(value, str) else json.dumps(value)
+    row["Skills"] = split_skills(row["Skills"])
+    row["experience_years"] = parse_experience_years(row["Experience"])
+    return row
+
+
+def is_llm_labeled(entry):
+    return entry.get("source", LLM_SOURCE) == LLM_SOURCE
+
+
+def iter_labeled_entries(jsonl_path):
+    """Lazily yield parsed entries from a labeled JSONL file"""
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class _ColumnWriter:
+    """Append-only writer for one column: a data blob plus an offsets file"""
+
+    def __init__(self, directory, name, kind):
+        self.kind = kind
+        self.data = open(os.path.join(directory, f"{name}.dat"), "wb")
+        self.index = open(os.path.join(directory, f"{name}.idx"), "wb")
+        self.position = 0
+        if kind != "float":
+            self.index.write(_OFFSET.pack(0))
+
+    def append(self, value):
+        if self.kind == "float":
+            self.data.write(_FLOAT.pack(value))
+            return
+        if self.kind == "list":
+            value = LIST_SEPARATOR.join(value)
+        payload = value.encode("utf-8", "surrogatepass")
+        if self.kind == "zstr":
+            payload = zlib.compress(payload, 6)
+        self.data.write(payload)
+        self.position += len(payload)
+        self.index.write(_OFFSET.pack(self.position))
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+def convert_jsonl(jsonl_path, store_dir):
+    """
+    Convert a labeled resumes JSONL file into a columnar store directory.
+    Rows are streamed, so memory use does not grow with the number of resumes.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    writers = {name: _ColumnWriter(store_dir, name, kind) for name, kind in COLUMNS.items()}
+    count = 0
+    try:
+        for entry in iter_labeled_entries(jsonl_path):
+            row = parse_labeled_entry(entry)
+            for name, writer in writers.items():
+                writer.append(row[name])
+            count += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump({"rows": count, "columns": COLUMNS, "source": os.path.basename(jsonl_path)}, f, indent=4)
+    return count
+
+
+def _map_file(path):
+    """Memory-map a file read-only; empty files map to an empty bytes object"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LabeledResumeStore:
+    """
+    Read-only view over a store written by convert_jsonl.
+    Every column is memory-mapped, so rows are decoded on demand in O(1) and
+    scanning a single column never touches the resume text blob.
+    """
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.store_dir = store_dir
+        self.rows = meta["rows"]
+        self.kinds = meta["columns"]
+        self._data = {}
+        self._index = {}
+        for name in self.kinds:
+            self._data[name] = _map_file(os.path.join(store_dir, f"{name}.dat"))
+            self._index[name] = _map_file(os.path.join(store_dir, f"{name}.idx"))
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for mapped in list(self._data.values()) + list(self._index.values()):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self._data.clear()
+        self._index.clear()
+
+    def value(self, column, row):
+        """Decode a single cell"""
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError(f"row {row} out of range for store with {self.rows} rows")
+
+        kind = self.kinds[column]
+        data = self._data[column]
+        if kind == "float":
+            return _FLOAT.unpack_from(data, row * _FLOAT.size)[0]
+
+        index = self._index[column]
+        start = _OFFSET.unpack_from(index, row * _OFFSET.size)[0]
+        end = _OFFSET.unpack_from(index, (row + 1) * _OFFSET.size)[0]
+        payload = data[start:end]
+        if kind == "zstr":
+            payload = zlib.decompress(payload)
+        text = payload.decode("utf-8", "surrogatepass")
+        if kind == "list":
+            return text.split(LIST_SEPARATOR) if text else []
+        return text
+
+    def __getitem__(self, row):
+        return {name: self.value(name, row) for name in self.kinds}
+
+    def __iter__(self):
+        for row in range(self.rows):
+            yield self[row]
+
+    def column(self, name):
+        """Yield every value of one column without decoding the others"""
+        if self.kinds[name] == "float":
+            data = self._data[name]
+            if data:
+                yield from array("d", data[: self.rows * _FLOAT.size])
+            return
+        for row in range(self.rows):
+            yield self.value(name, row)
+
+    def resume_text(self, row):
+        """Return the raw resume text of a row without the labeling instruction"""
+        prompt = self.value("prompt", row)
+        return prompt[len(PROMPT_PREFIX):] if prompt.startswith(PROMPT_PREFIX) else prompt
+
+    def completion(self, row):
+        """Rebuild the original completion JSON string for a row"""
+        fields = {field: self.value(field, row) for field in ATS_FIELDS}
+        fields["Skills"] = ", ".join(fields["Skills"])
+        return json.dumps(fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert labeled_resumes.jsonl into a columnar store")
+    parser.add_argument("jsonl_path", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("store_dir", nargs="?", default="labeled_resumes.store")
+    args = parser.parse_args()
+
+    count = convert_jsonl(args.jsonl_path, args.store_dir)
+    source_size = os.path.getsize(args.jsonl_path)
+    store_size = sum(
+        os.path.getsize(os.path.join(args.store_dir, f)) for f in os.listdir(args.store_dir)
+    )
+    print(f"✅ Stored {count} labeled resumes in {args.store_dir}")
+    print(f"Size: {source_size / 1024:.1f} KB -> {store_size / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
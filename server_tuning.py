@@ -0,0 +1,254 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+
+from resilient_llm import LLM_MAX_TIMEOUT
+
+SERVER_TUNING_PATH = os.environ.get("SERVER_TUNING_PATH", "server_tuning.json")
+# Share of the container memory limit the server may plan to use
+GUNICORN_MEMORY_FRACTION = float(os.environ.get("GUNICORN_MEMORY_FRACTION", "0.8"))
+GUNICORN_MAX_THREADS = int(os.environ.get("GUNICORN_MAX_THREADS", "16"))
+# gthread workers planned at most. The Prometheus registry behind /metrics, the LLM scheduler's
+# limits and fair queuing, and the circuit breakers live in each process, so with more workers
+# /metrics shows one worker per scrape and recruiters are only queued fairly within a worker
+GUNICORN_MAX_WORKERS = int(os.environ.get("GUNICORN_MAX_WORKERS", "1"))
+
+# Used until `python server_tuning.py measure` has written SERVER_TUNING_PATH: the preloaded
+# app (Flask, LangChain, OpenAI and the ATS model) in the master, what each forked worker
+# dirties on top of it, and the extra memory of one in-flight /analyze request
+DEFAULT_MEASUREMENTS = {"shared_mb": 180.0, "worker_mb": 40.0, "request_mb": 15.0}
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit():
+    """CPUs this process may use: the cgroup quota when there is one, else the affinity mask or CPU count"""
+    quota = _read("/sys/fs/cgroup/cpu.max")
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()[:2]
+        return int(limit) / int(period)
+    limit, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit and period and int(limit) > 0:
+        return int(limit) / int(period)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def memory_limit_mb():
+    """Container memory limit (cgroup v2 or v1), else total RAM"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        # v1 reports an unlimited group as a huge number
+        if value and value != "max" and int(value) < 1 << 50:
+            return int(value) / 2 ** 20
+    meminfo = _read("/proc/meminfo") or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) / 1024
+    return 1024.0
+
+
+def memory_mb(pid, field="Rss"):
+    """A /proc/<pid>/smaps_rollup field in MB: Rss, Pss (shared pages split between sharers) or Private (clean + dirty)"""
+    rollup = _read(f"/proc/{pid}/smaps_rollup") or ""
+    total = 0
+    for line in rollup.splitlines():
+        name = line.split(":", 1)[0]
+        if name == field or (field == "Private" and name in ("Private_Clean", "Private_Dirty")):
+            total += int(line.split()[1])
+    return total / 1024
+
+
+def child_pids(pid):
+    return [int(child) for child in (_read(f"/proc/{pid}/task/{pid}/children") or "").split()]
+
+
+def load_measurements(path=SERVER_TUNING_PATH):
+    measurements = dict(DEFAULT_MEASUREMENTS)
+    if os.path.exists(path):
+        with open(path) as f:
+            measurements.update(json.load(f))
+    return measurements
+
+
+def recommend(cpus, memory_mb, shared_mb, worker_mb, request_mb, worker_class="gthread",
+              max_threads=GUNICORN_MAX_THREADS, memory_fraction=GUNICORN_MEMORY_FRACTION,
+              max_workers=GUNICORN_MAX_WORKERS):
+    """
+    Workers and threads for a memory budget of `memory_fraction` of `memory_mb`, given the
+    preloaded state shared copy-on-write by all workers, each worker's private memory and
+    each in-flight request's. /analyze mostly waits on the LLM, so gthread workers hold
+    one process per CPU, at most `max_workers` (1 by default, as metrics and LLM
+    scheduling are per process), and cover the waiting with threads; sync workers serve
+    one request each, 2 x CPUs + 1. Memory caps both.
+    """
+    budget = memory_mb * memory_fraction - shared_mb
+    if worker_class == "gthread":
+        by_cpu = max(1, min(max_workers, math.ceil(cpus)))
+        workers = max(1, min(by_cpu, int(budget // (worker_mb + 2 * request_mb))))
+        threads = max(1, min(max_threads, int((budget / workers - worker_mb) // request_mb)))
+    else:
+        by_cpu = 2 * math.ceil(cpus) + 1
+        workers = max(1, min(by_cpu, int(budget // (worker_mb + request_mb))))
+        threads = 1
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "threads": threads,
+        "planned_mb": round(shared_mb + workers * (worker_mb + threads * request_mb)),
+        "budget_mb": round(memory_mb * memory_fraction),
+        "cpus": cpus,
+    }
+
+
+def gunicorn_settings(path=SERVER_TUNING_PATH):
+    """Recommendation for this machine; GUNICORN_WORKERS (or WEB_CONCURRENCY) and GUNICORN_THREADS override it"""
+    measurements = load_measurements(path)
+    settings = recommend(cpu_limit(), memory_limit_mb(), measurements["shared_mb"], measurements["worker_mb"],
+                         measurements["request_mb"], os.environ.get("GUNICORN_WORKER_CLASS", "gthread"))
+    workers = os.environ.get("GUNICORN_WORKERS") or os.environ.get("WEB_CONCURRENCY")
+    if workers:
+        settings["workers"] = int(workers)
+    if os.environ.get("GUNICORN_THREADS"):
+        settings["threads"] = int(os.environ["GUNICORN_THREADS"])
+    # Primary and fallback model deadlines, plus text extraction
+    settings["timeout"] = int(os.environ.get("GUNICORN_TIMEOUT", str(int(2 * LLM_MAX_TIMEOUT + 30))))
+    return settings
+
+
+def _stub_env(directory, llm_delay_ms):
+    return dict(os.environ, LLM_BACKEND="stub", STUB_LLM_DELAY_MS=str(llm_delay_ms), DEDUP_INDEX_PATH=":memory:",
+                CANDIDATE_PROFILE_DB=os.path.join(directory, "profiles.db"),
+                JD_CACHE_DIR=os.path.join(directory, "jd_cache"), RECORD_REQUESTS="0")
+
+
+class MemorySampler:
+    """Background sampler of a gunicorn process tree: peak total PSS and per-process private memory"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_pss = 0.0
+        self.peak_worker_private = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        workers = child_pids(self.pid)
+        pss = memory_mb(self.pid, "Pss") + sum(memory_mb(pid, "Pss") for pid in workers)
+        self.peak_pss = max(self.peak_pss, pss)
+        if workers:
+            self.peak_worker_private = max(self.peak_worker_private, max(memory_mb(pid, "Private") for pid in workers))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure(path=SERVER_TUNING_PATH, threads=8, duration=20.0, llm_delay_ms=2000.0):
+    """
+    Start the app under gunicorn (one preloaded worker), then record the master's RSS
+    (shared state), the worker's private memory at idle, and its growth under `threads`
+    concurrent replayed requests (per-request memory). Writes the numbers to `path`.
+    """
+    from traffic_replay import StubUploads, closed_loop, send, start_server, synthesize_log
+
+    entries = [e for e in synthesize_log(200) if e["endpoint"] == "/analyze"]
+    with tempfile.TemporaryDirectory() as directory:
+        process, base_url = start_server("gunicorn", 1, threads, _stub_env(directory, llm_delay_ms))
+        try:
+            uploads = StubUploads(directory)
+            # One request first, so lazily built clients count as worker memory, not request memory
+            send(base_url, entries[0], uploads)
+            worker = child_pids(process.pid)[0]
+            shared = memory_mb(process.pid, "Rss")
+            idle_private = memory_mb(worker, "Private")
+            with MemorySampler(process.pid) as sampler:
+                closed_loop(lambda entry: send(base_url, entry, uploads), entries, threads, duration)
+        finally:
+            process.terminate()
+            process.wait()
+    measurements = {
+        "shared_mb": round(shared, 1),
+        "worker_mb": round(idle_private, 1),
+        "request_mb": round(max(sampler.peak_worker_private - idle_private, 1.0) / threads, 1),
+    }
+    with open(path, "w") as f:
+        json.dump(measurements, f, indent=2)
+    print(f"Wrote {path}: {measurements}")
+    return measurements
+
+
+def benchmark(configs, concurrency_levels, duration=15.0, llm_delay_ms=2000.0):
+    """Throughput, p99 and peak memory (PSS of the whole process tree) per workers x threads configuration"""
+    from traffic_replay import StubUploads, closed_loop, send, start_server, summarize, synthesize_log
+
+    entries = synthesize_log(500)
+    print(f"Closed-loop replay of synthetic /analyze traffic, stub LLM {llm_delay_ms:.0f} ms, {duration:.0f} s per level")
+    print(f"{'workers x threads':>18s} {'clients':>8s} {'req/s':>7s} {'p99 ms':>8s} {'errors':>7s} {'peak PSS MB':>12s}")
+    for workers, threads in configs:
+        with tempfile.TemporaryDirectory() as directory:
+            process, base_url = start_server("gunicorn", workers, threads,
+                                             _stub_env(directory, llm_delay_ms))
+            uploads = StubUploads(directory)
+            try:
+                for clients in concurrency_levels:
+                    with MemorySampler(process.pid) as sampler:
+                        results, elapsed = closed_loop(lambda entry: send(base_url, entry, uploads), entries, clients,
+                                                       duration)
+                    row = summarize(results, elapsed)
+                    print(f"{f'{workers} x {threads}':>18s} {clients:8d} {row['throughput']:7.2f} "
+                          f"{row['p99_ms']:8.0f} {row['error_rate'] * 100:6.1f}% {sampler.peak_pss:12.0f}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive gunicorn workers and threads for this machine")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("show", help="print the settings gunicorn.conf.py will use")
+    measure_parser = subparsers.add_parser("measure", help="measure shared, per-worker and per-request memory")
+    measure_parser.add_argument("--threads", type=int, default=8)
+    measure_parser.add_argument("--duration", type=float, default=20.0)
+    bench_parser = subparsers.add_parser("benchmark", help="compare workers x threads configurations under load")
+    bench_parser.add_argument("--configs", default="1x1,1x8,2x4,2x8,4x4", help="comma-separated WORKERSxTHREADS")
+    bench_parser.add_argument("--concurrency", default="4,16,32")
+    bench_parser.add_argument("--duration", type=float, default=15.0)
+    bench_parser.add_argument("--llm-delay-ms", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        measure(threads=args.threads, duration=args.duration)
+    elif args.command == "benchmark":
+        configs = [tuple(int(n) for n in config.split("x")) for config in args.configs.split(",")]
+        benchmark(configs, [int(c) for c in args.concurrency.split(",")], args.duration, args.llm_delay_ms)
+    else:
+        measurements = load_measurements()
+        source = SERVER_TUNING_PATH if os.path.exists(SERVER_TUNING_PATH) else "defaults"
+        print(f"{cpu_limit():g} CPUs, {memory_limit_mb():.0f} MB memory limit; memory per {source}: "
+              f"{measurements['shared_mb']:.0f} MB shared, {measurements['worker_mb']:.0f} MB per worker, "
+              f"{measurements['request_mb']:.0f} MB per request")
+        print(json.dumps(gunicorn_settings(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EMBEDDING_DIM = 768
+RESUME_EMBEDDINGS_PATH = os.environ.get("RESUME_EMBEDDINGS_PATH", "resume_embeddings")
+
+
+def map_floats(path):
+    """
+    Read-only float32 view of a file through mmap. Every process mapping the same file
+    shares its pages through the page cache, so N gunicorn workers hold one copy.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"").cast("f")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast("f")
+
+
+class EmbeddingMatrix:
+    """
+    Append-only embedding matrix on disk (`<path>.f32` rows and `<path>.ids`, one JSON
+    string per line), read through mmap so that all processes share one copy.
+
+    Appends from any process go through an exclusive lock on `<path>.lock`, so there is
+    a single writer at a time: rows are written first and their IDs after, and a row
+    becomes visible to readers only when its ID line is complete. Readers pick up new
+    rows with refresh(). Vectors are L2-normalized on append, so search() is cosine.
+    """
+
+    def __init__(self, path=RESUME_EMBEDDINGS_PATH, dim=EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.ids = []
+        self.rows = {}
+        self._ids_offset = 0
+        self._values = memoryview(b"").cast("f")
+        self._matrix = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for suffix in (".f32", ".ids"):
+            open(path + suffix, "ab").close()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, vector_id):
+        return vector_id in self.rows
+
+    def refresh(self):
+        """Map rows appended since the last refresh (by any process); returns True if there were any"""
+        with open(self.path + ".ids", "rb") as f:
+            f.seek(self._ids_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if not complete:
+            return False
+        for line in complete.splitlines():
+            vector_id = json.loads(line)
+            self.rows[vector_id] = len(self.ids)
+            self.ids.append(vector_id)
+        self._ids_offset += len(complete)
+        self._values = map_floats(self.path + ".f32")[:len(self.ids) * self.dim]
+        self._matrix = None
+        return True
+
+    @property
+    def matrix(self):
+        """(rows, dim) read-only numpy view of the mapped file"""
+        if self._matrix is None:
+            self._matrix = np.frombuffer(self._values, dtype=np.float32).reshape(-1, self.dim)
+        return self._matrix
+
+    def vector(self, vector_id):
+        row = self.rows[vector_id]
+        return self._values[row * self.dim:(row + 1) * self.dim].tolist()
+
+    def append(self, ids, vectors):
+        """Append rows under the writer lock; IDs already stored are skipped. Returns the number added."""
+        if any(len(v) != self.dim for v in vectors):
+            raise ValueError(f"Embeddings must have {self.dim} dimensions")
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have appended since our last look
+            self.refresh()
+            new = [(vector_id, vector) for vector_id, vector in zip(ids, vectors) if vector_id not in self.rows]
+            if new:
+                if np is not None:
+                    block = np.asarray([vector for _, vector in new], dtype=np.float32)
+                    block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+                    rows = block.tobytes()
+                else:
+                    rows = bytearray()
+                    for _, vector in new:
+                        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+                        rows += array("f", [v / norm for v in vector]).tobytes()
+                with open(self.path + ".f32", "r+b") as f:
+                    # A writer that died mid-append may have left a partial row; overwrite it
+                    f.seek(len(self.ids) * self.dim * 4)
+                    f.write(rows)
+                    f.truncate()
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.path + ".ids", "ab") as f:
+                    f.write("".join(json.dumps(vector_id) + "\n" for vector_id, _ in new).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.refresh()
+        return len(new)
+
+    def search(self, query, top_n=10, prefix=None):
+        """[(vector_id, cosine)] of the rows closest to `query`, optionally only IDs starting with `prefix`"""
+        if not self.ids:
+            return []
+        norm = math.sqrt(sum(v * v for v in query)) or 1.0
+        query = [v / norm for v in query]
+        if np is not None:
+            scores = self.matrix @ np.asarray(query, dtype=np.float32)
+            candidates = range(len(self.ids))
+            if prefix is not None:
+                candidates = [row for row, vector_id in enumerate(self.ids) if vector_id.startswith(prefix)]
+                scores = scores[np.asarray(candidates, dtype=np.int64)] if candidates else scores[:0]
+            keep = min(top_n, len(scores))
+            if not keep:
+                return []
+            best = np.argpartition(-scores, keep - 1)[:keep]
+            ranked = [(candidates[i], float(scores[i])) for i in best]
+        else:
+            ranked = [
+                (row, sum(q * v for q, v in zip(query, self._values[row * self.dim:(row + 1) * self.dim])))
+                for row, vector_id in enumerate(self.ids) if prefix is None or vector_id.startswith(prefix)
+            ]
+        ranked.sort(key=lambda item: -item[1])
+        return [(self.ids[row], score) for row, score in ranked[:top_n]]
+
+
+# ---------------------------------------------------------------------------
+# Memory benchmark
+# ---------------------------------------------------------------------------
+
+def _worker(path, dim, mode, barrier, results):
+    from server_tuning import memory_mb
+
+    if mode == "private copy":
+        # What loading the matrix per process costs: each worker reads its own copy
+        matrix = np.fromfile(path + ".f32", dtype=np.float32).reshape(-1, dim)
+    else:
+        matrix = EmbeddingMatrix(path, dim).matrix
+    query = np.ones(dim, dtype=np.float32)
+    # Touch every row, as a search does
+    best = int(np.argmax(matrix @ query))
+    barrier.wait()
+    results.put((memory_mb(os.getpid(), "Rss"), memory_mb(os.getpid(), "Pss"), best))
+    barrier.wait()
+
+
+def _appender(path, dim, worker, count, batch):
+    matrix = EmbeddingMatrix(path, dim)
+    rng = random.Random(worker)
+    for start in range(0, count, batch):
+        ids = [f"w{worker}-{i:05d}" for i in range(start, min(start + batch, count))]
+        matrix.append(ids, [[rng.gauss(0, 1) for _ in range(dim)] for _ in ids])
+
+
+def benchmark(rows=50000, dim=EMBEDDING_DIM, workers=4):
+    """Per-process and total memory of `workers` processes holding private copies versus one shared mapping"""
+    if np is None:
+        print("The memory benchmark needs numpy")
+        return
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embeddings")
+        EmbeddingMatrix(path, dim).append([f"row-{i}" for i in range(rows)],
+                                          np.random.default_rng(0).standard_normal((rows, dim), dtype=np.float32))
+        size_mb = rows * dim * 4 / 2 ** 20
+        print(f"{rows} x {dim} float32 matrix: {size_mb:.0f} MB; {workers} worker processes")
+        print(f"{'':14s} {'RSS/worker MB':>14s} {'PSS/worker MB':>14s} {'total PSS MB':>13s} {'copies':>7s}")
+        for mode in ("private copy", "shared mmap"):
+            barrier, results = context.Barrier(workers + 1), context.Queue()
+            processes = [context.Process(target=_worker, args=(path, dim, mode, barrier, results))
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            barrier.wait()
+            measured = [results.get() for _ in processes]
+            barrier.wait()
+            for process in processes:
+                process.join()
+            rss = sum(m[0] for m in measured) / workers
+            pss = sum(m[1] for m in measured)
+            print(f"{mode:14s} {rss:14.0f} {pss / workers:14.0f} {pss:13.0f} {pss / size_mb:7.1f}")
+
+        appends, per_worker = os.path.join(directory, "appends"), 200
+        processes = [context.Process(target=_appender, args=(appends, dim, w, per_worker, 25)) for w in range(workers)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        merged = EmbeddingMatrix(appends, dim)
+        consistent = (len(merged) == workers * per_worker == os.path.getsize(appends + ".f32") // (4 * dim)
+                      and len(set(merged.ids)) == len(merged))
+        print(f"{workers} processes appending {per_worker} rows each through the writer lock: {len(merged)} rows in "
+              f"{time.perf_counter() - started:.2f} s, consistent: {consistent}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of per-worker embedding copies versus one shared mapping")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    benchmark(args.rows, args.dim, args.workers)
+
+
+if __name__ == "__main__":
+    main()
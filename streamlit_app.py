@@ -3,13 +3,18 @@ import json
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from PyPDF2 import PdfReader
+from analysis_engine import AnalysisEngine
+from resilient_llm import create_resilient_llm
+from cost_ledger import get_ledger
+import pdf_processor
 import io
 import re
 import requests
 import time
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 # Add a config file
 st.set_page_config(
@@ -90,184 +95,67 @@ API_URL = st.secrets.get("API_URL", "https://recruiter-app-backend.onrender.com"
 # Define the backend API URL
 BACKEND_API_URL = "https://recruiter-app-backend.onrender.com"
 
-# Cache the calculation function to improve performance
-@st.cache_data
-def extract_text_from_pdf(pdf_file):
-    """Extract text from PDF file"""
-    text = ""
-    pdf_reader = PdfReader(pdf_file)
-    for page in pdf_reader.pages:
-        text += page.extract_text() or ""
-    return text
-
-def calculate_matching_score_api(resume_file, jd_file):
-    """Calculate matching score using the deployed API"""
-    try:
-        # Prepare the files for the API request
-        files = {
-            'resume': ('resume.pdf', resume_file, 'application/pdf'),
-            'job_description': ('jd.pdf', jd_file, 'application/pdf')
-        }
-        
-        # Send the request to the API
-        with st.spinner('Analyzing... This may take up to 2 minutes'):
-            st.info("Making API call to backend service...")
-            response = requests.post(f"{API_URL}/analyze", files=files, timeout=180)
-            
-            if response.status_code != 200:
-                st.error(f"API Error: Status code {response.status_code}\nResponse: {response.text}")
-                return None, None
-                
-            # Get the raw result
-            raw_result = response.json()
-            
-            # Check the structure - this is debugging code we can keep for now
-            if 'analysis' in raw_result:
-                # Original expected structure
-                result = raw_result
-                analysis_json = result.get('analysis', {}).get('analysis_json')
-                matching_score = result.get('analysis', {}).get('matching_score')
-            else:
-                # Direct structure from the API
-                # The API seems to be returning the analysis data directly at the top level
-                st.info("Using direct API response structure")
-                analysis_json = raw_result  # The whole response is the analysis JSON
-                matching_score = raw_result.get('score')  # Score is directly in the response
-                
-            # Convert the data structure to what the display function expects
-            formatted_result = {
-                'analysis_json': analysis_json if analysis_json else raw_result,
-                'matching_score': matching_score if matching_score else raw_result.get('score')
-            }
-            
-            return formatted_result, formatted_result.get('matching_score')
-            
-    except requests.exceptions.Timeout:
-        st.error("Request timed out. The backend service might be overloaded or starting up.")
-        return None, None
-    except requests.exceptions.ConnectionError:
-        st.error("Unable to connect to the backend API. The service might be down or unreachable.")
-        return None, None
-    except Exception as e:
-        st.error(f"Error calling API: {str(e)}")
-        st.error(f"Error details: {type(e).__name__}")
-        return None, None
+# Seconds to wait for a single /analyze call
+ANALYZE_TIMEOUT = 180
 
-# Original local calculation function - kept as fallback
-def calculate_matching_score(resume_text, jd_text, openai_api_key):
-    """Calculate matching score between resume and job description"""
-    try:
-        # Initialize the LLM
-        llm = ChatOpenAI(
-            temperature=0,
-            openai_api_key=openai_api_key,
-            model="gpt-4o"
-        )
-        
-        analysis_prompt = PromptTemplate(
-            input_variables=["resume", "job_description"],
-            template="""
-            You are an advanced AI model designed to analyze the compatibility between a CV and a job description and provide suggestions to assist human HR professionals in making shortlisting decisions.
-
-            CV:
-            {resume}
-
-            Job Description:
-            {job_description}
-
-            Analyze the CV against the job description and provide output in the following JSON format:
-
-            {{
-                "candidate_name": "Extracted name of the candidate from the CV",
-                "contact_information": "Extracted email and phone number",
-                "matching_skills": "List of skills matching the job description",
-                "missing_skills": "List of important skills missing from the CV",
-                "work_experience": "Total years of relevant experience and key responsibilities that align with the job description",
-                "education": "Highest degree attained and key certifications",
-                "soft_skills": "List of relevant soft skills extracted or inferred from the CV (e.g., communication, leadership, teamwork)",
-                "training_experience": "Information on any training, mentoring, or knowledge-sharing roles the candidate has undertaken",
-                "adaptability": "Assessment of the candidate's potential to quickly learn missing skills based on certifications, past experiences, and technical background",
-                "scoring_details": {{
-                    "technical_skills": "Score out of 40, based on the percentage of required technical skills present. For skills that are missing but are easy to learn, apply a reduced penalty.",
-                    "work_experience": "Score out of 25, reflecting the relevance and depth of the candidate's experience.",
-                    "education_certifications": "Score out of 15, based on academic qualifications and industry certifications.",
-                    "soft_skills_training": "Score out of 10, based on evidence of communication, teamwork, and training or mentoring abilities.",
-                    "adaptability": "Score out of 10, based on the candidate's potential to acquire missing skills efficiently."
-                }},
-                "recommendation": {{
-                    "pros": "Highlight reasons why the candidate is a strong match for the role, including technical strengths, relevant experience, certifications, and soft skills.",
-                    "cons": "Detail any gaps or concerns, noting if any missing skills are critical versus those that can be quickly learned.",
-                    "final_suggestion": "Provide a balanced recommendation for HR on whether to shortlist the candidate, along with suggestions for potential areas of on-the-job training or development. Emphasize that the final decision is advisory and meant to assist in the human evaluation process."
-                }}
-            }}
-
-            Additional Instructions:
-
-            1. Technical Skills Evaluation (40%):
-               - Identify all required technical skills from the job description.
-               - Award proportionate points based on the number of skills present. For any missing MUST-HAVE skill, assess if it is easy to learn (e.g., Python scripting if the candidate demonstrates strong Bash experience). If easily trainable, apply a reduced penalty; otherwise, apply a standard penalty.
-
-            2. Work Experience (25%):
-               - Evaluate the total years of relevant experience and the direct applicability of key responsibilities to the job description.
-               - Award higher scores when experience is directly aligned with the role's duties.
-
-            3. Education and Certifications (15%):
-               - Consider the highest degree and relevant certifications. Award full points when all critical certifications are present; otherwise, score proportionately.
-
-            4. Soft Skills and Training Experience (10%):
-               - Extract or infer soft skills such as communication, leadership, teamwork, and any training/mentoring experience.
-               - If soft skills are absent, reduce the score accordingly, but note their presence in the recommendation.
-
-            5. Adaptability (10%):
-               - Assess the candidate's ability to quickly learn missing skills based on their technical background and certifications.
-               - Emphasize that candidates with strong foundational expertise might overcome gaps in certain non-critical skills.
-
-            6. Scoring Flexibility:
-               - Compute the total score out of 100 using the weights provided.
-               - Ensure that missing skills are penalized appropriately but allow for the possibility that some gaps are easily trainable.
-               - The final score is advisory and intended to support HR professionals rather than to automatically shortlist or reject candidates.
-
-            7. Recommendation Output:
-               - Provide a balanced summary with clear pros and cons.
-               - Include suggestions on how trainable gaps can be addressed during onboarding or through further development.
-
-            Be thorough in your analysis, ensuring the evaluation mirrors a human HR professional's rigour while recognizing that some missing skills do not necessarily disqualify a candidate. Your output should assist HR in making an informed, balanced decision.
-            """
-        )
-        
-        analysis_input = {
-            "resume": resume_text,
-            "job_description": jd_text
-        }
-        
-        analysis_result = llm.invoke(analysis_prompt.format(**analysis_input))
-        return analysis_result
-    except Exception as e:
-        st.error(f"Error in analysis: {str(e)}")
-        return None
+# Upper bound on concurrent /analyze calls in batch mode
+MAX_PARALLEL_ANALYSES = 8
 
-def format_analysis_output(analysis_result):
-    """Format the analysis result for JSON output and extract the score"""
-    try:
-        content = analysis_result.content
-        
-        # Use regex to extract the JSON part
-        json_pattern = r'({.*})'
-        match = re.search(json_pattern, content, re.DOTALL)
-        
-        if match:
-            json_str = match.group(1)
-            result = json.loads(json_str)
-            
-            # Extract the score
-            score = result.get("score", "N/A")
-            
-            # Return the JSON string and the score
-            return {"analysis_json": result, "matching_score": score}
-        else:
-            return {"analysis_json": {"error": "Could not extract JSON from response"}, "matching_score": "N/A"}
-    except Exception as e:
-        return {"analysis_json": {"error": f"Error formatting output: {str(e)}"}, "matching_score": "N/A"}
+# Times a batch analysis is retried after the backend answers 429 (its LLM queues are full)
+MAX_BATCH_RETRIES = 5
+
+# Largest PDF the backend accepts (its MAX_UPLOAD_MB); bigger files are rejected here instead of uploaded
+MAX_UPLOAD_MB = 10
+
+def oversized_files(*uploaded_files):
+    """Names of uploaded files above MAX_UPLOAD_MB"""
+    return [f.name for f in uploaded_files if f is not None and f.size > MAX_UPLOAD_MB * 1024 * 1024]
+
+@st.cache_resource
+def get_http_session():
+    """Shared requests session so connections to the backend are pooled and reused"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_PARALLEL_ANALYSES, pool_maxsize=MAX_PARALLEL_ANALYSES)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def hash_bytes(data):
+    """Content hash used as the cache key for uploads"""
+    return hashlib.sha256(data).hexdigest()
+
+# Keyed on the content hash (arguments starting with "_" are not hashed by Streamlit)
+# and persisted to disk so extracted text survives app restarts
+@st.cache_data(persist="disk", show_spinner=False)
+def cached_pdf_text(content_hash, _pdf_bytes):
+    """Extract text from PDF bytes, with OCR for scanned pages when it is installed"""
+    return pdf_processor.extract_text_from_pdf(io.BytesIO(_pdf_bytes))
+
+def extract_text_from_pdf(pdf_file):
+    """Extract text from an uploaded PDF file"""
+    pdf_bytes = pdf_file.getvalue()
+    return cached_pdf_text(hash_bytes(pdf_bytes), pdf_bytes)
+
+@st.cache_resource
+def get_engine(openai_api_key):
+    """One analysis engine with a warm ChatOpenAI client per API key, shared by every session"""
+    return AnalysisEngine(create_resilient_llm("openai", api_key=openai_api_key, model="gpt-4o", ledger=get_ledger()))
+
+# Analyses are keyed on the content hashes of both documents and persisted to disk, so
+# re-clicking Analyze or restarting the app never pays for a second LLM call on the
+# same inputs. Failures raise instead of returning, so they are never cached.
+@st.cache_data(persist="disk", show_spinner=False)
+def cached_local_analysis(resume_hash, jd_hash, _resume_text, _jd_text, _openai_api_key):
+    """Run the local GPT-4o analysis for a resume/JD pair"""
+    analysis = get_engine(_openai_api_key).analyze(_resume_text, _jd_text)
+    if "error" in analysis["analysis_json"]:
+        raise ValueError(analysis["analysis_json"]["error"])
+    return analysis
+
+@st.cache_data(persist="disk", show_spinner=False)
+def cached_remote_analysis(resume_hash, jd_hash, _resume_bytes, _jd_bytes, _recruiter):
+    """Run the backend analysis for a resume/JD pair as interactive work"""
+    return post_analysis(get_http_session(), "resume.pdf", _resume_bytes, _jd_bytes, _recruiter)
 
 def display_analysis_results(analysis):
     try:
@@ -451,7 +339,7 @@ def check_backend_health():
     """Check if the backend API service is up and running"""
     try:
         st.info(f"Checking backend health at {BACKEND_API_URL}...")
-        response = requests.get(f"{BACKEND_API_URL}/", timeout=10)
+        response = get_http_session().get(f"{BACKEND_API_URL}/", timeout=10)
         
         if response.status_code == 200:
             st.success("Backend API is online and responding.")
@@ -470,32 +358,183 @@ def check_backend_health():
         st.error(f"Error checking backend health: {str(e)}")
         return False
 
-def analyze_resume_with_api(resume_file, jd_file):
-    try:
-        # Prepare the files for the API request
-        files = {
-            'resume': resume_file,
-            'job_description': jd_file
+def parse_score(value):
+    """Pull the leading number out of a score such as 85, "85%" or "32/40"; None if absent"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:\.\d+)?", str(value or ""))
+    return float(match.group()) if match else None
+
+def recruiter_id():
+    """Who the backend schedules this session's LLM calls as: RECRUITER_ID from secrets, else one id per session"""
+    return st.session_state.setdefault("recruiter_id", st.secrets.get("RECRUITER_ID") or uuid.uuid4().hex)
+
+def post_analysis(session, resume_name, resume_bytes, jd_bytes, recruiter, batch=False):
+    """
+    Send one resume/JD pair to the backend for `recruiter`, as batch work when `batch` is
+    set, waiting out its Retry-After on 429. Runs in worker threads, so it must not call st.*
+    """
+    files = {
+        'resume': (resume_name, resume_bytes, 'application/pdf'),
+        'job_description': ('jd.pdf', jd_bytes, 'application/pdf')
+    }
+    headers = {"X-Recruiter-ID": recruiter}
+    if batch:
+        headers["X-Priority"] = "batch"
+    for attempt in range(MAX_BATCH_RETRIES + 1):
+        response = session.post(f"{API_URL}/analyze", files=files, headers=headers, timeout=ANALYZE_TIMEOUT)
+        if response.status_code != 429 or attempt == MAX_BATCH_RETRIES:
+            break
+        time.sleep(float(response.headers.get("Retry-After", "1")))
+    response.raise_for_status()
+    raw_result = response.json()
+    analysis = raw_result.get('analysis', raw_result)
+    analysis_json = analysis.get('analysis_json', analysis)
+    if isinstance(analysis_json, str):
+        analysis_json = json.loads(analysis_json)
+    return {
+        'analysis_json': analysis_json,
+        'matching_score': analysis.get('matching_score', analysis_json.get('score'))
+    }
+
+def batch_result_row(name, result, elapsed, error=None):
+    """Flatten one batch analysis into a row of the results table"""
+    row = {"Resume": name, "Candidate": None, "Score": None, "Technical": None, "Experience": None,
+           "Education": None, "Soft Skills": None, "Adaptability": None,
+           "Time (s)": round(elapsed, 1), "Status": "Error" if error else "Done"}
+    if error:
+        row["Candidate"] = error
+        return row
+    analysis_data = result['analysis_json']
+    scoring = analysis_data.get('scoring_details', {}) if isinstance(analysis_data, dict) else {}
+    row["Candidate"] = analysis_data.get('candidate_name') if isinstance(analysis_data, dict) else None
+    row["Score"] = parse_score(result.get('matching_score'))
+    row["Technical"] = parse_score(scoring.get('technical_skills'))
+    row["Experience"] = parse_score(scoring.get('work_experience'))
+    row["Education"] = parse_score(scoring.get('education_certifications'))
+    row["Soft Skills"] = parse_score(scoring.get('soft_skills_training'))
+    row["Adaptability"] = parse_score(scoring.get('adaptability'))
+    return row
+
+def batch_entries(batch_results, jd_key):
+    """Batch results analyzed against the job description with hash `jd_key`"""
+    return [entry for entry in batch_results.values() if entry.get("jd_key") == jd_key]
+
+def render_batch_table(placeholder, batch_results, jd_key):
+    """Redraw the results table for one job description, best matches first"""
+    rows = sorted(
+        (entry["row"] for entry in batch_entries(batch_results, jd_key)),
+        key=lambda row: row["Score"] if row["Score"] is not None else -1,
+        reverse=True
+    )
+    placeholder.dataframe(rows, use_container_width=True, hide_index=True)
+
+def run_batch_analysis(resume_files, jd_file, max_workers):
+    """
+    Analyze many resumes against one JD concurrently over the pooled session.
+    Results are kept in st.session_state keyed by content hash, so reruns and
+    repeated clicks only submit resumes that have not been analyzed yet.
+    """
+    batch_results = st.session_state.setdefault("batch_results", {})
+    if oversized_files(jd_file):
+        st.error(f"The job description is larger than {MAX_UPLOAD_MB} MB.")
+        return
+    jd_bytes = jd_file.getvalue()
+    jd_key = hashlib.sha256(jd_bytes).hexdigest()
+    st.session_state["batch_jd_key"] = jd_key
+
+    pending = {}
+    for resume_file in resume_files:
+        if oversized_files(resume_file):
+            st.warning(f"{resume_file.name} is larger than {MAX_UPLOAD_MB} MB and was skipped.")
+            continue
+        resume_bytes = resume_file.getvalue()
+        key = (hashlib.sha256(resume_bytes).hexdigest(), jd_key)
+        if key not in batch_results and key not in pending:
+            pending[key] = (resume_file.name, resume_bytes)
+
+    table = st.empty()
+    render_batch_table(table, batch_results, jd_key)
+    if not pending:
+        st.info("All resumes have already been analyzed against this job description.")
+        return
+
+    progress = st.progress(0.0, text=f"Analyzing {len(pending)} resumes...")
+    session = get_http_session()
+    recruiter = recruiter_id()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(post_analysis, session, name, resume_bytes, jd_bytes, recruiter, True): (key, name, time.time())
+            for key, (name, resume_bytes) in pending.items()
         }
-        
-        # Send POST request to the API
-        response = requests.post(f"{BACKEND_API_URL}/analyze", files=files)
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            return response.json()
+        for done, future in enumerate(as_completed(futures), start=1):
+            key, name, started = futures[future]
+            elapsed = time.time() - started
+            try:
+                result = future.result()
+                batch_results[key] = {"row": batch_result_row(name, result, elapsed), "analysis": result,
+                                      "resume_hash": key[0], "jd_key": jd_key}
+            except Exception as e:
+                # Failures are not stored so the next run retries them
+                st.warning(f"{name}: {str(e)}")
+                batch_results[(key, "error")] = {"row": batch_result_row(name, None, elapsed, str(e)), "analysis": None,
+                                                 "resume_hash": key[0], "jd_key": jd_key}
+            progress.progress(done / len(futures), text=f"Analyzed {done} of {len(futures)} resumes")
+            render_batch_table(table, batch_results, jd_key)
+
+def batch_analysis_tab():
+    st.header("Batch Analysis")
+    st.write("Upload several resumes and one job description to rank candidates side by side.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        resume_files = st.file_uploader("Upload Resumes (PDF)", type=["pdf"], accept_multiple_files=True)
+    with col2:
+        jd_file = st.file_uploader("Upload Job Description (PDF)", type=["pdf"], key="batch_jd")
+
+    max_workers = st.slider("Parallel analyses", 1, MAX_PARALLEL_ANALYSES, 4)
+
+    analysis_ran = False
+    if st.button("Analyze All", type="primary"):
+        if not resume_files or not jd_file:
+            st.error("Please upload at least one resume and a job description.")
         else:
-            st.error(f"Error: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error connecting to backend service: {str(e)}")
-        return None
+            # Drop earlier failures so they are retried
+            batch_results = st.session_state.setdefault("batch_results", {})
+            for key in [key for key in batch_results if key[-1] == "error"]:
+                del batch_results[key]
+            run_batch_analysis(resume_files, jd_file, max_workers)
+            analysis_ran = True
+
+    # Only results for the job description currently uploaded (or last analyzed) are shown
+    jd_key = hashlib.sha256(jd_file.getvalue()).hexdigest() if jd_file else st.session_state.get("batch_jd_key")
+    batch_results = st.session_state.get("batch_results", {})
+    if not analysis_ran and batch_entries(batch_results, jd_key):
+        render_batch_table(st.empty(), batch_results, jd_key)
+
+    # Keyed by resume hash: two uploads can share a file name
+    analyzed = {
+        entry["resume_hash"]: entry
+        for entry in batch_entries(batch_results, jd_key)
+        if entry["analysis"]
+    }
+    if analyzed:
+        selected = st.selectbox(
+            "View detailed analysis", list(analyzed.keys()),
+            format_func=lambda resume_hash: f"{analyzed[resume_hash]['row']['Resume']} ({resume_hash[:8]})"
+        )
+        if selected:
+            display_analysis_results(analyzed[selected]["analysis"])
+
+    if st.button("Clear Batch Results"):
+        st.session_state["batch_results"] = {}
+        st.rerun()
 
 def main():
     st.title("Resume - JD Analyzer")
     
     # Create tabs for better organization
-    tab1, tab2 = st.tabs(["📊 Analysis", "ℹ️ About"])
+    tab1, tab_batch, tab2 = st.tabs(["📊 Analysis", "📁 Batch Analysis", "ℹ️ About"])
     
     with tab1:
         st.header("Upload Resume and Job Description")
@@ -527,66 +566,57 @@ def main():
                 st.error("Please upload both resume and job description files.")
             elif api_mode == "Use Local Analysis" and not openai_api_key:
                 st.error("Please enter your OpenAI API key for local analysis.")
+            elif oversized_files(resume_file, jd_file):
+                st.error(f"Files must be at most {MAX_UPLOAD_MB} MB: {', '.join(oversized_files(resume_file, jd_file))}")
             else:
+                resume_bytes = resume_file.getvalue()
+                jd_bytes = jd_file.getvalue()
+                resume_hash = hash_bytes(resume_bytes)
+                jd_hash = hash_bytes(jd_bytes)
+                analysis = None
+
                 with st.spinner("Analyzing... This may take up to 2 minutes"):
-                    # Check if backend API is available for remote analysis
                     if api_mode == "Use Remote API (Recommended)":
+                        # Check if backend API is available for remote analysis
                         backend_available = check_backend_health()
                         if not backend_available:
                             st.error("Backend API is not available. Please try using Local Analysis or try again later.")
                             return
-                        
-                        st.info("Backend API is available. Proceeding with analysis...")
-                        
-                        # Reset the file pointers to the beginning
-                        resume_file.seek(0)
-                        jd_file.seek(0)
-                        
-                        # Call API and get results
-                        analysis, score = calculate_matching_score_api(resume_file, jd_file)
-                        
-                        # Raw output for debugging
-                        st.subheader("Debug: API Response")
-                        with st.expander("View Raw Response Data"):
-                            st.json(analysis)
-                        
-                        # Check if analysis was successful
-                        if analysis is None:
-                            st.error("Analysis failed. Please check the error messages above or try Local Analysis.")
-                            return
-                            
-                        # Log what we received for debugging
-                        st.info(f"Received analysis type: {type(analysis)}")
-                        if isinstance(analysis, dict):
-                            st.info(f"Analysis keys: {list(analysis.keys())}")
-                            
-                    else:  # Local Analysis
-                        # Extract text from PDF files
-                        resume_text = extract_text_from_pdf(resume_file)
-                        jd_text = extract_text_from_pdf(jd_file)
-                        
-                        # Perform analysis
-                        analysis_result = calculate_matching_score(resume_text, jd_text, openai_api_key)
-                        analysis_json, score = format_analysis_output(analysis_result)
-                        
+
                         try:
-                            analysis = json.loads(analysis_json)
-                        except json.JSONDecodeError as e:
-                            st.error(f"Error parsing analysis result: {e}")
-                            st.error(f"Raw result: {analysis_json[:200]}...")  # Show first 200 chars
-                            analysis = None
-                    
-                    # Display analysis results if successful
-                    if analysis:
+                            analysis = cached_remote_analysis(resume_hash, jd_hash, resume_bytes, jd_bytes, recruiter_id())
+                        except requests.exceptions.Timeout:
+                            st.error("Request timed out. The backend service might be overloaded or starting up.")
+                        except requests.exceptions.ConnectionError:
+                            st.error("Unable to connect to the backend API. The service might be down or unreachable.")
+                        except Exception as e:
+                            st.error(f"Error calling API: {str(e)}")
+
+                    else:  # Local Analysis
                         try:
-                            display_analysis_results(analysis)
+                            resume_text = cached_pdf_text(resume_hash, resume_bytes)
+                            jd_text = cached_pdf_text(jd_hash, jd_bytes)
+                            analysis = cached_local_analysis(resume_hash, jd_hash, resume_text, jd_text, openai_api_key)
                         except Exception as e:
-                            st.error(f"Error in display_analysis_results: {str(e)}")
-                            st.error("Raw analysis data:")
-                            st.json(analysis)
-                    else:
-                        st.error("No analysis data was generated. Please try again or switch analysis modes.")
-        
+                            st.error(f"Error in analysis: {str(e)}")
+
+                if analysis:
+                    # Keep the result so tab switches and other reruns show it without re-analyzing
+                    st.session_state["last_analysis"] = {"key": (resume_hash, jd_hash), "analysis": analysis}
+                else:
+                    st.session_state.pop("last_analysis", None)
+                    st.error("No analysis data was generated. Please try again or switch analysis modes.")
+
+        last_analysis = st.session_state.get("last_analysis")
+        if last_analysis and resume_file and jd_file:
+            if last_analysis["key"] == (hash_bytes(resume_file.getvalue()), hash_bytes(jd_file.getvalue())):
+                try:
+                    display_analysis_results(last_analysis["analysis"])
+                except Exception as e:
+                    st.error(f"Error in display_analysis_results: {str(e)}")
+                    st.error("Raw analysis data:")
+                    st.json(last_analysis["analysis"])
+
         # Show example at bottom of page
         with st.expander("About this tool"):
             st.markdown("""
@@ -601,6 +631,9 @@ def main():
             
             **Note:** Analysis takes about 1-2 minutes to complete.
             """)
+
+    with tab_batch:
+        batch_analysis_tab()
     
     with tab2:
         st.markdown("""
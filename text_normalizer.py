@@ -0,0 +1,137 @@
+import argparse
+import re
+import time
+import unicodedata
+from multiprocessing import Pool
+
+from resume_store import PROMPT_PREFIX, iter_labeled_entries
+
+# tiktoken gives exact GPT-4o token counts; without it words, punctuation, newlines
+# and runs of spaces are each counted as one token
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]|\n|[^\S\n]{2,}")
+
+# UTF-8 text that was decoded as cp1252, e.g. "\u00e2\u20ac\u201c" for an en dash or "\u00c2\u00b7" for a middle dot
+_MOJIBAKE = re.compile(
+    "[\u00c2-\u00f4][\u0080-\u00bf\u0152\u0153\u0160\u0161\u0178\u017d\u017e\u0192\u02c6\u02dc"
+    "\u2013\u2014\u2018-\u201a\u201c-\u201e\u2020-\u2022\u2026\u2030\u2039\u203a\u20ac\u2122]{1,3}"
+)
+_STRAY_LEAD_BYTE = re.compile("\u00c2(?=[\u00a0-\u00bf])")
+# Fullwidth forms (EF BC xx) whose last byte was lost; in the labeled data this is a fullwidth hyphen between fields
+_BROKEN_FULLWIDTH = re.compile("\u00ef\u00bc\u200b?")
+
+ZERO_WIDTH = "\u200b\u200c\u200d\u2060\ufeff\u00ad"
+BULLETS = "\u2022\u25cf\u25cb\u25e6\u25aa\u25ab\u25a0\u25a1\u25fc\u25fb\u25fe\u25fd\u27a2\u27a4\u25ba\u25b6\u2756\u2752\u2713\u2714\u2717\u26ab\u2b24\u00b7\u2219\u2023\u2043"
+
+# One str.translate pass handles every single-character rule
+_TRANSLATION = {ord(c): None for c in ZERO_WIDTH}
+_TRANSLATION.update({ord(c): "-" for c in BULLETS})
+_TRANSLATION.update({codepoint: "-" for codepoint in range(0xE000, 0xF900)})  # private-use symbol-font bullets
+_TRANSLATION.update({ord("\u1160"): " ", ord("\u3164"): " ", ord("\t"): " ", ord("\r"): "\n"})
+
+_SPACES = re.compile("[ \u00a0\u2000-\u200a\u202f\u205f\u3000]+")
+_SPACE_AROUND_NEWLINE = re.compile(r" *\n *")
+_NEWLINES = re.compile(r"\n{2,}")
+_REPEATED_BULLETS = re.compile(r"-( ?-)+")
+
+
+def count_tokens(text):
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def _repair(match):
+    fragment = match.group()
+    try:
+        return fragment.encode("cp1252").decode("utf-8")
+    except UnicodeError:
+        return fragment
+
+
+def repair_mojibake(text):
+    text = _BROKEN_FULLWIDTH.sub("-", text)
+    text = _MOJIBAKE.sub(_repair, text)
+    # A "\u00c2" left before a Latin-1 symbol is the lead byte of its UTF-8 encoding; a
+    # real "\u00c2" (as in "\u00c2ngel") is kept
+    return _STRAY_LEAD_BYTE.sub("", text)
+
+
+def normalize_text(text):
+    """
+    Clean PDF-extracted text before it is put into a prompt: repair mojibake, fold
+    ligatures and fullwidth forms (NFKC), drop zero-width characters, turn symbol
+    bullets into "-", and collapse runs of spaces and blank layout lines.
+    """
+    if not text:
+        return ""
+    text = repair_mojibake(text)
+    text = unicodedata.normalize("NFKC", text)
+    text = text.translate(_TRANSLATION)
+    text = _SPACES.sub(" ", text)
+    text = _REPEATED_BULLETS.sub("-", text)
+    text = _SPACE_AROUND_NEWLINE.sub("\n", text)
+    # PyPDF2 emits whitespace-only lines between layout fragments, not between paragraphs
+    text = _NEWLINES.sub("\n", text)
+    return text.strip()
+
+
+def normalize_with_stats(text):
+    """Return (normalized_text, tokens_before, tokens_after)"""
+    normalized = normalize_text(text)
+    return normalized, count_tokens(text), count_tokens(normalized)
+
+
+def normalize_batch(texts, processes=None, chunksize=16):
+    """Normalize many documents across processes; yields (text, tokens_before, tokens_after) in order"""
+    if processes == 1:
+        yield from map(normalize_with_stats, texts)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(normalize_with_stats, texts, chunksize)
+
+
+def benchmark(jsonl_path, processes=1, ms_per_1k_tokens=15.0):
+    """
+    Token and latency effect of normalization on the labeled resumes. LLM latency is
+    modelled as prompt prefill time: `ms_per_1k_tokens` per thousand prompt tokens.
+    """
+    texts = []
+    for entry in iter_labeled_entries(jsonl_path):
+        prompt = entry.get("prompt", "")
+        texts.append(prompt[len(PROMPT_PREFIX):] if prompt.startswith(PROMPT_PREFIX) else prompt)
+
+    started = time.perf_counter()
+    stats = list(normalize_batch(texts, processes))
+    elapsed = time.perf_counter() - started
+
+    before = sum(s[1] for s in stats)
+    after = sum(s[2] for s in stats)
+    savings = sorted(s[1] - s[2] for s in stats)
+    tokenizer = "tiktoken o200k_base" if _ENCODING is not None else "approximate split"
+    print(f"{len(stats)} resumes, token counts from {tokenizer}")
+    print(f"Prompt tokens: {before} -> {after} ({(before - after) / max(before, 1) * 100:.1f}% fewer)")
+    print(f"Tokens saved per resume: mean {(before - after) / max(len(stats), 1):.1f}, "
+          f"median {savings[len(savings) // 2] if savings else 0}, max {savings[-1] if savings else 0}")
+    print(f"Normalization time: {elapsed / max(len(stats), 1) * 1000:.3f} ms per resume")
+    print(f"Modelled prefill latency at {ms_per_1k_tokens} ms/1k tokens: "
+          f"{before / 1000 * ms_per_1k_tokens / max(len(stats), 1):.1f} ms -> "
+          f"{after / 1000 * ms_per_1k_tokens / max(len(stats), 1):.1f} ms per resume")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure prompt tokens saved by text normalization")
+    parser.add_argument("jsonl_path", nargs="?", default="labeled_resumes.jsonl")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=15.0)
+    args = parser.parse_args()
+    benchmark(args.jsonl_path, args.processes, args.ms_per_1k_tokens)
+
+
+if __name__ == "__main__":
+    main()
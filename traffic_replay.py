@@ -0,0 +1,389 @@
+import argparse
+import csv
+import hashlib
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from upload_benchmark import build_pdf, free_port
+
+# Recorded traffic goes under traffic/ so it never mixes with other JSONL files in the checkout
+REQUEST_LOG_PATH = os.environ.get("REQUEST_LOG_PATH", os.path.join("traffic", "requests.jsonl"))
+# Salt for upload hashes; set it in production so a hash cannot confirm that a known file was uploaded
+REQUEST_LOG_SALT = os.environ.get("REQUEST_LOG_SALT", "")
+
+
+def upload_digest(stream, salt=REQUEST_LOG_SALT):
+    """(salted sha256 prefix, size in bytes, kind) of an upload stream; the stream is rewound afterwards"""
+    stream.seek(0)
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    head = stream.read(5)
+    size = len(head)
+    digest.update(head)
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()[:16], size, "pdf" if head == b"%PDF-" else "other"
+
+
+class RequestRecorder:
+    """
+    Appends one anonymized JSON line per request: arrival time, endpoint, status, latency,
+    per-stage timings and, for each uploaded file, only its field name, salted content
+    hash, size and kind. No file names, text, headers or client addresses are kept.
+    """
+
+    def __init__(self, path=REQUEST_LOG_PATH, salt=REQUEST_LOG_SALT):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.salt = salt
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def entry(self, request, status, seconds, spans=()):
+        uploads = []
+        if status != 413:
+            try:
+                for field, storage in request.files.items(multi=True):
+                    digest, size, kind = upload_digest(storage.stream, self.salt)
+                    uploads.append({"field": field, "sha256": digest, "bytes": size, "kind": kind})
+            except Exception:
+                uploads = None
+        return {
+            "ts": round(time.time() - seconds, 3),
+            "method": request.method,
+            "endpoint": request.url_rule.rule if request.url_rule else request.path,
+            "status": status,
+            "latency_ms": round(seconds * 1000, 1),
+            "request_bytes": request.content_length or 0,
+            "uploads": uploads,
+            "stages": {stage: round(duration * 1000, 1) for stage, duration in spans},
+        }
+
+    def record(self, request, status, seconds, spans=()):
+        line = json.dumps(self.entry(request, status, seconds, spans))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def load_log(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return sorted(entries, key=lambda e: e.get("ts", 0))
+
+
+def synthesize_log(count, seed=0, rate=1.0):
+    """
+    Stand-in traffic when nothing has been recorded yet: mostly /analyze with lognormal
+    resume sizes, a few dozen JDs, some repeated resumes, a few non-PDF uploads and
+    health checks, arriving as a Poisson process at `rate` per second.
+    """
+    rng = random.Random(seed)
+    jds = [(f"jd{n:014d}", int(rng.lognormvariate(math.log(60_000), 0.5))) for n in range(30)]
+    resumes = []
+    entries, ts = [], 0.0
+    for _ in range(count):
+        ts += rng.expovariate(rate)
+        roll = rng.random()
+        if roll < 0.02:
+            entries.append({"ts": round(ts, 3), "method": "GET", "endpoint": "/", "uploads": []})
+            continue
+        if resumes and roll < 0.12:
+            resume = rng.choice(resumes)
+        else:
+            resume = (f"{rng.getrandbits(64):016x}", int(rng.lognormvariate(math.log(150_000), 0.8)),
+                      "other" if roll > 0.97 else "pdf")
+            resumes.append(resume)
+        jd = rng.choice(jds)
+        entries.append({"ts": round(ts, 3), "method": "POST", "endpoint": "/analyze", "uploads": [
+            {"field": "resume", "sha256": resume[0], "bytes": resume[1], "kind": resume[2]},
+            {"field": "job_description", "sha256": jd[0], "bytes": jd[1], "kind": "pdf"},
+        ]})
+    return entries
+
+
+class StubUploads:
+    """
+    Synthetic files standing in for recorded uploads: one file per recorded hash, of the
+    recorded size and kind, whose text embeds the hash so equal uploads stay equal (and
+    hit the same server caches) while different ones stay different.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def path(self, upload):
+        key = upload["sha256"]
+        with self._lock:
+            if key not in self._paths:
+                path = os.path.join(self.directory, f"{key}.{upload['kind']}")
+                size = max(int(upload.get("bytes", 0)), 1)
+                if upload["kind"] == "pdf":
+                    pages = max(1, min(size // 100_000 + 1, 20))
+                    build_pdf(path, pages=pages, padding_kb=max(size // 1024 - pages, 0) // pages,
+                              text=f"Candidate {key} Python developer with Flask, SQL and AWS experience")
+                else:
+                    with open(path, "wb") as f:
+                        f.write(key.encode() * (size // len(key) + 1))
+                self._paths[key] = path
+            return self._paths[key]
+
+
+def send(base_url, entry, uploads):
+    """Replay one recorded request; returns (status, seconds), with status 0 for a connection failure"""
+    target = urlsplit(base_url)
+    boundary = uuid.uuid4().hex
+    parts = []
+    for upload in entry.get("uploads") or []:
+        path = uploads.path(upload)
+        head = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{upload['field']}\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        parts.append((head, path))
+
+    def body():
+        for head, path in parts:
+            yield head
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(64 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    started = time.perf_counter()
+    try:
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=300)
+        if entry.get("method", "POST") == "GET":
+            connection.request("GET", entry["endpoint"])
+        else:
+            length = sum(len(head) + os.path.getsize(path) + 2 for head, path in parts) + len(f"--{boundary}--\r\n")
+            connection.request(entry.get("method", "POST"), entry["endpoint"], body=body(), headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(length),
+            })
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        return response.status, time.perf_counter() - started
+    except (OSError, http.client.HTTPException):
+        return 0, time.perf_counter() - started
+
+
+def open_loop(send_one, entries, rate=None, duration=30.0, speed=1.0, seed=0, max_in_flight=512):
+    """
+    Send requests on a fixed schedule whether or not earlier ones have finished: Poisson
+    arrivals at `rate` per second, or the recorded inter-arrival times divided by `speed`
+    when `rate` is None. Latency is measured from the scheduled send time, so client-side
+    queueing is not hidden. Returns ([(status, seconds)], elapsed).
+    """
+    rng = random.Random(seed)
+    schedule, at = [], 0.0
+    if rate is None:
+        # The recording is looped; each pass starts one mean gap after the previous one ends
+        offsets = [(entry.get("ts", 0) - entries[0].get("ts", 0)) / speed for entry in entries]
+        period = offsets[-1] + (offsets[-1] / max(len(entries) - 1, 1) or 1.0 / speed)
+        for at, entry in ((n * period + offset, entry) for n in itertools.count()
+                          for offset, entry in zip(offsets, entries)):
+            if at >= duration:
+                break
+            schedule.append((at, entry))
+    else:
+        for entry in itertools.cycle(entries):
+            at += rng.expovariate(rate)
+            if at >= duration:
+                break
+            schedule.append((at, entry))
+
+    def timed(due, entry):
+        status, _ = send_one(entry)
+        return status, time.perf_counter() - due
+
+    started = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for at, entry in schedule:
+            delay = started + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(timed, started + at, entry))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - started
+
+
+def closed_loop(send_one, entries, concurrency, duration=30.0, think_time=0.0):
+    """`concurrency` clients each send a request, wait for the answer and think; returns ([(status, seconds)], elapsed)"""
+    cursor = itertools.count()
+    lock = threading.Lock()
+    results = []
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                entry = entries[next(cursor) % len(entries)]
+            result = send_one(entry)
+            with lock:
+                results.append(result)
+            if think_time:
+                time.sleep(think_time)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    latencies = sorted(seconds for status, seconds in results if 0 < status < 500)
+    errors = sum(1 for status, _ in results if status == 0 or status >= 500)
+
+    def pick(q):
+        return latencies[min(len(latencies) - 1, int(math.ceil(q * len(latencies))) - 1)] * 1000 if latencies else float("nan")
+
+    return {
+        "requests": len(results),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": pick(0.5),
+        "p90_ms": pick(0.9),
+        "p99_ms": pick(0.99),
+        "error_rate": errors / len(results) if results else 0.0,
+    }
+
+
+def start_server(server="werkzeug", workers=1, threads=8, env=None):
+    """Run app.py on a free local port with the stub backends; returns (process, base_url)"""
+    port = free_port()
+    root = os.path.dirname(os.path.abspath(__file__))
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+                   "--workers", str(workers), "--threads", str(threads), "--timeout", "300"]
+    else:
+        command = [sys.executable, "-c", "import sys\nfrom werkzeug.serving import make_server\nfrom app import app\n"
+                   "make_server('127.0.0.1', int(sys.argv[1]), app, threaded=True).serve_forever()", str(port)]
+    process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while send(base_url, {"method": "GET", "endpoint": "/"}, None)[0] != 200:
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.terminate()
+            raise RuntimeError(f"{server} did not start; run `python app.py` to see the error")
+        time.sleep(0.2)
+    return process, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded /analyze traffic and report throughput/latency curves")
+    parser.add_argument("log", nargs="?", default=REQUEST_LOG_PATH, help="recorded requests (JSON lines)")
+    parser.add_argument("--mode", choices=["open", "closed"], default="closed")
+    parser.add_argument("--rates", default=None,
+                        help="open loop: comma-separated arrival rates per second; omit to replay recorded timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="open loop replay of recorded timing: speed-up factor")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="closed loop: comma-separated client counts")
+    parser.add_argument("--think-ms", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per load level")
+    parser.add_argument("--url", default=None, help="drive an already running server instead of starting app.py")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--llm-delay-ms", type=float, default=2000.0, help="stub LLM latency per call")
+    parser.add_argument("--synthetic", type=int, default=500, help="requests to synthesize when the log is missing or empty")
+    parser.add_argument("--slo-ms", type=float, default=0.0, help="report the highest load whose p99 meets this")
+    parser.add_argument("--csv", default=None, help="also write the curve to this CSV file")
+    args = parser.parse_args()
+
+    entries = load_log(args.log) if os.path.exists(args.log) else []
+    source = f"{len(entries)} recorded requests from {args.log}"
+    if not entries:
+        entries = synthesize_log(args.synthetic)
+        source = f"{len(entries)} synthetic requests ({args.log} is missing or empty)"
+
+    with tempfile.TemporaryDirectory() as directory:
+        uploads = StubUploads(directory)
+        process = None
+        base_url = args.url
+        if base_url is None:
+            env = dict(os.environ, LLM_BACKEND="stub", STUB_LLM_DELAY_MS=str(args.llm_delay_ms),
+                       DEDUP_INDEX_PATH=":memory:", CANDIDATE_PROFILE_DB=os.path.join(directory, "profiles.db"),
+                       JD_CACHE_DIR=os.path.join(directory, "jd_cache"), RECORD_REQUESTS="0")
+            process, base_url = start_server(args.server, args.workers, args.threads, env)
+        target = base_url if args.url else (
+            f"{args.server}, {args.workers} worker(s) x {args.threads} thread(s), stub LLM {args.llm_delay_ms:.0f} ms")
+        print(f"Replaying {source} against {target}; {args.mode} loop, {args.duration:.0f} s per level")
+
+        def send_one(entry):
+            return send(base_url, entry, uploads)
+
+        if args.mode == "open":
+            levels = [float(r) for r in args.rates.split(",")] if args.rates else [None]
+        else:
+            levels = [int(c) for c in args.concurrency.split(",")]
+        label = "rate/s" if args.mode == "open" else "clients"
+        rows = []
+        print(f"{label:>8s} {'requests':>9s} {'req/s':>7s} {'p50 ms':>8s} {'p90 ms':>8s} {'p99 ms':>8s} {'errors':>7s}")
+        try:
+            for level in levels:
+                if args.mode == "open":
+                    results, elapsed = open_loop(send_one, entries, level, args.duration, args.speed)
+                else:
+                    results, elapsed = closed_loop(send_one, entries, level, args.duration, args.think_ms / 1000)
+                row = dict(summarize(results, elapsed), level="recorded" if level is None else level)
+                rows.append(row)
+                print(f"{str(row['level']):>8s} {row['requests']:9d} {row['throughput']:7.2f} {row['p50_ms']:8.0f} "
+                      f"{row['p90_ms']:8.0f} {row['p99_ms']:8.0f} {row['error_rate'] * 100:6.1f}%")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.slo_ms:
+        meeting = [row for row in rows if row["p99_ms"] <= args.slo_ms and not row["error_rate"]]
+        if meeting:
+            best = max(meeting, key=lambda row: row["throughput"])
+            print(f"Highest throughput with p99 <= {args.slo_ms:.0f} ms: {best['throughput']:.2f} req/s "
+                  f"at {label} {best['level']}")
+        else:
+            print(f"No load level met p99 <= {args.slo_ms:.0f} ms without errors")
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["level", "requests", "throughput", "p50_ms", "p90_ms", "p99_ms",
+                                                   "error_rate"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_SCRIPT = """
+import sys
+from werkzeug.serving import make_server
+from app import app
+server = make_server("127.0.0.1", int(sys.argv[1]), app, threaded=True)
+print("ready", flush=True)
+server.serve_forever()
+"""
+
+
+def build_pdf(path, pages=5, padding_kb=0, text="Python developer with Flask and AWS experience"):
+    """
+    Write a minimal valid PDF with one line of text per page. `padding_kb` adds a
+    comment block to every page's content stream to mimic large scanned documents.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    padding = (b"% " + b"x" * 97 + b"\n") * (padding_kb * 1024 // 100)
+    for number in range(pages):
+        content = padding + f"BT /F1 12 Tf 72 720 Td ({text} page {number + 1}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return path
+
+
+def post_files(port, resume_path, jd_path):
+    """POST both files as multipart/form-data, streaming them from disk; returns (status, seconds)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, path in (("resume", resume_path), ("job_description", jd_path)):
+        head = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: application/pdf\r\n\r\n"
+        ).encode()
+        parts.append((head, path))
+    tail = f"--{boundary}--\r\n".encode()
+    length = sum(len(head) + os.path.getsize(path) + 2 for head, path in parts) + len(tail)
+
+    def body():
+        for head, path in parts:
+            yield head
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(64 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield b"\r\n"
+        yield tail
+
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    connection.request("POST", "/analyze", body=body(), headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(length),
+    })
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status, time.perf_counter() - started
+
+
+def peak_rss_kb(pid):
+    """Peak resident set size of a process (Linux /proc VmHWM)"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_config(spool_kb, resume_path, jd_path, concurrency, requests_count, max_upload_mb):
+    port = free_port()
+    env = dict(os.environ, LLM_BACKEND="stub", UPLOAD_SPOOL_KB=str(spool_kb),
+               MAX_UPLOAD_MB=str(max_upload_mb), DEDUP_INDEX_PATH=":memory:")
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SCRIPT, str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.PIPE
+    )
+    try:
+        server.stdout.readline()
+        idle_kb = peak_rss_kb(server.pid)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda _: post_files(port, resume_path, jd_path), range(requests_count)))
+        peak_kb = peak_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    statuses = sorted({status for status, _ in results})
+    slowest = max(seconds for _, seconds in results)
+    return idle_kb, peak_kb, statuses, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak server RSS under concurrent large uploads")
+    parser.add_argument("--size-mb", type=int, default=8, help="size of each uploaded PDF")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        resume_path = build_pdf(os.path.join(directory, "resume.pdf"), pages=5, padding_kb=args.size_mb * 1024 // 5)
+        jd_path = build_pdf(os.path.join(directory, "jd.pdf"), pages=2, text="Looking for a Python developer")
+        print(f"Resume upload: {os.path.getsize(resume_path) / 1e6:.1f} MB, "
+              f"{args.concurrency} concurrent clients, {args.requests} requests")
+
+        configs = [
+            ("all uploads in RAM", args.size_mb * 2 * 1024),
+            ("spool to disk past 1 MB", 1024),
+            ("spool to disk past 256 KB", 256),
+        ]
+        for label, spool_kb in configs:
+            idle_kb, peak_kb, statuses, slowest = run_config(
+                spool_kb, resume_path, jd_path, args.concurrency, args.requests, args.size_mb + 1
+            )
+            print(f"{label:28s} idle {idle_kb / 1024:7.1f} MB  peak {peak_kb / 1024:7.1f} MB  "
+                  f"statuses {statuses}  slowest {slowest:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import random
+
+from resume_dedup import content_hash
+from text_normalizer import normalize_text
+
+
+def document_id(text=None, source=None):
+    """
+    Stable document hash used as the vector namespace and ID prefix: the hash of the
+    source (e.g. a file path or candidate ID) when there is one, otherwise of the content.
+    """
+    if source is not None:
+        return hashlib.sha256(str(source).encode("utf-8")).hexdigest()[:32]
+    return content_hash(normalize_text(text or ""))[:32]
+
+
+def vector_id(doc_id, chunk_index):
+    """Deterministic ID of one chunk, e.g. '3f2a...#0007'; IDs sort in chunk order"""
+    return f"{doc_id}#{chunk_index:04d}"
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+def _vectors(response):
+    """The id -> vector mapping of a fetch response (Pinecone object or plain dict)"""
+    vectors = getattr(response, "vectors", None)
+    if vectors is None and isinstance(response, dict):
+        vectors = response.get("vectors")
+    return vectors or {}
+
+
+def _metadata(vector):
+    if isinstance(vector, dict):
+        return vector.get("metadata") or {}
+    return getattr(vector, "metadata", None) or {}
+
+
+def list_ids(index, namespace, prefix=None):
+    """All vector IDs in a namespace; index.list pages through serverless indexes"""
+    ids = []
+    for page in index.list(prefix=prefix, namespace=namespace):
+        ids.extend(page)
+    return ids
+
+
+def sync_document(index, chunks, embed, doc_id, metadata=None, text_key="text", batch_size=100):
+    """
+    Make the `doc_id` namespace hold exactly `chunks`, writing only what changed.
+
+    Existing vectors are fetched by their deterministic IDs and compared by the
+    chunk_hash stored in their metadata; only new or changed chunks are embedded and
+    upserted, and IDs past the new chunk count are deleted. Re-ingesting an unchanged
+    document embeds nothing and writes nothing. Returns a summary dict.
+    """
+    ids = [vector_id(doc_id, i) for i in range(len(chunks))]
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+
+    stored = {}
+    for start in range(0, len(ids), batch_size):
+        for vid, vector in _vectors(index.fetch(ids=ids[start:start + batch_size], namespace=doc_id)).items():
+            stored[vid] = _metadata(vector).get("chunk_hash")
+    changed = [i for i, (vid, h) in enumerate(zip(ids, hashes)) if stored.get(vid) != h]
+
+    wanted = set(ids)
+    stale = [vid for vid in list_ids(index, doc_id, prefix=f"{doc_id}#") if vid not in wanted]
+
+    if changed:
+        embeddings = embed([chunks[i] for i in changed])
+        vectors = [
+            {
+                "id": ids[i],
+                "values": embedding,
+                "metadata": dict(metadata or {}, **{text_key: chunks[i], "chunk_hash": hashes[i], "chunk_index": i,
+                                                   "doc_id": doc_id}),
+            }
+            for i, embedding in zip(changed, embeddings)
+        ]
+        for start in range(0, len(vectors), batch_size):
+            index.upsert(vectors=vectors[start:start + batch_size], namespace=doc_id)
+    for start in range(0, len(stale), batch_size):
+        index.delete(ids=stale[start:start + batch_size], namespace=doc_id)
+
+    return {"doc_id": doc_id, "chunks": len(chunks), "upserted": len(changed), "deleted": len(stale),
+            "unchanged": len(chunks) - len(changed)}
+
+
+def delete_document(index, doc_id):
+    """Drop a document: one namespace-wide delete, independent of index size"""
+    index.delete(delete_all=True, namespace=doc_id)
+
+
+class FetchResponse:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+
+class FakeIndex:
+    """
+    In-memory stand-in for a Pinecone index (upsert, fetch, list, delete, query and
+    describe_index_stats) that counts writes, for checking ingestion without a network.
+    """
+
+    def __init__(self):
+        self.namespaces = {}
+        self.upserted = 0
+        self.deleted = 0
+        self.upsert_calls = 0
+
+    @property
+    def writes(self):
+        return self.upserted + self.deleted
+
+    def upsert(self, vectors, namespace=""):
+        self.upsert_calls += 1
+        space = self.namespaces.setdefault(namespace, {})
+        for vector in vectors:
+            space[vector["id"]] = {"id": vector["id"], "values": list(vector["values"]),
+                                   "metadata": dict(vector.get("metadata") or {})}
+            self.upserted += 1
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids, namespace=""):
+        space = self.namespaces.get(namespace, {})
+        return FetchResponse({vid: space[vid] for vid in ids if vid in space})
+
+    def list(self, prefix=None, namespace="", limit=100):
+        ids = sorted(vid for vid in self.namespaces.get(namespace, {}) if not prefix or vid.startswith(prefix))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def delete(self, ids=None, delete_all=False, namespace=""):
+        space = self.namespaces.get(namespace, {})
+        if delete_all:
+            self.deleted += len(space)
+            self.namespaces.pop(namespace, None)
+            return {}
+        for vid in ids or []:
+            if space.pop(vid, None) is not None:
+                self.deleted += 1
+        return {}
+
+    def query(self, vector, top_k=10, namespace="", include_metadata=True, **kwargs):
+        def score(values):
+            return sum(a * b for a, b in zip(vector, values))
+        space = self.namespaces.get(namespace, {})
+        matches = sorted(space.values(), key=lambda v: -score(v["values"]))[:top_k]
+        return {"matches": [{"id": v["id"], "score": score(v["values"]),
+                             "metadata": v["metadata"] if include_metadata else None} for v in matches]}
+
+    def describe_index_stats(self):
+        return {"namespaces": {name: {"vector_count": len(space)} for name, space in self.namespaces.items()},
+                "total_vector_count": sum(len(space) for space in self.namespaces.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show incremental re-indexing against an in-memory fake index")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=12)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    embed_calls = []
+
+    def embed(texts):
+        embed_calls.append(len(texts))
+        return [[rng.random() for _ in range(8)] for _ in texts]
+
+    documents = {
+        f"resume-{d}.pdf": [f"Resume {d}, section {c}: Python, SQL and AWS experience." for c in range(args.chunks)]
+        for d in range(args.documents)
+    }
+    index = FakeIndex()
+
+    def ingest(label):
+        writes, embedded = index.writes, sum(embed_calls)
+        for source, chunks in documents.items():
+            sync_document(index, chunks, embed, document_id(source=source), metadata={"source": source})
+        print(f"{label:38s} {index.writes - writes:5d} writes  {sum(embed_calls) - embedded:5d} chunks embedded  "
+              f"{index.describe_index_stats()['total_vector_count']:5d} vectors stored")
+
+    ingest("First ingest")
+    ingest("Re-ingest, nothing changed")
+    documents["resume-0.pdf"][3] = "Resume 0, section 3: now also Kubernetes."
+    ingest("Re-ingest, one chunk edited")
+    documents["resume-1.pdf"] = documents["resume-1.pdf"][:5]
+    ingest("Re-ingest, one document shortened")
+    deleted = index.deleted
+    delete_document(index, document_id(source="resume-2.pdf"))
+    print(f"{'Delete one document (namespace)':38s} {index.deleted - deleted:5d} writes")
+
+
+if __name__ == "__main__":
+    main()